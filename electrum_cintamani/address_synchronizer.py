@@ -22,6 +22,7 @@
 # SOFTWARE.
 
 import asyncio
+import bisect
 import threading
 import asyncio
 import itertools
@@ -34,7 +35,6 @@ from . import bitcoin, util
 from .bitcoin import COINBASE_MATURITY
 from .cintamani_ps import PSManager
 from .cintamani_ps_util import PSCoinRounds, PS_MIXING_TX_TYPES
-from .cintamani_tx import tx_header_to_tx_type
 from .util import profiler, bfh, TxMinedInfo, UnrelatedTransactionException, with_lock
 from .protx import ProTxManager
 from .transaction import Transaction, TxOutput, TxInput, PartialTxInput, TxOutpoint, PartialTransaction
@@ -66,6 +66,16 @@ class HistoryItem(NamedTuple):
     group_data: Optional[list]
 
 
+class AddrTxo(NamedTuple):
+    prevout_str: str
+    value: int
+    is_coinbase: bool
+    height: int
+    islock: Optional[int]
+    spent_height: Optional[int]
+    spent_islock: Optional[int]
+
+
 class TxWalletDelta(NamedTuple):
     is_relevant: bool  # "related to wallet?"
     is_any_input_ismine: bool
@@ -106,6 +116,18 @@ class AddressSynchronizer(Logger):
         self._tx_deltas_cache = defaultdict(int)        # txid -> delta
         self._tx_deltas_related_txs = defaultdict(set)  # addr -> set(txids)
         self._get_addr_balance_cache = {}
+        self._get_balance_cache = {}  # (include_ps, min_rounds) -> balance
+        # the outputs in db.txo, kept in step with db.txi/db.txo:
+        # address -> prevout_str -> (value, is_coinbase), if unspent
+        self._utxos = {}  # type: Dict[str, Dict[str, Tuple[int, bool]]]
+        # address -> prevout_str -> (value, is_coinbase, spending txid)
+        self._spent_txos = {}  # type: Dict[str, Dict[str, Tuple[int, bool, str]]]
+        # history sort keys of txs in _tx_deltas_cache, see _get_sorted_history
+        self._history_index = None  # type: Optional[List[tuple]]
+        self._history_keys = {}  # txid -> sort key
+        self._history_fees = {}  # txid -> fee
+        self._history_changed_txids = set()
+        self._history_changed_lock = threading.Lock()
 
         self.load_and_cleanup()
 
@@ -117,6 +139,7 @@ class AddressSynchronizer(Logger):
 
     def load_and_cleanup(self):
         self.load_local_history()
+        self.populate_utxo_index()
         self.check_history()
         self.load_unverified_transactions()
         self.remove_local_transactions_we_dont_have()
@@ -207,7 +230,7 @@ class AddressSynchronizer(Logger):
             util.register_callback(self.on_cintamani_islock, ['cintamani-islock'])
 
     def on_blockchain_updated(self, event, *args):
-        self._get_addr_balance_cache = {}  # invalidate cache
+        self.invalidate_balance_cache()
         self.db.process_and_clear_islocks(self.get_local_height())
 
     def on_cintamani_islock(self, event, txid):
@@ -220,7 +243,8 @@ class AddressSynchronizer(Logger):
             cintamani_net = self.network.cintamani_net
             if cintamani_net.verify_on_recent_islocks(txid):
                 self.db.add_islock(txid)
-                self._get_addr_balance_cache = {}  # invalidate cache
+                self.invalidate_balance_cache()
+                self.mark_history_changed(txid)
                 self.save_db()
                 util.trigger_callback('verified-islock', self, txid)
 
@@ -233,7 +257,8 @@ class AddressSynchronizer(Logger):
             cintamani_net = self.network.cintamani_net
             if cintamani_net.verify_on_recent_islocks(txid):
                 self.db.add_islock(txid)
-                self._get_addr_balance_cache = {}  # invalidate cache
+                self.invalidate_balance_cache()
+                self.mark_history_changed(txid)
                 self.save_db()
                 util.trigger_callback('verified-islock', self, txid)
 
@@ -359,7 +384,8 @@ class AddressSynchronizer(Logger):
                         pass
                     else:
                         self.db.add_txi_addr(tx_hash, addr, ser, v)
-                        self._get_addr_balance_cache.pop(addr, None)  # invalidate cache
+                        self._spend_in_utxo_index(addr, ser, tx_hash)
+                        self.invalidate_balance_cache(addr)
             for txi in tx.inputs():
                 if txi.is_coinbase_input():
                     continue
@@ -377,11 +403,13 @@ class AddressSynchronizer(Logger):
                 addr = txo.address
                 if addr and self.is_mine(addr):
                     self.db.add_txo_addr(tx_hash, addr, n, v, is_coinbase)
-                    self._get_addr_balance_cache.pop(addr, None)  # invalidate cache
+                    self._add_to_utxo_index(addr, ser, v, is_coinbase)
+                    self.invalidate_balance_cache(addr)
                     # give v to txi that spends me
                     next_tx = self.db.get_spent_outpoint(tx_hash, n)
                     if next_tx is not None:
                         self.db.add_txi_addr(next_tx, addr, ser, v)
+                        self._spend_in_utxo_index(addr, ser, next_tx)
                         self._add_tx_to_local_history(next_tx)
             # add to local history
             self._add_tx_to_local_history(tx_hash)
@@ -436,7 +464,8 @@ class AddressSynchronizer(Logger):
             remove_from_spent_outpoints()
             self._remove_tx_from_local_history(tx_hash)
             for addr in itertools.chain(self.db.get_txi_addresses(tx_hash), self.db.get_txo_addresses(tx_hash)):
-                self._get_addr_balance_cache.pop(addr, None)  # invalidate cache
+                self.invalidate_balance_cache(addr)
+            self._remove_from_utxo_index(tx_hash)
             self.db.remove_txi(tx_hash)
             self.db.remove_txo(tx_hash)
             self.db.remove_tx_fee(tx_hash)
@@ -467,16 +496,23 @@ class AddressSynchronizer(Logger):
         self.find_islock_pair(tx_hash)
 
     def receive_history_callback(self, addr: str, hist, tx_fees: Dict[str, int]):
+        hist_set = set(hist)
         old_hist_hashes = set()
+        related_txs = set()  # txs already having txi/txo of addr
+        unchanged_hist = set()
         with self.lock:
             old_hist = self.get_address_history(addr)
             for tx_hash, height, islock in old_hist:
+                related_txs.add(tx_hash)
                 if height > TX_HEIGHT_LOCAL:
                     old_hist_hashes.add(tx_hash)
-                if (tx_hash, height) not in hist:
+                if (tx_hash, height) in hist_set:
+                    unchanged_hist.add((tx_hash, height))
+                else:
                     # make tx local
                     self.unverified_tx.pop(tx_hash, None)
                     self.db.remove_verified_tx(tx_hash)
+                    self.mark_history_changed(tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
             self.db.set_addr_history(addr, hist)
@@ -485,8 +521,12 @@ class AddressSynchronizer(Logger):
         for tx_hash, tx_height in hist:
             if tx_hash not in old_hist_hashes and self.is_local_tx(tx_hash):
                 local_tx_hist_hashes.append(tx_hash)
+            if (tx_hash, tx_height) in unchanged_hist:
+                continue
             # add it in case it was previously unconfirmed
             self.add_unverified_tx(tx_hash, tx_height)
+            if tx_hash in related_txs:
+                continue
             # if addr is new, we have to recompute txi and txo
             tx = self.db.get_transaction(tx_hash)
             if tx is None:
@@ -496,6 +536,7 @@ class AddressSynchronizer(Logger):
         # Store fees
         for tx_hash, fee_sat in tx_fees.items():
             self.db.add_tx_fee_from_server(tx_hash, fee_sat)
+            self.mark_history_changed(tx_hash)
         # unsubscribe from spent ps coins addresses
         if self.psman.enabled:
             self.psman.unsubscribe_spent_addr(addr, hist)
@@ -536,6 +577,7 @@ class AddressSynchronizer(Logger):
 
     @profiler
     def populate_tx_deltas_cache(self):
+        self.mark_history_changed()
         for addr in self.get_addresses() + self.psman.get_addresses():
             h = self.get_address_history(addr)
             for tx_hash, height, islock in h:
@@ -544,6 +586,7 @@ class AddressSynchronizer(Logger):
 
     def update_tx_deltas_cache_on_tx(self, txid, tx, *, is_added):
         self._tx_deltas_cache.pop(txid, None)
+        self.mark_history_changed(txid)
         if not is_added:
             return
         mine_addrs = set()
@@ -573,6 +616,50 @@ class AddressSynchronizer(Logger):
         for rtxid in related:
             self.update_tx_deltas_cache_on_tx(rtxid, None, is_added=True)
 
+    @profiler
+    def populate_utxo_index(self):
+        for addr, txids in self._history_local.items():
+            spent = {}  # prevout_str -> spending txid
+            for tx_hash in txids:
+                for ser, v in self.db.get_txi_addr(tx_hash, addr):
+                    spent[ser] = tx_hash
+            for tx_hash in txids:
+                for n, (v, is_cb) in self.db.get_txo_addr(tx_hash, addr).items():
+                    ser = f'{tx_hash}:{n}'
+                    if ser in spent:
+                        self._spent_txos.setdefault(addr, {})[ser] = (v, is_cb, spent[ser])
+                    else:
+                        self._utxos.setdefault(addr, {})[ser] = (v, is_cb)
+
+    def _add_to_utxo_index(self, addr, ser, value, is_coinbase):
+        if ser not in self._spent_txos.get(addr, {}):
+            self._utxos.setdefault(addr, {})[ser] = (value, is_coinbase)
+
+    def _spend_in_utxo_index(self, addr, ser, spending_txid):
+        txo = self._utxos.get(addr, {}).pop(ser, None)
+        if txo is None:
+            txo = self._spent_txos.get(addr, {}).get(ser)
+            if txo is None:
+                return
+        value, is_coinbase = txo[:2]
+        self._spent_txos.setdefault(addr, {})[ser] = (value, is_coinbase, spending_txid)
+
+    def _remove_from_utxo_index(self, tx_hash):
+        # undo what the txi and txo entries of tx_hash added
+        with self.transaction_lock:
+            for addr in self.db.get_txi_addresses(tx_hash):
+                spent = self._spent_txos.get(addr, {})
+                for ser, v in self.db.get_txi_addr(tx_hash, addr):
+                    txo = spent.get(ser)
+                    if txo is not None and txo[2] == tx_hash:
+                        del spent[ser]
+                        self._utxos.setdefault(addr, {})[ser] = txo[:2]
+            for addr in self.db.get_txo_addresses(tx_hash):
+                for n in self.db.get_txo_addr(tx_hash, addr):
+                    ser = f'{tx_hash}:{n}'
+                    self._utxos.get(addr, {}).pop(ser, None)
+                    self._spent_txos.get(addr, {}).pop(ser, None)
+
     def is_addr_with_coins(self, addr, local_height):
         addr_outputs = self.get_addr_outputs(addr)
         for k, v in list(addr_outputs.items()):
@@ -614,10 +701,13 @@ class AddressSynchronizer(Logger):
             with self.transaction_lock:
                 self.db.clear_history()
                 self._history_local.clear()
-                self._get_addr_balance_cache = {}  # invalidate cache
+                self.invalidate_balance_cache()
                 self._tx_deltas_cache = defaultdict(int)
                 self._tx_deltas_related_txs = defaultdict(set)
                 self._addrs_with_coins_cache = set()
+                self._utxos = {}
+                self._spent_txos = {}
+                self.mark_history_changed()
 
     def get_txpos(self, tx_hash, islock):
         """Returns (height, txpos) tuple, even if the tx is unverified."""
@@ -652,36 +742,32 @@ class AddressSynchronizer(Logger):
     @with_transaction_lock
     @with_local_height_cached
     @profiler
-    def get_history(self, *, domain=None, config=None, group_ps=False) -> Sequence[HistoryItem]:
+    def get_history(self, *, domain=None, config=None, group_ps=False,
+                    offset=0, limit=None) -> Sequence[HistoryItem]:
+        """Return wallet history, oldest first.
+
+        offset and limit select a page of history counted from the newest
+        tx, eg. offset=0, limit=20 returns the 20 most recent items.
+        With group_ps groups are made from items of the page only.
+        """
         # get domain
         if domain is None:
             domain = self.get_addresses()
             domain += self.psman.get_addresses()
         domain = set(domain)
-        # 1. Get the history of each address in the domain, maintain the
-        #    delta of a tx as the sum of its deltas on domain addresses
-        if not self._tx_deltas_cache:
-            self.populate_tx_deltas_cache()
+        # 1. get sorted history, select page
+        history = self._get_sorted_history()
+        hist_len = len(history)
+        stop = max(hist_len - offset, 0)
+        start = 0 if limit is None else max(stop - limit, 0)
+        is_full_history = start == 0 and stop == hist_len
         tx_deltas = self._tx_deltas_cache
-        # 2. create sorted history
-        history = []
-        for tx_hash in tx_deltas:
-            delta = tx_deltas[tx_hash]
-            tx_mined_status = self.get_tx_height(tx_hash)
-            islock = self.db.get_islock(tx_hash)
-            if islock:
-                islock_sort = tx_hash if not tx_mined_status.conf else ''
-            else:
-                islock_sort = ''
-            fee = self.get_tx_fee(tx_hash)
-            history.append((tx_hash, tx_mined_status, delta, fee,
-                            islock, islock_sort))
-        # tx_hash = x[0], islock = x[4],  islock_sort = x[5]
-        history.sort(key=lambda x: (self.get_txpos(x[0], x[4]), x[5]),
-                     reverse=True)
-        # 3. add balance
+        # 2. add balance, deltas of newer txs are subtracted on the page
         c, u, x = self.get_balance(domain)
         balance = c + u + x
+        for tx_hash in history[stop:]:
+            balance -= tx_deltas[tx_hash]
+        history = history[start:stop]
         h2 = []
         if config:
             def_dip2 = not self.psman.unsupported
@@ -695,14 +781,14 @@ class AddressSynchronizer(Logger):
         group_delta = None
         group_balance = None
         hist_len = len(history)
-        for i, (tx_hash, tx_mined_status, delta, fee,
-                islock, islock_sort) in enumerate(history):
+        for i, tx_hash in enumerate(reversed(history)):
+            tx_mined_status = self.get_tx_height(tx_hash)
+            delta = tx_deltas[tx_hash]
+            fee = self._history_fees[tx_hash]
+            islock = self.db.get_islock(tx_hash)
             tx_type = 0
             if show_dip2:
-                tx = self.db.get_transaction(tx_hash)
-                if tx:
-                    raw_bytes = bfh(tx.serialize())
-                    tx_type = tx_header_to_tx_type(raw_bytes[:4])
+                tx_type = self.db.get_tx_type(tx_hash)
             if (group_ps or show_dip2) and not tx_type:  # prefer ProTx type
                 tx_type, completed = self.db.get_ps_tx(tx_hash)
 
@@ -762,11 +848,66 @@ class AddressSynchronizer(Logger):
             balance -= delta
         h2.reverse()
 
-        if balance != 0:
+        if is_full_history and balance != 0:
             raise Exception("wallet.get_history() failed balance sanity-check")
 
         return h2
 
+    def mark_history_changed(self, txid=None):
+        """Mark txid to be re-sorted in history, or all txs if None"""
+        with self._history_changed_lock:
+            if txid is None:
+                self._history_index = None
+            else:
+                self._history_changed_txids.add(txid)
+
+    def _get_history_sort_key(self, tx_hash):
+        islock = self.db.get_islock(tx_hash)
+        if islock and not self.get_tx_height(tx_hash).conf:
+            islock_sort = tx_hash
+        else:
+            islock_sort = ''
+        return self.get_txpos(tx_hash, islock), islock_sort, tx_hash
+
+    def _get_sorted_history(self) -> List[str]:
+        """Return txids of wallet history, oldest first.
+
+        The sort keys are kept in _history_index and updated only
+        for txs marked with mark_history_changed.
+        """
+        if not self._tx_deltas_cache:
+            self.populate_tx_deltas_cache()
+        tx_deltas = self._tx_deltas_cache
+        with self._history_changed_lock:
+            index = self._history_index
+            changed = self._history_changed_txids
+            self._history_index = []
+            self._history_changed_txids = set()
+        if index is None:
+            self._history_keys = keys = {}
+            self._history_fees = fees = {}
+            for tx_hash in tx_deltas:
+                keys[tx_hash] = self._get_history_sort_key(tx_hash)
+                fees[tx_hash] = self.get_tx_fee(tx_hash)
+            index = sorted(keys.values())
+        else:
+            keys = self._history_keys
+            fees = self._history_fees
+            for tx_hash in changed:
+                key = keys.pop(tx_hash, None)
+                if key is not None:
+                    del index[bisect.bisect_left(index, key)]
+                    fees.pop(tx_hash, None)
+                if tx_hash not in tx_deltas:
+                    continue
+                key = keys[tx_hash] = self._get_history_sort_key(tx_hash)
+                bisect.insort(index, key)
+                fees[tx_hash] = self.get_tx_fee(tx_hash)
+        with self._history_changed_lock:
+            if self._history_index is not None:
+                self._history_index = index
+        return [key[-1] for key in index]
+
     def _add_tx_to_local_history(self, txid):
         with self.transaction_lock:
             for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)):
@@ -806,24 +947,30 @@ class AddressSynchronizer(Logger):
             if tx_height in (TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_UNCONF_PARENT):
                 with self.lock:
                     self.db.remove_verified_tx(tx_hash)
+                self.mark_history_changed(tx_hash)
                 if self.verifier:
                     self.verifier.remove_spv_proof_for_tx(tx_hash)
         else:
             with self.lock:
                 # tx will be verified only if height > 0
                 self.unverified_tx[tx_hash] = tx_height
+            self.mark_history_changed(tx_hash)
+            if self.verifier:
+                self.verifier.add_unverified_tx(tx_hash, tx_height)
 
     def remove_unverified_tx(self, tx_hash, tx_height):
         with self.lock:
             new_height = self.unverified_tx.get(tx_hash)
             if new_height == tx_height:
                 self.unverified_tx.pop(tx_hash, None)
+                self.mark_history_changed(tx_hash)
 
     def add_verified_tx(self, tx_hash: str, info: TxMinedInfo):
         # Remove from the unverified map and add to the verified map
         with self.lock:
             self.unverified_tx.pop(tx_hash, None)
             self.db.add_verified_tx(tx_hash, info)
+        self.mark_history_changed(tx_hash)
         tx_mined_status = self.get_tx_height(tx_hash)
         util.trigger_callback('verified', self, tx_hash, tx_mined_status)
 
@@ -853,6 +1000,7 @@ class AddressSynchronizer(Logger):
                         # into unverified_tx with the old height, and if we get
                         # a status update, that will overwrite it.
                         self.unverified_tx[tx_hash] = tx_height
+                        self.mark_history_changed(tx_hash)
                         txs.add(tx_hash)
         return txs
 
@@ -1002,43 +1150,70 @@ class AddressSynchronizer(Logger):
         return received, sent
 
 
+    def _get_addr_txos(self, address: str, *, include_spent: bool) -> List['AddrTxo']:
+        """Returns the outputs of address from the utxo index,
+        the spent ones only with include_spent.
+        """
+        heights = {}  # txid -> (height, islock)
+        def get_height_and_islock(txid):
+            r = heights.get(txid)
+            if r is None:
+                r = heights[txid] = (self.get_tx_height(txid).height, self.db.get_islock(txid))
+            return r
+        txos = []
+        with self.lock, self.transaction_lock:
+            for ser, (v, is_cb) in self._utxos.get(address, {}).items():
+                height, islock = get_height_and_islock(ser[:64])
+                txos.append(AddrTxo(ser, v, is_cb, height, islock, None, None))
+            if include_spent:
+                for ser, (v, is_cb, spending_txid) in self._spent_txos.get(address, {}).items():
+                    height, islock = get_height_and_islock(ser[:64])
+                    spent_height, spent_islock = get_height_and_islock(spending_txid)
+                    txos.append(AddrTxo(ser, v, is_cb, height, islock, spent_height, spent_islock))
+        return txos
+
+    def _get_ps_origin_addrs(self) -> Set[str]:
+        if self.psman.enabled:
+            return set(self.db.get_ps_origin_addrs())
+        return set()
+
+    def _get_ps_rounds(self, address: str, prevout_str: str, ps_origin_addrs: Set[str]) -> Optional[int]:
+        ps_rounds = None
+        ps_denom = self.db.get_ps_denom(prevout_str)
+        if ps_denom:
+            ps_rounds = ps_denom[2]
+        if ps_rounds is None:
+            ps_collateral = self.db.get_ps_collateral(prevout_str)
+            if ps_collateral:
+                ps_rounds = int(PSCoinRounds.COLLATERAL)
+        if (self.psman.group_origin_coins_by_addr
+                and ps_rounds is None
+                and address in ps_origin_addrs):
+            ps_rounds = int(PSCoinRounds.MIX_ORIGIN)
+        if ps_rounds is None:
+            ps_other = self.db.get_ps_other(prevout_str)
+            if ps_other:
+                ps_rounds = int(PSCoinRounds.OTHER)
+        return ps_rounds
+
+    def _txo_to_utxo(self, address: str, txo: 'AddrTxo', ps_rounds: Optional[int]) -> PartialTxInput:
+        prevout = TxOutpoint.from_str(txo.prevout_str)
+        utxo = PartialTxInput(prevout=prevout, is_coinbase_output=txo.is_coinbase)
+        utxo._trusted_address = address
+        utxo._trusted_value_sats = txo.value
+        utxo.block_height = txo.height
+        utxo.spent_height, utxo.spent_islock = txo.spent_height, txo.spent_islock
+        utxo.islock = txo.islock
+        utxo.ps_rounds = ps_rounds
+        return utxo
+
     def get_addr_outputs(self, address: str) -> Dict[TxOutpoint, PartialTxInput]:
-        coins, spent = self.get_addr_io(address)
         out = {}
-        psman = self.psman
-        if psman.enabled:
-            ps_origin_addrs = self.db.get_ps_origin_addrs()
-        else:
-            ps_origin_addrs = []
-        for prevout_str, v in coins.items():
-            ps_rounds = None
-            ps_denom = self.db.get_ps_denom(prevout_str)
-            if ps_denom:
-                ps_rounds = ps_denom[2]
-            if ps_rounds is None:
-                ps_collateral = self.db.get_ps_collateral(prevout_str)
-                if ps_collateral:
-                    ps_rounds = int(PSCoinRounds.COLLATERAL)
-            if (psman.group_origin_coins_by_addr
-                    and ps_rounds is None
-                    and ps_origin_addrs
-                    and address in ps_origin_addrs):
-                ps_rounds = int(PSCoinRounds.MIX_ORIGIN)
-            if ps_rounds is None:
-                ps_other = self.db.get_ps_other(prevout_str)
-                if ps_other:
-                    ps_rounds = int(PSCoinRounds.OTHER)
-            tx_height, value, is_cb, islock = v
-            prevout = TxOutpoint.from_str(prevout_str)
-            utxo = PartialTxInput(prevout=prevout, is_coinbase_output=is_cb)
-            utxo._trusted_address = address
-            utxo._trusted_value_sats = value
-            utxo.block_height = tx_height
-            utxo.spent_height, utxo.spent_islock = \
-                spent.get(prevout_str, (None, None))
-            utxo.islock = islock
-            utxo.ps_rounds = ps_rounds
-            out[prevout] = utxo
+        ps_origin_addrs = self._get_ps_origin_addrs()
+        for txo in self._get_addr_txos(address, include_spent=True):
+            ps_rounds = self._get_ps_rounds(address, txo.prevout_str, ps_origin_addrs)
+            utxo = self._txo_to_utxo(address, txo, ps_rounds)
+            out[utxo.prevout] = utxo
         return out
 
     def get_addr_utxo(self, address: str) -> Dict[TxOutpoint, PartialTxInput]:
@@ -1055,7 +1230,7 @@ class AddressSynchronizer(Logger):
 
     @with_local_height_cached
     def get_addr_balance(self, address, *, excluded_coins: Set[str] = None,
-                         min_rounds=None, ps_denoms=None) -> Tuple[int, int, int]:
+                         min_rounds=None) -> Tuple[int, int, int]:
         """Return the balance of a bitcoin address:
         confirmed and matured, unconfirmed, unmatured
 
@@ -1063,44 +1238,63 @@ class AddressSynchronizer(Logger):
         """
         if min_rounds is not None and min_rounds < 0:
             min_rounds = None
-        if ps_denoms is None:
-            ps_denoms = {}
-        # cache is only used if there are no excluded_coins or min_rounds
-        if not excluded_coins and min_rounds is None:
-            cached_value = self._get_addr_balance_cache.get(address)
-            if cached_value:
-                return cached_value
+        # cache is only used if there are no excluded_coins
+        if not excluded_coins:
+            balance_by_rounds = self._get_addr_balance_cache.get(address)
+            if balance_by_rounds is None:
+                balance_by_rounds = self._calc_addr_balance_by_rounds(address)
+                # Cache needs to be invalidated if a transaction is added to/
+                # removed from history; or on new blocks (maturity...);
+                # or new islock; or ps_denoms of address change
+                self._get_addr_balance_cache[address] = balance_by_rounds
+        else:
+            assert isinstance(excluded_coins, set), f"excluded_coins should be set, not {type(excluded_coins)}"
+            balance_by_rounds = self._calc_addr_balance_by_rounds(address, excluded_coins)
+        c = u = x = 0
+        for rounds, (rc, ru, rx) in balance_by_rounds.items():
+            if min_rounds is not None and (rounds is None or rounds < min_rounds):
+                continue
+            c += rc
+            u += ru
+            x += rx
+        return c, u, x
+
+    def _calc_addr_balance_by_rounds(self, address, excluded_coins: Set[str] = None) -> Dict[Optional[int], Tuple[int, int, int]]:
+        """Return the balance of address split by PS rounds of ps_denoms,
+        with None key for coins which are not ps_denoms
+        """
         if excluded_coins is None:
             excluded_coins = set()
-        assert isinstance(excluded_coins, set), f"excluded_coins should be set, not {type(excluded_coins)}"
-        received, sent = self.get_addr_io(address)
-        c = u = x = 0
+        balance_by_rounds = {}
         mempool_height = self.get_local_height() + 1  # height of next block
-        for txo, (tx_height, v, is_cb, islock) in received.items():
-            if min_rounds is not None and txo not in ps_denoms:
-                continue
-            if txo in excluded_coins:
+        for txo in self._get_addr_txos(address, include_spent=True):
+            if txo.prevout_str in excluded_coins:
                 continue
-            if is_cb and tx_height + COINBASE_MATURITY > mempool_height:
+            ps_denom = self.db.get_ps_denom(txo.prevout_str)
+            rounds = ps_denom[2] if ps_denom else None
+            c, u, x = balance_by_rounds.get(rounds, (0, 0, 0))
+            v = txo.value
+            if txo.is_coinbase and txo.height + COINBASE_MATURITY > mempool_height:
                 x += v
-            elif tx_height > 0 or islock:
+            elif txo.height > 0 or txo.islock:
                 c += v
             else:
                 u += v
-            if txo in sent:
-                sent_height, sent_islock = sent[txo]
-                if sent_height > 0 or sent_islock:
+            if txo.spent_height is not None:
+                if txo.spent_height > 0 or txo.spent_islock:
                     c -= v
                 else:
                     u -= v
-        result = c, u, x
-        # cache result.
-        if not excluded_coins and min_rounds is None:
-            # Cache needs to be invalidated if a transaction is added to/
-            # removed from history; or on new blocks (maturity...);
-            # or new islock
-            self._get_addr_balance_cache[address] = result
-        return result
+            balance_by_rounds[rounds] = c, u, x
+        return balance_by_rounds
+
+    def invalidate_balance_cache(self, addr=None):
+        """Invalidate cached balance of addr, or of all addresses if None"""
+        if addr is None:
+            self._get_addr_balance_cache = {}
+        else:
+            self._get_addr_balance_cache.pop(addr, None)
+        self._get_balance_cache = {}
 
     @with_local_height_cached
     @profiler
@@ -1143,59 +1337,59 @@ class AddressSynchronizer(Logger):
         if excluded_addresses:
             domain = set(domain) - set(excluded_addresses)
         mempool_height = block_height + 1  # height of next block
+        ps_ks_domain = set(ps_ks_domain)
+        ps_origin_addrs = self._get_ps_origin_addrs()
         for addr in domain:
             if addr not in self._addrs_with_coins_cache:
                 continue
-            txos = self.get_addr_outputs(addr)
-            for txo in txos.values():
-                if txo.address in ps_ks_domain:
-                    txo.is_ps_ks = True
-                else:
-                    txo.is_ps_ks = False
-                if min_rounds is not None:
-                    ps_rounds = txo.ps_rounds
-                    if ps_rounds is None or ps_rounds < min_rounds:
-                        continue
-                if txo.spent_height is not None:
-                    if not confirmed_spending_only:
-                        continue
-                    if confirmed_spending_only and 0 < txo.spent_height <= block_height:
-                        continue
-                if confirmed_funding_only and not (0 < txo.block_height <= block_height):
+            # filter on the index entries, and make PartialTxInputs only of the result
+            for txo in self._get_addr_txos(addr, include_spent=confirmed_spending_only):
+                if txo.spent_height is not None and 0 < txo.spent_height <= block_height:
+                    continue
+                if confirmed_funding_only and not (0 < txo.height <= block_height):
                     if not consider_islocks:
                         continue
                     elif not txo.islock:
                         continue
-                if nonlocal_only and txo.block_height in (TX_HEIGHT_LOCAL, ):
+                if nonlocal_only and txo.height in (TX_HEIGHT_LOCAL, ):
                     continue
-                if (mature_only and txo.is_coinbase_output()
-                        and txo.block_height + COINBASE_MATURITY > mempool_height):
+                if (mature_only and txo.is_coinbase
+                        and txo.height + COINBASE_MATURITY > mempool_height):
                     continue
+                ps_rounds = self._get_ps_rounds(addr, txo.prevout_str, ps_origin_addrs)
+                if min_rounds is not None:
+                    if ps_rounds is None or ps_rounds < min_rounds:
+                        continue
+                utxo = self._txo_to_utxo(addr, txo, ps_rounds)
+                utxo.is_ps_ks = addr in ps_ks_domain
                 if prevout_timestamp:
-                    txid = txo.prevout.txid.hex()
-                    tx_mined_status = self.get_tx_height(txid)
+                    tx_mined_status = self.get_tx_height(txo.prevout_str[:64])
                     if tx_mined_status.conf > 0:
-                        txo.prevout_timestamp = tx_mined_status.timestamp
-                coins.append(txo)
-                continue
+                        utxo.prevout_timestamp = tx_mined_status.timestamp
+                coins.append(utxo)
         return coins
 
     def get_balance(self, domain=None, *, excluded_addresses: Set[str] = None,
                     excluded_coins: Set[str] = None,
                     include_ps=True, min_rounds=None) -> Tuple[int, int, int]:
         '''min_rounds parameter consider values < 0 same as None'''
-        ps_denoms = {}
-        if min_rounds is not None:
-            if min_rounds < 0:
-                min_rounds = None
-            else:
-                ps_denoms = self.db.get_ps_denoms(min_rounds=min_rounds)
+        if min_rounds is not None and min_rounds < 0:
+            min_rounds = None
+        # whole wallet balances are cached, except include_ps=False without
+        # min_rounds, as PS addresses depend on all of the PS data
+        cache_key = None
+        if (domain is None and not excluded_addresses and not excluded_coins
+                and (include_ps or min_rounds is not None)):
+            cache_key = (include_ps, min_rounds)
+            cached_value = self._get_balance_cache.get(cache_key)
+            if cached_value is not None:
+                return cached_value
         if domain is None:
             if include_ps:
                 domain = self.get_addresses() + self.psman.get_addresses()
             else:
                 if min_rounds is not None:
-                    domain = [ps_denom[0] for ps_denom in ps_denoms.values()]
+                    domain = self.db.get_ps_addresses(min_rounds=min_rounds)
                 else:
                     ps_addrs = self.db.get_ps_addresses()
                     domain = set(self.get_addresses() +
@@ -1208,12 +1402,14 @@ class AddressSynchronizer(Logger):
         for addr in domain:
             c, u, x = self.get_addr_balance(addr,
                                             excluded_coins=excluded_coins,
-                                            min_rounds=min_rounds,
-                                            ps_denoms=ps_denoms)
+                                            min_rounds=min_rounds)
             cc += c
             uu += u
             xx += x
-        return cc, uu, xx
+        result = cc, uu, xx
+        if cache_key is not None:
+            self._get_balance_cache[cache_key] = result
+        return result
 
     def is_used(self, address: str) -> bool:
         return self.get_address_history_len(address) != 0
@@ -277,6 +277,26 @@ class BIP32Node(NamedTuple):
                          fingerprint=fingerprint,
                          child_number=child_number)
 
+    def derive_child_pubkeys(self, start: int, count: int) -> List[bytes]:
+        """Returns compressed pubkeys of the children start..start+count-1,
+        same as subkey_at_public_derivation((n,)) for each n, but with
+        the parent point parsed only once.
+        """
+        if start < 0: raise ValueError('the bip32 index needs to be non-negative')
+        if (start + count - 1) & BIP32_PRIME:
+            raise Exception('not possible to derive hardened child from parent pubkey')
+        parent_pubkey = self.eckey.get_public_key_bytes(compressed=True)
+        tweaks = []
+        for child_index in range(start, start + count):
+            I = hmac_oneshot(self.chaincode, parent_pubkey + child_index.to_bytes(4, 'big'),
+                             hashlib.sha512)
+            tweaks.append(I[0:32])
+        pubkeys = self.eckey.add_tweaks(tweaks)
+        for i, pubkey in enumerate(pubkeys):
+            if pubkey is None:  # invalid ecpoint, CKD_pub skips the index
+                pubkeys[i] = CKD_pub(parent_pubkey, self.chaincode, start + i)[0]
+        return pubkeys
+
     def calc_fingerprint_of_this_node(self) -> bytes:
         """Returns the fingerprint of this node.
         Note that self.fingerprint is of the *parent*.
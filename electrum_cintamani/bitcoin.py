@@ -216,6 +216,17 @@ def int_to_hex(i: int, length: int=1) -> str:
     s = "0"*(2*length - len(s)) + s
     return rev_hex(s)
 
+def int_to_le_bytes(i: int, length: int) -> bytes:
+    """Converts int to little-endian bytes, see int_to_hex."""
+    range_size = 1 << (8 * length)
+    if i < -(range_size//2) or i >= range_size:
+        raise OverflowError('cannot convert int {} to bytes ({} bytes)'.format(i, length))
+    if i < 0:
+        # two's complement
+        i += range_size
+    return i.to_bytes(length, byteorder='little')
+
+
 def script_num_to_hex(i: int) -> str:
     """See CScriptNum in Bitcoin Core.
     Encodes an integer as hex, to be used in script.
@@ -20,10 +20,14 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import concurrent.futures
+import mmap
+import multiprocessing
 import os
 import threading
 import time
-from typing import Optional, Dict, Mapping, Sequence
+from collections import deque
+from typing import Optional, Dict, Mapping, Sequence, List, Tuple
 
 from . import util
 from .bitcoin import hash_encode, int_to_hex, rev_hex
@@ -43,6 +47,11 @@ MAX_TARGET = 0x00000FFFFF000000000000000000000000000000000000000000000000000000
 POW_TARGET_SPACING = int(2.5 * 60)  # Dash: 2.5 minutes
 POW_DGW3_HEIGHT = 68589
 DGW_PAST_BLOCKS = 24
+# headers appended at the tip are fsynced in batches, see Blockchain.write
+HEADERS_FSYNC_COUNT = 100
+HEADERS_FSYNC_INTERVAL = 300  # seconds
+INDEX_RECORD_SIZE = 64  # block hash + chainwork, see HeadersIndex
+HASH_INDEX_WINDOW = 5 * CHUNK_SIZE  # headers below the tips that are kept in _hash_index
 
 
 class MissingHeader(Exception):
@@ -88,6 +97,69 @@ def hash_raw_header(header: str) -> str:
     return hash_encode(PoWHash(bfh(header)))
 
 
+# The x11_hash extension holds the GIL, so large batches of headers are
+# hashed in worker processes instead of threads.
+POW_HASH_MIN_BATCH = 256  # headers per worker job
+
+_pow_hash_executor = None  # type: Optional[concurrent.futures.ProcessPoolExecutor]
+_pow_hash_executor_disabled = False
+_pow_hash_executor_lock = threading.Lock()
+
+
+def _pow_hash_raw_headers(data: bytes) -> bytes:
+    """Returns the concatenated PoW hashes of the raw headers in data."""
+    return b''.join(PoWHash(data[i:i+HEADER_SIZE])
+                    for i in range(0, len(data) - HEADER_SIZE + 1, HEADER_SIZE))
+
+
+def _get_pow_hash_executor() -> Optional[concurrent.futures.ProcessPoolExecutor]:
+    global _pow_hash_executor, _pow_hash_executor_disabled
+    with _pow_hash_executor_lock:
+        if _pow_hash_executor is None and not _pow_hash_executor_disabled:
+            num_workers = os.cpu_count() or 1
+            if num_workers < 2:
+                _pow_hash_executor_disabled = True
+                return None
+            try:
+                _pow_hash_executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=num_workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            except Exception as e:  # e.g. no working sem_open on Android
+                _logger.info(f'cannot hash headers in parallel: {repr(e)}')
+                _pow_hash_executor_disabled = True
+        return _pow_hash_executor
+
+
+def _disable_pow_hash_executor() -> None:
+    global _pow_hash_executor, _pow_hash_executor_disabled
+    with _pow_hash_executor_lock:
+        if _pow_hash_executor is not None:
+            _pow_hash_executor.shutdown(wait=False)
+        _pow_hash_executor = None
+        _pow_hash_executor_disabled = True
+
+
+def pow_hash_raw_headers(data: bytes) -> List[str]:
+    """Returns the block hashes of the raw headers concatenated in data.
+    Batches that are large enough are spread over all cores.
+    """
+    num = len(data) // HEADER_SIZE
+    hashes = None
+    executor = _get_pow_hash_executor() if num >= 2 * POW_HASH_MIN_BATCH else None
+    if executor:
+        num_jobs = min(executor._max_workers, num // POW_HASH_MIN_BATCH)
+        job_size = -(-num // num_jobs) * HEADER_SIZE
+        jobs = [data[i:i+job_size] for i in range(0, num * HEADER_SIZE, job_size)]
+        try:
+            hashes = b''.join(executor.map(_pow_hash_raw_headers, jobs))
+        except Exception as e:  # e.g. BrokenProcessPool
+            _logger.info(f'parallel header hashing failed, falling back to serial: {repr(e)}')
+            _disable_pow_hash_executor()
+    if hashes is None:
+        hashes = _pow_hash_raw_headers(data)
+    return [hash_encode(hashes[i:i+32]) for i in range(0, len(hashes), 32)]
+
+
 # key: blockhash hex at forkpoint
 # the chain at some key is the best chain that includes the given hash
 blockchains = {}  # type: Dict[str, Blockchain]
@@ -106,6 +178,8 @@ def read_blockchains(config: 'SimpleConfig'):
         header_after_cp = best_chain.read_header(constants.net.max_checkpoint()+1)
         if not header_after_cp or not best_chain.can_connect(header_after_cp, check_height=False):
             _logger.info("[blockchain] deleting best chain. cannot connect header after last cp to last cp.")
+            best_chain.close_headers_file()
+            best_chain.delete_index()
             os.unlink(best_chain.path())
             best_chain.update_size()
     # forks
@@ -118,6 +192,9 @@ def read_blockchains(config: 'SimpleConfig'):
     def delete_chain(filename, reason):
         _logger.info(f"[blockchain] deleting chain {filename}: {reason}")
         os.unlink(os.path.join(fdir, filename))
+        for path in (get_journal_path(config, filename), get_index_path(config, filename)):
+            if os.path.exists(path):
+                os.unlink(path)
 
     def instantiate_chain(filename):
         __, forkpoint, prev_hash, first_hash = filename.split('_')
@@ -143,9 +220,11 @@ def read_blockchains(config: 'SimpleConfig'):
         # consistency checks
         h = b.read_header(b.forkpoint)
         if first_hash != hash_header(h):
+            b.close_headers_file()
             delete_chain(filename, "incorrect first hash for chain")
             return
         if not b.parent.can_connect(h, check_height=False):
+            b.close_headers_file()
             delete_chain(filename, "cannot connect chain to parent")
             return
         chain_id = b.get_id()
@@ -154,6 +233,122 @@ def read_blockchains(config: 'SimpleConfig'):
 
     for filename in l:
         instantiate_chain(filename)
+    reset_hash_index()
+    with blockchains_lock: chains = list(blockchains.values())
+    for b in chains:
+        _load_hash_index(b)
+
+
+def get_journal_path(config: 'SimpleConfig', headers_path: str) -> str:
+    """Journal of unsynced appends to the headers file at headers_path."""
+    return os.path.join(util.get_headers_dir(config), 'headers_journal',
+                        os.path.basename(headers_path))
+
+
+def get_index_path(config: 'SimpleConfig', headers_path: str) -> str:
+    """HeadersIndex of the headers file at headers_path."""
+    return os.path.join(util.get_headers_dir(config), 'headers_index',
+                        os.path.basename(headers_path))
+
+
+def flush_headers() -> None:
+    """fsync all headers that are still pending, e.g. on shutdown."""
+    with blockchains_lock: chains = list(blockchains.values())
+    for b in chains:
+        b.flush_headers()
+
+
+# block hash -> (Blockchain storing that header, height).
+# Complete for heights >= _hash_index_floor: a hash that is not in here is
+# not in any chain at such a height. Below that, only the checkpoints are
+# kept. Entries can be stale after a chain got truncated, so they are
+# checked before use.
+_hash_index = {}  # type: Dict[str, Tuple[Blockchain, int]]
+_hash_index_floor = 0
+_hash_index_pruned_at = 0
+_hash_index_lock = threading.RLock()  # lock order: take this last; and do not call out while holding it
+
+
+def reset_hash_index() -> None:
+    global _hash_index, _hash_index_floor, _hash_index_pruned_at
+    with _hash_index_lock:
+        _hash_index = {}
+        _hash_index_floor = _hash_index_pruned_at = 0
+        for i, (h, t, extra_headers) in enumerate(constants.net.CHECKPOINTS):
+            _hash_index[h] = (None, (i + 1) * CHUNK_SIZE - 1)
+
+
+def _is_checkpoint_height(height: int) -> bool:
+    return height <= constants.net.max_checkpoint() and (height + 1) % CHUNK_SIZE == 0
+
+
+def _add_to_hash_index(chain: 'Blockchain', height: int, header_hashes: Sequence[Optional[str]]) -> None:
+    """Registers the headers stored by chain from height on.
+    None stands for a header whose hash is not known.
+    """
+    global _hash_index, _hash_index_floor, _hash_index_pruned_at
+    with _hash_index_lock:
+        tip = height + len(header_hashes) - 1
+        # headers far below the tip are not kept; neither are the ones
+        # below it that were skipped before
+        floor = max(_hash_index_floor, tip - HASH_INDEX_WINDOW + 1)
+        for i in range(max(0, floor - height), len(header_hashes)):
+            if header_hashes[i] is not None:
+                _hash_index[header_hashes[i]] = (chain, height + i)
+        _hash_index_floor = floor
+        if floor - _hash_index_pruned_at >= HASH_INDEX_WINDOW:
+            _hash_index = {h: (c, height) for h, (c, height) in _hash_index.items()
+                           if height >= floor or _is_checkpoint_height(height)}
+            _hash_index_pruned_at = floor
+
+
+def _load_hash_index(chain: 'Blockchain') -> None:
+    """Registers the headers of chain within the window below its tip."""
+    global _hash_index_floor
+    start = max(chain.forkpoint, chain.height() - HASH_INDEX_WINDOW + 1)
+    if chain.height() < start:
+        return
+    records = chain.read_index_records(start, chain.height() - start + 1)
+    known_from = start
+    header_hashes = []
+    for height, record in zip(range(start, chain.height() + 1), records):
+        if record is None:
+            known_from = height + 1
+            header_hashes = []
+        else:
+            header_hashes.append(hash_encode(record[0]))
+    if known_from > chain.forkpoint:
+        with _hash_index_lock:
+            _hash_index_floor = max(_hash_index_floor, known_from)
+    _add_to_hash_index(chain, known_from, header_hashes)
+
+
+def _hashes_of_index_records(records: bytes) -> List[Optional[str]]:
+    zero = bytes(INDEX_RECORD_SIZE)
+    return [hash_encode(records[i:i+32]) if records[i:i+INDEX_RECORD_SIZE] != zero else None
+            for i in range(0, len(records), INDEX_RECORD_SIZE)]
+
+
+def _lookup_hash_index(height: int, header_hash: str) -> Tuple[bool, Optional['Blockchain']]:
+    """Returns whether _hash_index can tell, and if so, the chain storing
+    header_hash at height, if any.
+    """
+    with _hash_index_lock:
+        chain, indexed_height = _hash_index.get(header_hash, (None, None))
+        complete = height >= _hash_index_floor
+    if indexed_height is not None:
+        if chain is None:  # checkpoint
+            chain = get_best_chain()
+        if chain.check_hash(indexed_height, header_hash):
+            if indexed_height != height:
+                return True, None
+            while height < chain.forkpoint:
+                chain = chain.parent
+            return True, chain
+        with _hash_index_lock:
+            if _hash_index.get(header_hash) == (chain, indexed_height):
+                del _hash_index[header_hash]
+    return complete, None
 
 
 def get_best_chain() -> 'Blockchain':
@@ -171,6 +366,8 @@ def init_headers_file_for_best_chain():
     len_checkpoints = len(constants.net.CHECKPOINTS)
     length = HEADER_SIZE * len_checkpoints * CHUNK_SIZE
     if not os.path.exists(filename) or os.path.getsize(filename) < length:
+        b.close_headers_file()
+        b.delete_index()
         with open(filename, 'wb') as f:
             for i in range(len_checkpoints):
                 for height, header_data in b.checkpoints[i][2]:
@@ -182,6 +379,153 @@ def init_headers_file_for_best_chain():
         b.update_size()
 
 
+class HeadersIndex:
+    """
+    Companion of a headers file: for each header, its block hash and the
+    chainwork up to and including it, so that looking these up needs neither
+    X11 hashing nor walking back the chain. Records that are all zeroes are
+    unknown (e.g. in the checkpoint region); callers fall back to the headers.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._mmap = None  # type: Optional[mmap.mmap]
+        self._remap()
+
+    def _remap(self) -> None:
+        self._unmap()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < INDEX_RECORD_SIZE:
+                return
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _unmap(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def size(self) -> int:
+        return len(self._mmap) // INDEX_RECORD_SIZE if self._mmap is not None else 0
+
+    def read(self, pos: int) -> Optional[Tuple[bytes, int]]:
+        """Returns (block hash, chainwork) of the header at pos, if known.
+        The block hash is in internal byte order.
+        """
+        if not 0 <= pos < self.size():
+            return None
+        record = self._mmap[pos*INDEX_RECORD_SIZE:(pos+1)*INDEX_RECORD_SIZE]
+        if record == bytes(INDEX_RECORD_SIZE):
+            return None
+        return record[:32], int.from_bytes(record[32:], byteorder='big')
+
+    def read_raw(self, pos: int, count: int) -> bytes:
+        """Returns count raw records starting at pos."""
+        data = b''
+        if self._mmap is not None:
+            data = self._mmap[pos*INDEX_RECORD_SIZE:(pos+count)*INDEX_RECORD_SIZE]
+        return data + bytes(count*INDEX_RECORD_SIZE - len(data))
+
+    def write(self, records: bytes, pos: int, truncate: bool=True) -> None:
+        if self._file is None:
+            util.make_dir(os.path.dirname(self.path))
+            open(self.path, 'ab').close()
+            self._file = open(self.path, 'rb+')
+        f = self._file
+        offset = pos * INDEX_RECORD_SIZE
+        if truncate or offset > self.size() * INDEX_RECORD_SIZE:
+            self._unmap()
+            f.truncate(offset)
+        f.seek(offset)
+        f.write(records)
+        f.flush()
+        self._remap()
+
+    def flush(self) -> None:
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._unmap()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def delete(self) -> None:
+        self.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class DGWWindow:
+    """
+    Dark Gravity Wave v3 over a rolling window of the last DGW_PAST_BLOCKS
+    headers, kept as decoded (timestamp, target) pairs. Headers are pushed
+    one at a time, so walking along a chain decodes each header only once.
+    """
+
+    def __init__(self):
+        self._items = deque(maxlen=DGW_PAST_BLOCKS)  # (timestamp, bits, target)
+        self.last_header = None  # type: Optional[dict]
+
+    def push(self, header: dict) -> None:
+        last_header = self.last_header
+        if last_header is not None and last_header['block_height'] + 1 != header['block_height']:
+            self._items.clear()
+        try:
+            target = Blockchain.bits_to_target(header['bits'])
+        except Exception:
+            target = None  # only fail if this header is actually used for a target
+        self._items.append((header['timestamp'], header['bits'], target))
+        self.last_header = header
+
+    def fill(self, chain: 'Blockchain', height: int) -> None:
+        """Push the headers of chain that precede height."""
+        for h in range(max(0, height - DGW_PAST_BLOCKS), height):
+            header = chain.read_header(h)
+            if header is not None:
+                self.push(header)
+
+    def get_target(self, height: int) -> int:
+        """Returns the target for the header at height, which must directly
+        follow the last pushed header.
+        """
+        if (len(self._items) < DGW_PAST_BLOCKS
+                or self.last_header['block_height'] != height - 1):
+            raise MissingHeader()
+        count_blocks = 1
+        for reading_time, reading_bits, reading_target in reversed(self._items):
+            if reading_target is None:
+                reading_target = Blockchain.bits_to_target(reading_bits)
+            if count_blocks == 1:
+                past_target_avg = reading_target
+                last_time = reading_time
+            past_target_avg = (past_target_avg * count_blocks +
+                               reading_target) // (count_blocks + 1)
+            count_blocks += 1
+
+        new_target = past_target_avg
+        actual_timespan = last_time - reading_time
+        target_timespan = DGW_PAST_BLOCKS * POW_TARGET_SPACING
+
+        if actual_timespan < target_timespan // 3:
+            actual_timespan = target_timespan // 3
+        if actual_timespan > target_timespan * 3:
+            actual_timespan = target_timespan * 3
+
+        new_target *= actual_timespan
+        new_target //= target_timespan
+
+        if new_target > MAX_TARGET:
+            return MAX_TARGET
+
+        # not any target can be represented in 32 bits:
+        new_target = Blockchain.bits_to_target(Blockchain.target_to_bits(new_target))
+        return new_target
+
+
 class Blockchain(Logger):
     """
     Manages blockchain headers and their verification
@@ -201,7 +545,15 @@ class Blockchain(Logger):
         self._forkpoint_hash = forkpoint_hash  # blockhash at forkpoint. "first hash"
         self._prev_hash = prev_hash  # blockhash immediately before forkpoint
         self.lock = threading.RLock()
+        self._headers_mmap = None  # type: Optional[mmap.mmap]
+        self._headers_file = None  # file object used for writing, kept open
+        self._unsynced_headers = 0  # appended since the last fsync
+        self._last_fsync = time.monotonic()
+        self._index = None  # type: Optional[HeadersIndex]
+        self._dgw_window = DGWWindow()  # reused by get_target() as we go along the tip
+        self._recover_unsynced_headers()
         self.update_size()
+        self._check_index()
 
     @property
     def checkpoints(self):
@@ -276,6 +628,8 @@ class Blockchain(Logger):
                           forkpoint_hash=hash_header(header),
                           prev_hash=parent.get_hash(forkpoint-1))
         self.assert_headers_file_available(parent.path())
+        self.close_headers_file()
+        self.delete_index()
         open(self.path(), 'w+').close()
         self.save_header(header)
         # put into global dict. note that in some cases
@@ -295,12 +649,200 @@ class Blockchain(Logger):
 
     @with_lock
     def update_size(self) -> None:
+        self._remap_headers_file()
+        m = self._headers_mmap
+        self._size = len(m)//HEADER_SIZE if m is not None else 0
+
+    @with_lock
+    def _remap_headers_file(self) -> None:
+        """(Re)map the headers file into memory, picking up its current size."""
+        self._unmap_headers_file()
         p = self.path()
-        self._size = os.path.getsize(p)//HEADER_SIZE if os.path.exists(p) else 0
+        if not os.path.exists(p):
+            return
+        with open(p, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return  # empty files cannot be mapped
+            self._headers_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @with_lock
+    def close_headers_file(self) -> None:
+        """Flush, close and unmap the headers file. Needs to be called before
+        the file gets replaced or deleted (Windows does not allow that while
+        the file is open or mapped). update_size() maps it again.
+        """
+        self.flush_headers()
+        if self._headers_file is not None:
+            self._headers_file.close()
+            self._headers_file = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._unmap_headers_file()
+
+    @with_lock
+    def _unmap_headers_file(self) -> None:
+        if self._headers_mmap is not None:
+            self._headers_mmap.close()
+            self._headers_mmap = None
+        self._size = 0
+
+    def _journal_path(self) -> str:
+        return get_journal_path(self.config, self.path())
+
+    @with_lock
+    def flush_headers(self) -> None:
+        """fsync headers that were appended without it, and drop the journal."""
+        if self._headers_file is not None:
+            os.fsync(self._headers_file.fileno())
+        if self._index is not None:
+            self._index.flush()
+        if self._unsynced_headers or os.path.exists(self._journal_path()):
+            try:
+                os.unlink(self._journal_path())
+            except FileNotFoundError:
+                pass
+        self._unsynced_headers = 0
+        self._last_fsync = time.monotonic()
+
+    @with_lock
+    def _recover_unsynced_headers(self) -> None:
+        """The journal holds the length of the headers file that is known to be
+        on disk. Anything after that was appended without fsync, so after a
+        system crash it might be zeros or garbage: keep only the headers that
+        still link up.
+        """
+        journal = self._journal_path()
+        if not os.path.exists(journal):
+            return
+        filename = self.path()
+        try:
+            with open(journal, 'r') as f:
+                synced_length = int(f.read())
+        except (OSError, ValueError):
+            synced_length = 0
+        synced_length -= synced_length % HEADER_SIZE
+        if os.path.exists(filename):
+            with open(filename, 'rb+') as f:
+                read_from = max(0, synced_length - HEADER_SIZE)
+                f.seek(read_from)
+                data = f.read()
+                prev_header = data[:HEADER_SIZE] if read_from < synced_length else None
+                good_length = synced_length
+                for offset in range(synced_length - read_from, len(data) - HEADER_SIZE + 1, HEADER_SIZE):
+                    raw_header = data[offset:offset+HEADER_SIZE]
+                    if raw_header == bytes(HEADER_SIZE):
+                        break
+                    if (prev_header and prev_header != bytes(HEADER_SIZE)
+                            and raw_header[4:36] != PoWHash(prev_header)):
+                        break
+                    prev_header = raw_header
+                    good_length += HEADER_SIZE
+                if good_length < os.fstat(f.fileno()).st_size:
+                    self.logger.info(f'dropping unsynced headers from {good_length // HEADER_SIZE}')
+                    f.truncate(good_length)
+                    f.flush()
+                    os.fsync(f.fileno())
+        # the index was not fsynced either
+        index = HeadersIndex(get_index_path(self.config, filename))
+        if index.size() > synced_length // HEADER_SIZE:
+            index.write(b'', synced_length // HEADER_SIZE)
+            index.flush()
+        index.close()
+        os.unlink(journal)
+
+    @with_lock
+    def _get_index(self) -> HeadersIndex:
+        if self._index is None:
+            self._index = HeadersIndex(get_index_path(self.config, self.path()))
+        return self._index
+
+    @with_lock
+    def delete_index(self) -> None:
+        self._get_index().delete()
+        self._index = None
+
+    @with_lock
+    def _check_index(self) -> None:
+        """Makes sure the index does not know more than, or something other
+        than, our headers file. Missing records are fine.
+        """
+        index = self._get_index()
+        if index.size() > self.size():
+            index.write(b'', self.size())
+        pos = index.size() - 1
+        record = index.read(pos)
+        if record is not None:
+            raw_header = self._read_headers_data(pos * HEADER_SIZE, HEADER_SIZE)
+            if record[0] != PoWHash(raw_header):
+                self.logger.info('headers index does not match headers file. deleting it')
+                self.delete_index()
+
+    @with_lock
+    def read_index_records(self, height: int, count: int) -> List[Optional[Tuple[bytes, int]]]:
+        """Returns the index records of our own headers from height on.
+        Missing ones are added, as long as we have the header.
+        """
+        index = self._get_index()
+        pos = height - self.forkpoint
+        records = [index.read(pos + i) for i in range(count)]
+        missing = [i for i, record in enumerate(records) if record is None]
+        if not missing:
+            return records
+        # rewrite from the first missing one on
+        first = missing[0]
+        data = self._read_headers_data((pos + first) * HEADER_SIZE, (count - first) * HEADER_SIZE)
+        if (len(data) < (count - first) * HEADER_SIZE
+                or any(data[i:i+HEADER_SIZE] == bytes(HEADER_SIZE) for i in range(0, len(data), HEADER_SIZE))):
+            return records
+        self._write_index(data, (pos + first) * HEADER_SIZE, truncate=False)
+        return [index.read(pos + i) for i in range(count)]
+
+    @with_lock
+    def _read_index(self, height: int) -> Optional[Tuple[bytes, int]]:
+        if height < self.forkpoint:
+            return self.parent._read_index(height)
+        if height > self.height():
+            return None
+        return self._get_index().read(height - self.forkpoint)
+
+    @with_lock
+    def _write_index(self, data: bytes, offset: int, truncate: bool,
+                     header_hashes: Sequence[str]=None, index_records: bytes=None) -> Optional[Sequence[str]]:
+        """Returns the hashes of the headers in data, unless index_records were given."""
+        pos = offset // HEADER_SIZE
+        if index_records is not None:
+            self._get_index().write(index_records, pos, truncate)
+            return None
+        if header_hashes is None:
+            header_hashes = pow_hash_raw_headers(data)
+        height = self.forkpoint + pos
+        try:
+            chainwork = self.get_chainwork(height - 1) if height > 0 else 0
+        except MissingHeader:
+            # gap before data; leave its records unknown
+            index_records = bytes(len(header_hashes) * INDEX_RECORD_SIZE)
+        else:
+            records = bytearray()
+            for i, header_hash in enumerate(header_hashes):
+                chainwork += self.chainwork_of_header_at_height(height + i)
+                records += bfh(header_hash)[::-1] + chainwork.to_bytes(32, byteorder='big')
+            index_records = bytes(records)
+        self._get_index().write(index_records, pos, truncate)
+        return header_hashes
+
+    @with_lock
+    def _read_headers_data(self, offset: int, length: int) -> bytes:
+        """Returns raw bytes of our headers file, without touching the disk."""
+        if self._headers_mmap is None:
+            self.assert_headers_file_available(self.path())
+            return b''
+        return self._headers_mmap[offset:offset+length]
 
     @classmethod
-    def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None) -> None:
-        _hash = hash_header(header)
+    def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None,
+                      *, header_hash: str=None) -> None:
+        _hash = header_hash or hash_header(header)
         if expected_header_hash and expected_header_hash != _hash:
             raise Exception("hash mismatches with expected: {} vs {}".format(expected_header_hash, _hash))
         if prev_hash != header.get('prev_block_hash'):
@@ -317,11 +859,20 @@ class Blockchain(Logger):
         if block_hash_as_num > target:
             raise Exception(f"insufficient proof of work: {block_hash_as_num} vs target {target}")
 
-    def verify_chunk(self, index: int, data: bytes) -> None:
+    def verify_chunk(self, index: int, data: bytes, header_hashes: Sequence[str]=None) -> None:
         num = len(data) // HEADER_SIZE
         start_height = index * CHUNK_SIZE
         prev_hash = self.get_hash(start_height - 1)
-        chunk_headers = {'empty': True}
+        if header_hashes is None:
+            header_hashes = pow_hash_raw_headers(data)
+        assert len(header_hashes) == num, (len(header_hashes), num)
+        # note: the window is seeded from our own headers only once, and then
+        #       slides through the chunk. Any header of the chunk that differs
+        #       from what we have stored fails the expected_header_hash check
+        #       before it could be used for computing a later target.
+        window = DGWWindow()
+        if start_height + num > POW_DGW3_HEIGHT:
+            window.fill(self, start_height)
         for i in range(num):
             height = start_height + i
             try:
@@ -329,17 +880,16 @@ class Blockchain(Logger):
             except MissingHeader:
                 expected_header_hash = None
             raw_header = data[i*HEADER_SIZE : (i+1)*HEADER_SIZE]
-            height = index * CHUNK_SIZE + i
             header = deserialize_header(raw_header, height)
-            target = self.get_target(height, chunk_headers)
-            self.verify_header(header, prev_hash, target, expected_header_hash)
-
-            chunk_headers[height] = header
-            if i == 0:
-                chunk_headers['min_height'] = height
-                chunk_headers['empty'] = False
-            chunk_headers['max_height'] = height
-            prev_hash = hash_header(header)
+            if height >= POW_DGW3_HEIGHT:
+                target = window.get_target(height)
+            else:
+                target = MAX_TARGET
+            header_hash = header_hashes[i]
+            self.verify_header(header, prev_hash, target, expected_header_hash,
+                               header_hash=header_hash)
+            window.push(header)
+            prev_hash = header_hash
 
     @with_lock
     def path(self):
@@ -355,13 +905,22 @@ class Blockchain(Logger):
         return os.path.join(d, filename)
 
     @with_lock
-    def save_chunk(self, index: int, chunk: bytes):
+    def save_chunk(self, index: int, chunk: bytes, header_hashes: Sequence[str]=None):
         assert index >= 0, index
+        if header_hashes is None:
+            header_hashes = pow_hash_raw_headers(chunk)
+        num_chunks = -(-len(chunk) // (CHUNK_SIZE * HEADER_SIZE))
+        if index < len(self.checkpoints) < index + num_chunks:
+            # several chunks saved in one go; split at the end of the checkpoint region
+            split = (len(self.checkpoints) - index) * CHUNK_SIZE
+            self.save_chunk(index, chunk[:split*HEADER_SIZE], header_hashes[:split])
+            self.save_chunk(len(self.checkpoints), chunk[split*HEADER_SIZE:], header_hashes[split:])
+            return
         chunk_within_checkpoint_region = index < len(self.checkpoints)
         # chunks in checkpoint region are the responsibility of the 'main chain'
         if chunk_within_checkpoint_region and self.parent is not None:
             main_chain = get_best_chain()
-            main_chain.save_chunk(index, chunk)
+            main_chain.save_chunk(index, chunk, header_hashes)
             return
 
         delta_height = (index * CHUNK_SIZE - self.forkpoint)
@@ -370,9 +929,10 @@ class Blockchain(Logger):
         # (the part before is the responsibility of the parent)
         if delta_bytes < 0:
             chunk = chunk[-delta_bytes:]
+            header_hashes = header_hashes[-delta_height:]
             delta_bytes = 0
         truncate = not chunk_within_checkpoint_region
-        self.write(chunk, delta_bytes, truncate)
+        self.write(chunk, delta_bytes, truncate, header_hashes=header_hashes)
         self.swap_with_parent()
 
     def swap_with_parent(self) -> None:
@@ -412,25 +972,32 @@ class Blockchain(Logger):
         # parent's new name will be something new (not child's old name)
         self.assert_headers_file_available(self.path())
         child_old_name = self.path()
-        with open(self.path(), 'rb') as f:
-            my_data = f.read()
+        my_data = self._read_headers_data(0, self.size()*HEADER_SIZE)
         self.assert_headers_file_available(parent.path())
         assert forkpoint > parent.forkpoint, (f"forkpoint of parent chain ({parent.forkpoint}) "
                                               f"should be at lower height than children's ({forkpoint})")
-        with open(parent.path(), 'rb') as f:
-            f.seek((forkpoint - parent.forkpoint)*HEADER_SIZE)
-            parent_data = f.read(parent_branch_size*HEADER_SIZE)
-        self.write(parent_data, 0)
-        parent.write(my_data, (forkpoint - parent.forkpoint)*HEADER_SIZE)
+        parent_data = parent._read_headers_data((forkpoint - parent.forkpoint)*HEADER_SIZE,
+                                                parent_branch_size*HEADER_SIZE)
+        # the index records move along with the headers
+        child_old_index_path = self._get_index().path
+        my_index = self._get_index().read_raw(0, self.size())
+        parent_index = parent._get_index().read_raw(forkpoint - parent.forkpoint, parent_branch_size)
+        self.write(parent_data, 0, index_records=parent_index)
+        parent.write(my_data, (forkpoint - parent.forkpoint)*HEADER_SIZE, index_records=my_index)
         # swap parameters
         self.parent, parent.parent = parent.parent, self  # type: Optional[Blockchain], Optional[Blockchain]
         self.forkpoint, parent.forkpoint = parent.forkpoint, self.forkpoint
         self._forkpoint_hash, parent._forkpoint_hash = parent._forkpoint_hash, hash_raw_header(bh2u(parent_data[:HEADER_SIZE]))
         self._prev_hash, parent._prev_hash = parent._prev_hash, self._prev_hash
         # parent's new name
+        self.close_headers_file()
+        parent.close_headers_file()
         os.replace(child_old_name, parent.path())
+        os.replace(child_old_index_path, get_index_path(self.config, parent.path()))
         self.update_size()
         parent.update_size()
+        _add_to_hash_index(self, forkpoint, _hashes_of_index_records(my_index))
+        _add_to_hash_index(parent, forkpoint, _hashes_of_index_records(parent_index))
         # update pointers
         blockchains.pop(child_old_id, None)
         blockchains.pop(parent_old_id, None)
@@ -450,17 +1017,46 @@ class Blockchain(Logger):
             raise FileNotFoundError('Cannot find headers file but headers_dir is there. Should be at {}'.format(path))
 
     @with_lock
-    def write(self, data: bytes, offset: int, truncate: bool=True) -> None:
+    def write(self, data: bytes, offset: int, truncate: bool=True, *,
+              header_hashes: Sequence[str]=None, index_records: bytes=None) -> None:
+        """Writes data at offset. Appends are only fsynced every
+        'headers_fsync_count' headers or 'headers_fsync_interval' seconds,
+        any other write right away.
+        The index is updated too, from index_records if given, otherwise
+        from header_hashes (computed if not given).
+        """
         filename = self.path()
         self.assert_headers_file_available(filename)
-        with open(filename, 'rb+') as f:
-            if truncate and offset != self._size * HEADER_SIZE:
-                f.seek(offset)
-                f.truncate()
+        if self._headers_file is None:
+            self._headers_file = open(filename, 'rb+')
+        f = self._headers_file
+        is_append = offset == self._size * HEADER_SIZE
+        if is_append:
+            self._unsynced_headers += len(data) // HEADER_SIZE
+            fsync_count = self.config.get('headers_fsync_count', HEADERS_FSYNC_COUNT)
+            fsync_interval = self.config.get('headers_fsync_interval', HEADERS_FSYNC_INTERVAL)
+            need_fsync = (self._unsynced_headers >= fsync_count
+                          or time.monotonic() - self._last_fsync >= fsync_interval)
+            if not need_fsync and self._unsynced_headers == len(data) // HEADER_SIZE:
+                # first deferred append of a batch: everything before offset
+                # is on disk, record that before writing anything after it
+                util.make_dir(os.path.dirname(self._journal_path()))
+                with open(self._journal_path(), 'w') as journal:
+                    journal.write(str(offset))
+                    journal.flush()
+                    os.fsync(journal.fileno())
+        elif truncate:
+            self._unmap_headers_file()
             f.seek(offset)
-            f.write(data)
-            f.flush()
-            os.fsync(f.fileno())
+            f.truncate()
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        header_hashes = self._write_index(data, offset, truncate, header_hashes, index_records)
+        if header_hashes is not None:
+            _add_to_hash_index(self, self.forkpoint + offset // HEADER_SIZE, header_hashes)
+        if not is_append or need_fsync:
+            self.flush_headers()
         self.update_size()
 
     @with_lock
@@ -482,13 +1078,9 @@ class Blockchain(Logger):
         if height > self.height():
             return
         delta = height - self.forkpoint
-        name = self.path()
-        self.assert_headers_file_available(name)
-        with open(name, 'rb') as f:
-            f.seek(delta * HEADER_SIZE)
-            h = f.read(HEADER_SIZE)
-            if len(h) < HEADER_SIZE:
-                raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
+        h = self._read_headers_data(delta * HEADER_SIZE, HEADER_SIZE)
+        if len(h) < HEADER_SIZE:
+            raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
         if h == bytes([0])*HEADER_SIZE:
             return None
         return deserialize_header(h, height)
@@ -527,66 +1119,34 @@ class Blockchain(Logger):
             h, t, extra_headers = self.checkpoints[index]
             return h
         else:
+            record = self._read_index(height)
+            if record is not None:
+                return hash_encode(record[0])
             header = self.read_header(height)
             if header is None:
                 raise MissingHeader(height)
             return hash_header(header)
 
-    def get_target(self, height: int, chunk_headers: Optional[dict]=None) -> int:
-        if chunk_headers is None:
-            chunk_headers = {'empty': True}
-
+    def get_target(self, height: int) -> int:
         if height >= POW_DGW3_HEIGHT:
-            return self.get_target_dgw_v3(height, chunk_headers)
+            return self.get_target_dgw_v3(height)
         else:
             return MAX_TARGET
 
-    def get_target_dgw_v3(self, height: int, chunk_headers: Optional[dict]) -> int:
-        if chunk_headers['empty']:
-            chunk_empty = True
-        else:
-            chunk_empty = False
-            min_height = chunk_headers['min_height']
-            max_height = chunk_headers['max_height']
-
-        count_blocks = 1
-        while count_blocks <= DGW_PAST_BLOCKS:
-            reading_h = height - count_blocks
-            reading_header = self.read_header(reading_h)
-            if (not reading_header and not chunk_empty
-                    and min_height <= reading_h <= max_height):
-                reading_header = chunk_headers[reading_h]
-            if not reading_header:
-                raise MissingHeader()
-            reading_time = reading_header.get('timestamp')
-            reading_target = self.bits_to_target(reading_header.get('bits'))
-
-            if count_blocks == 1:
-                past_target_avg = reading_target
-                last_time = reading_time
-            past_target_avg = (past_target_avg * count_blocks +
-                               reading_target) // (count_blocks + 1)
-
-            count_blocks +=1
-
-        new_target = past_target_avg
-        actual_timespan = last_time - reading_time
-        target_timespan = DGW_PAST_BLOCKS * POW_TARGET_SPACING
-
-        if actual_timespan < target_timespan // 3:
-            actual_timespan = target_timespan // 3
-        if actual_timespan > target_timespan * 3:
-            actual_timespan = target_timespan * 3
-
-        new_target *= actual_timespan
-        new_target //= target_timespan
-
-        if new_target > MAX_TARGET:
-            return MAX_TARGET
-
-        # not any target can be represented in 32 bits:
-        new_target = self.bits_to_target(self.target_to_bits(new_target))
-        return new_target
+    @with_lock
+    def get_target_dgw_v3(self, height: int) -> int:
+        window = self._dgw_window
+        last_header = window.last_header
+        if last_header is not None and last_header['block_height'] == height - 2:
+            # slide the window by one header, if it still matches our chain
+            if self.read_header(height - 2) == last_header:
+                header = self.read_header(height - 1)
+                if header is not None:
+                    window.push(header)
+        if window.last_header is None or window.last_header != self.read_header(height - 1):
+            window = self._dgw_window = DGWWindow()
+            window.fill(self, height)
+        return window.get_target(height)
 
     @classmethod
     def bits_to_target(cls, bits: int) -> int:
@@ -624,6 +1184,9 @@ class Blockchain(Logger):
             # On testnet/regtest, difficulty works somewhat different.
             # It's out of scope to properly implement that.
             return height
+        record = self._read_index(height)
+        if record is not None:
+            return record[1]
         last_retarget = height // CHUNK_SIZE * CHUNK_SIZE - 1
         cached_height = last_retarget
         while _CHAINWORK_CACHE.get(self.get_hash(cached_height)) is None:
@@ -667,12 +1230,15 @@ class Blockchain(Logger):
             return False
         return True
 
-    def connect_chunk(self, idx: int, hexdata: str) -> bool:
+    def connect_chunk(self, idx: int, hexdata: str, header_hashes: Sequence[str]=None) -> bool:
+        """hexdata may hold several consecutive chunks, starting at chunk idx."""
         assert idx >= 0, idx
         try:
             data = bfh(hexdata)
-            self.verify_chunk(idx, data)
-            self.save_chunk(idx, data)
+            if header_hashes is None:
+                header_hashes = pow_hash_raw_headers(data)
+            self.verify_chunk(idx, data, header_hashes)
+            self.save_chunk(idx, data, header_hashes)
             return True
         except BaseException as e:
             self.logger.info(f'verify_chunk idx {idx} failed: {repr(e)}')
@@ -690,16 +1256,14 @@ class Blockchain(Logger):
                 raise Exception('%s file has not enough data.' % self.path())
             dgw3_headers = []
             if os.path.exists(self.path()):
-                with open(self.path(), 'rb') as f:
-                    lower_header = height - DGW_PAST_BLOCKS
-                    for height in range(height, lower_header-1, -1):
-                        f.seek(height*80)
-                        hd = f.read(80)
-                        if len(hd) < 80:
-                            raise Exception(
-                                'Expected to read a full header.'
-                                ' This was only {} bytes'.format(len(hd)))
-                        dgw3_headers.append((height, bh2u(hd)))
+                lower_header = height - DGW_PAST_BLOCKS
+                for height in range(height, lower_header-1, -1):
+                    hd = self._read_headers_data(height*80, 80)
+                    if len(hd) < 80:
+                        raise Exception(
+                            'Expected to read a full header.'
+                            ' This was only {} bytes'.format(len(hd)))
+                    dgw3_headers.append((height, bh2u(hd)))
             cp.append((h, target, dgw3_headers))
         return cp
 
@@ -708,9 +1272,15 @@ def check_header(header: dict) -> Optional[Blockchain]:
     """Returns any Blockchain that contains header, or None."""
     if type(header) is not dict:
         return None
+    height = header.get('block_height')
+    header_hash = hash_header(header)
+    if type(height) is int:
+        known, chain = _lookup_hash_index(height, header_hash)
+        if known:
+            return chain
     with blockchains_lock: chains = list(blockchains.values())
     for b in chains:
-        if b.check_header(header):
+        if b.check_hash(height, header_hash):
             return b
     return None
 
@@ -719,6 +1289,11 @@ def can_connect(header: dict) -> Optional[Blockchain]:
     """Returns the Blockchain that has a tip that directly links up
     with header, or None.
     """
+    height = header['block_height']
+    if height > 0:
+        known, chain = _lookup_hash_index(height - 1, header['prev_block_hash'])
+        if known:
+            return chain if chain is not None and chain.can_connect(header) else None
     with blockchains_lock: chains = list(blockchains.values())
     for b in chains:
         if b.can_connect(header):
@@ -29,6 +29,7 @@ from decimal import Decimal
 
 from .bitcoin import sha256, COIN, is_address
 from .cintamani_ps_util import PS_DENOMS_VALS
+from .cintamani_tx import to_compact_size
 from .transaction import Transaction, TxOutput, PartialTransaction, PartialTxInput, PartialTxOutput
 from .util import NotEnoughFunds
 from .logging import Logger
@@ -566,49 +567,66 @@ class CoinChooserPrivateSend:
         if sum([c.value_sats() for c in coins]) < spent_amount:
             return
         coins = sorted(coins, key=lambda x: x.value_sats(), reverse=True)
-        skip_value = 0
-        tx = backup_tx = None
-        for c in coins:
-            if c.value_sats() == skip_value:
-                continue
+
+        # candidates are kept as lists of coins added to base_tx, with
+        # running size and value, txs are made only for the returned one
+        base_inputs_cnt = len(base_tx.inputs())
+        base_size = (base_tx.estimated_size()
+                     - len(to_compact_size(base_inputs_cnt)))
+        base_value = base_tx.input_value()
+
+        def fee_for_inputs(inputs_cnt, inputs_size):
+            inputs_cnt += base_inputs_cnt
+            return fee_estimator_vb(base_size + inputs_size
+                                    + len(to_compact_size(inputs_cnt)))
+
+        def make_tx(tx_coins):
             tx = PartialTransaction.from_io(base_tx.inputs()[:],
                                             base_tx.outputs()[:],
                                             tx_type=base_tx.tx_type,
                                             extra_payload=base_tx.extra_payload)
-            tx.add_inputs(selected + [c])
-            input_value = tx.input_value()
-            estimated_fee = fee_estimator_vb(tx.estimated_size())
-            fee = input_value - spent_amount
+            tx.add_inputs(tx_coins)
+            return tx
+
+        selected_size = 0
+        selected_value = 0
+        skip_value = 0
+        tx_coins = backup_coins = None
+        for c in coins:
+            value = c.value_sats()
+            if value == skip_value:
+                continue
+            size = Transaction.estimated_input_size(c)
+            tx_coins = selected + [c]
+            estimated_fee = fee_for_inputs(len(tx_coins), selected_size + size)
+            fee = base_value + selected_value + value - spent_amount
             if fee < estimated_fee:
                 selected.append(c)
+                selected_size += size
+                selected_value += value
                 continue
             elif fee - estimated_fee >= PS_DENOMS_VALS[0]:
-                skip_value = c.value_sats()
-                backup_tx = tx
-                tx = PartialTransaction.from_io(base_tx.inputs()[:],
-                                                base_tx.outputs()[:],
-                                                tx_type=base_tx.tx_type,
-                                                extra_payload=base_tx.extra_payload)
-                tx.add_inputs(selected)
-                input_value = tx.input_value()
-                estimated_fee = fee_estimator_vb(tx.estimated_size())
-                fee = input_value - spent_amount
+                skip_value = value
+                backup_coins = tx_coins
+                tx_coins = selected[:]
+                estimated_fee = fee_for_inputs(len(tx_coins), selected_size)
+                fee = base_value + selected_value - spent_amount
                 continue
             else:
                 break
-            selected.append(c)
 
         fee_overhead = fee - estimated_fee
-        if tx and fee >= estimated_fee and fee_overhead <= PS_DENOMS_VALS[0]:
-            return tx
-        elif use_repeated_txids and backup_tx:
+        if (tx_coins is not None and fee >= estimated_fee
+                and fee_overhead <= PS_DENOMS_VALS[0]):
+            return make_tx(tx_coins)
+        elif use_repeated_txids and backup_coins is not None:
+            backup_tx = make_tx(backup_coins)
             fee = backup_tx.input_value() - spent_amount
             estimated_fee = fee_estimator_vb(backup_tx.estimated_size())
             fee_overhead = fee - estimated_fee
             if fee_overhead <= PS_DENOMS_VALS[0]:
                 return backup_tx
 
-
 COIN_CHOOSERS = {
     'Privacy': CoinChooserPrivacy,
 }
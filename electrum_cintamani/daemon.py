@@ -46,6 +46,7 @@ from .util import log_exceptions, ignore_exceptions, randrange
 from .wallet import Wallet, Abstract_Wallet
 from .storage import WalletStorage
 from .wallet_db import WalletDB
+from .wallet_sqlite_db import SqliteWalletDB
 from .commands import known_commands, Commands
 from .simple_config import SimpleConfig
 from .exchange_rate import FxThread
@@ -463,7 +464,10 @@ class Daemon(Logger):
                 return
             storage.decrypt(password)
         # read data, pass it to db
-        db = WalletDB(storage.read(), manual_upgrades=manual_upgrades)
+        if storage.is_sqlite():
+            db = SqliteWalletDB(path, manual_upgrades=manual_upgrades)
+        else:
+            db = WalletDB(storage.read(), manual_upgrades=manual_upgrades)
         if db.upgrade_done:
             storage.backup_old_version()
         if getattr(storage, 'backup_message', None):
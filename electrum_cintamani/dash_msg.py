@@ -27,7 +27,7 @@
 from collections import namedtuple
 from enum import IntEnum
 from ipaddress import ip_address
-from struct import pack
+from struct import pack, Struct
 
 from .crypto import sha256d
 from .bitcoin import hash160_to_p2pkh, b58_address_to_hash160
@@ -55,6 +55,13 @@ FILTERADD_MAX_ELEMENT_BYTES = 520
 # e9f7142ed01c0d7b53ef8b5f6f3f6375a68ef422/src/privatesend.h#L29
 PRIVATESEND_ENTRY_MAX_SIZE = 9
 
+# proRegTxHash, confirmedHash, ipAddress, port (network byte order),
+# pubKeyOperator, keyIDVoting, isValid
+SML_ENTRY_STRUCT = Struct('>32s32s16sH48s20sB')
+
+# quorumPublicKey, quorumVvecHash, quorumSig, sig
+QFCOMMIT_TAIL_STRUCT = Struct('<48s32s96s96s')
+
 
 class DashMsgError(Exception):
     """Thrown when there's a problem with Dash message serialize/deserialize"""
@@ -303,13 +310,9 @@ class DashSMLEntry(namedtuple('DashSMLEntry',
 
     @classmethod
     def read_vds(cls, vds, alone_data=False):
-        proRegTxHash = vds.read_bytes(32)               # proRegTxHash
-        confirmedHash = vds.read_bytes(32)              # confirmedHash
-        ipAddress = ip_address(vds.read_bytes(16))      # ipAddress
-        port = read_uint16_nbo(vds)                     # port
-        pubKeyOperator = vds.read_bytes(48)             # pubKeyOperator
-        keyIDVoting = vds.read_bytes(20)                # keyIDVoting
-        isValid = vds.read_uchar()                      # isValid
+        (proRegTxHash, confirmedHash, ipAddress, port, pubKeyOperator,
+         keyIDVoting, isValid) = vds.read_struct(SML_ENTRY_STRUCT)
+        ipAddress = ip_address(ipAddress)
         if alone_data and vds.can_read_more():
             raise SerializationError(f'{cls}: extra junk at the end')
         return DashSMLEntry(proRegTxHash, confirmedHash, ipAddress,
@@ -846,21 +849,18 @@ class DashMNListDiffMsg(DashMsgBase):
         totalTransactions = vds.read_uint32()           # totalTransactions
 
         mh_cnt = vds.read_compact_size()                # merkleHashes cnt
-        merkleHashes = []                               # merkleHashes
-        for mh_i in range(mh_cnt):
-            merkleHashes.append(vds.read_bytes(32))
+        mh_bytes = vds.read_bytes(mh_cnt * 32)          # merkleHashes
+        merkleHashes = [mh_bytes[i:i+32] for i in range(0, mh_cnt * 32, 32)]
 
         mf_cnt = vds.read_compact_size()                # merkleFlags cnt
-        merkleFlags = []                                # merkleFlags
-        for mf_i in range(mf_cnt):
-            merkleFlags.append(vds.read_bytes(1))
+        mf_bytes = vds.read_bytes(mf_cnt)               # merkleFlags
+        merkleFlags = [mf_bytes[i:i+1] for i in range(mf_cnt)]
 
         cbTx = Transaction.read_vds(vds)                # cbTx
 
         dmns_cnt = vds.read_compact_size()              # deletedMNs cnt
-        deletedMNs = []                                 # deletedMNs
-        for dmn_i in range(dmns_cnt):
-            deletedMNs.append(vds.read_bytes(32))
+        dmns_bytes = vds.read_bytes(dmns_cnt * 32)      # deletedMNs
+        deletedMNs = [dmns_bytes[i:i+32] for i in range(0, dmns_cnt * 32, 32)]
 
         mnl_cnt = vds.read_compact_size()               # mnList cnt
         mnList = []                                     # mnList
@@ -945,10 +945,9 @@ class DashQFCommitMsg(DashMsgBase):
         valid_m_size = vds.read_compact_size()          # validMembersSize
         valid_m_bytes = (valid_m_size + 7) // 8
         validMembers = vds.read_bytes(valid_m_bytes)    # validMembers
-        quorumPublicKey = vds.read_bytes(48)            # quorumPublicKey
-        quorumVvecHash = vds.read_bytes(32)             # quorumVvecHash
-        quorumSig = vds.read_bytes(96)                  # quorumSig
-        sig = vds.read_bytes(96)                        # sig
+        (quorumPublicKey, quorumVvecHash,               # quorumPublicKey,
+         quorumSig, sig) = vds.read_struct(             # quorumVvecHash,
+            QFCOMMIT_TAIL_STRUCT)                       # quorumSig, sig
         if alone_data and vds.can_read_more():
             raise SerializationError(f'{cls}: extra junk at the end')
         return DashQFCommitMsg(version, llmqType, quorumHash,
@@ -1266,6 +1266,7 @@ class PSUtilsMixin:
                     util.trigger_callback('ps-state-changes', w, None, None)
                     self.logger.info('Clearing PrivateSend wallet data')
                     w.db.clear_ps_data()
+                    w.invalidate_balance_cache()
                     self.ps_keystore_has_history = False
                     self.state = PSStates.Ready
                     self.logger.info('All PrivateSend wallet data cleared')
@@ -815,6 +815,7 @@ class PSDataMixin:
     def add_ps_denom(self, outpoint, denom):
         '''Add outpoint as ps_denom, denom data is (addr, value, rounds)'''
         self.wallet.db._add_ps_denom(outpoint, denom)
+        self.wallet.invalidate_balance_cache(denom[0])
         self._ps_denoms_amount_cache += denom[1]
         if denom[2] < self.mix_rounds:  # if rounds < mix_rounds
             self._denoms_to_mix_cache[outpoint] = denom
@@ -823,6 +824,7 @@ class PSDataMixin:
         '''Pop outpoint from ps_denom'''
         denom = self.wallet.db._pop_ps_denom(outpoint)
         if denom:
+            self.wallet.invalidate_balance_cache(denom[0])
             self._ps_denoms_amount_cache -= denom[1]
             self._denoms_to_mix_cache.pop(outpoint, None)
         return denom
@@ -2456,6 +2458,12 @@ class PSKeystoreMixin:
         w = self.wallet
         if 'ps_keystore' in w.db.data:
             self.ps_keystore = load_keystore(w.db, 'ps_keystore')
+            self.ps_keystore.set_derived_pubkeys_cache(
+                w.db.get_derived_pubkeys(self.ps_keystore.xpub))
+            self.ps_keystore.fill_derived_pubkeys(
+                0, w.db.num_receiving_addresses(ps_ks=True))
+            self.ps_keystore.fill_derived_pubkeys(
+                1, w.db.num_change_addresses(ps_ks=True))
 
     def enable_ps_keystore(self):
         '''Load and synchronize PS keystore'''
@@ -2543,6 +2551,11 @@ class PSKeystoreMixin:
         pubkeys = self.derive_pubkeys(for_change, n)
         return self.pubkeys_to_address(pubkeys)
 
+    def derive_addresses(self, for_change, start, count):
+        for_change = int(for_change)
+        pubkeys = self.ps_keystore.derive_pubkeys(for_change, start, count)
+        return [self.pubkeys_to_address([pk.hex()]) for pk in pubkeys]
+
     def get_address_index(self, address):
         return self.wallet.db.get_address_index(address, ps_ks=True)
 
@@ -2573,34 +2586,42 @@ class PSKeystoreMixin:
         return convert_bip32_intpath_to_strpath(intpath)
 
     def create_new_address(self, for_change=False):
+        return self.create_new_addresses(for_change, 1)[0]
+
+    def create_new_addresses(self, for_change, count):
         assert type(for_change) is bool
         with self.wallet.lock:
             if for_change:
                 n = self.wallet.db.num_change_addresses(ps_ks=True)
             else:
                 n = self.wallet.db.num_receiving_addresses(ps_ks=True)
-            address = self.derive_address(int(for_change), n)
-            if for_change:
-                self.wallet.db.add_change_address(address, ps_ks=True)
-            else:
-                self.wallet.db.add_receiving_address(address, ps_ks=True)
-            self.wallet.add_address(address, ps_ks=True)  # addr synchronizer
-            return address
+            addresses = self.derive_addresses(int(for_change), n, count)
+            for address in addresses:
+                if for_change:
+                    self.wallet.db.add_change_address(address, ps_ks=True)
+                else:
+                    self.wallet.db.add_receiving_address(address, ps_ks=True)
+                self.wallet.add_address(address, ps_ks=True)  # addr synchronizer
+            return addresses
 
     def synchronize_sequence(self, for_change):
         limit = self.gap_limit_for_change if for_change else self.gap_limit
         while True:
             if for_change:
-                addrs = self.get_change_addresses()
+                num_addrs = self.wallet.db.num_change_addresses(ps_ks=True)
             else:
-                addrs = self.get_receiving_addresses()
-            num_addrs = len(addrs)
+                num_addrs = self.wallet.db.num_receiving_addresses(ps_ks=True)
             if num_addrs < limit:
-                self.create_new_address(for_change)
+                self.create_new_addresses(for_change, limit - num_addrs)
                 continue
-            last_few_addresses = addrs[-limit:]
-            if any(map(self.wallet.address_is_old, last_few_addresses)):
-                self.create_new_address(for_change)
+            if for_change:
+                last_few_addresses = self.get_change_addresses(slice_start=num_addrs-limit)
+            else:
+                last_few_addresses = self.get_receiving_addresses(slice_start=num_addrs-limit)
+            for i, addr in enumerate(reversed(last_few_addresses)):
+                if self.wallet.address_is_old(addr):
+                    self.create_new_addresses(for_change, limit - i)
+                    break
             else:
                 break
 
@@ -36,12 +36,17 @@ from .crypto import sha256d
 from .i18n import _
 
 
+def split_tx_header(tx_header):
+    '''Split uint32 tx header to (version, tx_type)'''
+    tx_type = (tx_header >> 16)
+    if tx_type and (tx_header & 0x0000ffff) >= 3:
+        return tx_header & 0x0000ffff, tx_type
+    return tx_header, 0
+
+
 def tx_header_to_tx_type(tx_header_bytes):
     tx_header = struct.unpack('<I', tx_header_bytes)[0]
-    tx_type = (tx_header >> 16)
-    if tx_type and (tx_header & 0x0000ffff) < 3:
-        tx_type = 0
-    return tx_type
+    return split_tx_header(tx_header)[1]
 
 
 def serialize_ip(ip):
@@ -94,10 +99,11 @@ def read_outpoint(vds):
     return TxOutPoint.read_vds(vds)
 
 
+_UINT16_NBO = struct.Struct('>H')
+
+
 def read_uint16_nbo(vds):
-    (i,) = struct.unpack_from('>H', vds.input, vds.read_cursor)
-    vds.read_cursor += struct.calcsize('>H')
-    return i
+    return vds.read_struct(_UINT16_NBO)[0]
 
 
 class DashTxError(Exception):
@@ -26,17 +26,17 @@
 import base64
 import hashlib
 import functools
-from typing import Union, Tuple, Optional
+from typing import Union, Tuple, Optional, Iterable, List
 from ctypes import (
     byref, c_byte, c_int, c_uint, c_char_p, c_size_t, c_void_p, create_string_buffer,
-    CFUNCTYPE, POINTER, cast
+    CFUNCTYPE, POINTER, cast, memmove
 )
 
 from .util import bfh, bh2u, assert_bytes, to_bytes, InvalidPassword, profiler, randrange
 from .crypto import (sha256d, aes_encrypt_with_iv, aes_decrypt_with_iv, hmac_oneshot)
 from . import constants
 from .logging import get_logger
-from .ecc_fast import _libsecp256k1, SECP256K1_EC_UNCOMPRESSED
+from .ecc_fast import _libsecp256k1, SECP256K1_EC_UNCOMPRESSED, SECP256K1_EC_COMPRESSED
 
 _logger = get_logger(__name__)
 
@@ -346,6 +346,32 @@ class ECPubkey(object):
     def is_at_infinity(self):
         return self == POINT_AT_INFINITY
 
+    def add_tweaks(self, tweaks: Iterable[bytes]) -> List[Optional[bytes]]:
+        """Returns compressed pubkeys of self + tweak*G for each 32 byte tweak,
+        or None where tweak is not within the curve order or the sum is infinity.
+        self is parsed only once, so this is faster than adding one by one.
+        """
+        if self.is_at_infinity(): raise Exception('point is at infinity')
+        pubkey_self = self._to_libsecp256k1_pubkey_ptr()
+        pubkey = create_string_buffer(64)
+        pubkey_serialized = create_string_buffer(33)
+        pubkey_size = c_size_t(33)
+        res = []
+        for tweak in tweaks:
+            if not is_secret_within_curve_range(tweak):
+                res.append(None)
+                continue
+            memmove(pubkey, pubkey_self, 64)
+            ret = _libsecp256k1.secp256k1_ec_pubkey_tweak_add(_libsecp256k1.ctx, pubkey, tweak)
+            if not ret:
+                res.append(None)
+                continue
+            pubkey_size.value = 33
+            _libsecp256k1.secp256k1_ec_pubkey_serialize(
+                _libsecp256k1.ctx, pubkey_serialized, byref(pubkey_size), pubkey, SECP256K1_EC_COMPRESSED)
+            res.append(pubkey_serialized.raw)
+        return res
+
     @classmethod
     def is_pubkey_bytes(cls, b: bytes):
         try:
@@ -598,10 +598,25 @@ class Interface(Logger):
         if can_return_early and index in self._requested_chunks:
             return
         self.logger.info(f"requesting chunk from height {height}")
+        size = self._get_chunk_size(index, tip)
+        hexdata, header_hashes = await self._fetch_chunk(index, size)
+        conn = self.blockchain.connect_chunk(index, hexdata, header_hashes)
+        if not conn:
+            return conn, 0
+        return conn, size
+
+    @classmethod
+    def _get_chunk_size(cls, index: int, tip: Optional[int]) -> int:
         size = 2016
         if tip is not None:
             size = min(size, tip - index * 2016 + 1)
             size = max(size, 0)
+        return size
+
+    async def _fetch_chunk(self, index: int, size: int) -> Tuple[str, List[str]]:
+        """Downloads size headers starting at chunk index.
+        Returns them as hex, and their block hashes.
+        """
         try:
             self._requested_chunks.add(index)
             res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
@@ -620,10 +635,55 @@ class Interface(Logger):
             raise RequestCorrupted(f"server uses too low 'max' count for block.headers: {res['max']} < 2016")
         if res['count'] != size:
             raise RequestCorrupted(f"expected {size} headers but only got {res['count']}")
-        conn = self.blockchain.connect_chunk(index, res['hex'])
-        if not conn:
-            return conn, 0
-        return conn, res['count']
+        # X11 hashing is the bulk of chunk verification; keep it off the event loop
+        loop = asyncio.get_event_loop()
+        header_hashes = await loop.run_in_executor(
+            None, blockchain.pow_hash_raw_headers, bfh(res['hex']))
+        return res['hex'], header_hashes
+
+    async def request_chunks_pipelined(self, height: int, tip: int) -> Tuple[bool, int]:
+        """Downloads the chunks from height up to tip, keeping several requests
+        in flight. Responses are buffered and connected strictly in order;
+        consecutive chunks that are already available get verified and written
+        in one batch. Returns whether everything could be connected, and the
+        height of the first header that is not connected.
+        """
+        assert height <= tip, (height, tip)
+        max_in_flight = max(1, int(self.network.config.get('network_chunks_in_flight', 4)))
+        next_index = height // 2016
+        last_index = tip // 2016
+        to_request = next_index
+        in_flight = {}  # type: Dict[int, asyncio.Future]
+        try:
+            while next_index <= last_index:
+                while to_request <= last_index and len(in_flight) < max_in_flight:
+                    size = self._get_chunk_size(to_request, tip)
+                    in_flight[to_request] = asyncio.ensure_future(self._fetch_chunk(to_request, size))
+                    to_request += 1
+                batch = [await in_flight.pop(next_index)]
+                while (next_index + len(batch) in in_flight
+                       and in_flight[next_index + len(batch)].done()):
+                    batch.append(in_flight.pop(next_index + len(batch)).result())
+                self.logger.info(f"connecting {len(batch)} chunk(s) from height {next_index * 2016}")
+                hexdata = ''.join(chunk_hex for chunk_hex, _ in batch)
+                header_hashes = [h for _, hashes in batch for h in hashes]
+                if not self.blockchain.connect_chunk(next_index, hexdata, header_hashes):
+                    # find the first chunk that does not connect (e.g. reorg)
+                    for chunk_hex, hashes in batch:
+                        if not self.blockchain.connect_chunk(next_index, chunk_hex, hashes):
+                            return False, max(height, next_index * 2016)
+                        next_index += 1
+                        util.trigger_callback('network_updated')
+                    continue
+                next_index += len(batch)
+                util.trigger_callback('network_updated')
+            return True, tip + 1
+        finally:
+            # e.g. reorg or error: nothing else of the pipeline will be used
+            for fut in in_flight.values():
+                if fut.done() and not fut.cancelled():
+                    fut.exception()  # mark as retrieved, so that asyncio does not log it
+                fut.cancel()
 
     def is_main_server(self) -> bool:
         return (self.network.interface == self or
@@ -758,14 +818,12 @@ class Interface(Logger):
         while last is None or height <= next_height:
             prev_last, prev_height = last, height
             if next_height > height + 10:
-                could_connect, num_headers = await self.request_chunk(height, next_height)
+                could_connect, height = await self.request_chunks_pipelined(height, next_height)
                 if not could_connect:
                     if height <= constants.net.max_checkpoint():
                         raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
                     last, height = await self.step(height)
                     continue
-                util.trigger_callback('network_updated')
-                height = (height // 2016 * 2016) + num_headers
                 assert height <= next_height+1, (height, self.tip)
                 last = 'catchup'
             else:
@@ -25,6 +25,7 @@
 import threading
 import copy
 import json
+from typing import Sequence, List, Dict, Set, Tuple
 
 from . import util
 from .logging import Logger
@@ -74,9 +75,16 @@ class StoredDict(dict):
         self.db = db
         self.lock = self.db.lock if self.db else threading.RLock()
         self.path = path
-        # recursively convert dicts to StoredDict
+        # keys of dicts as loaded; they are converted to StoredDict
+        # on first access, see _load()
+        self._unconverted = set()
         for k, v in list(data.items()):
-            self.__setitem__(k, v)
+            if type(v) is dict and self.db:
+                k = self.convert_key(k)
+                dict.__setitem__(self, k, v)
+                self._unconverted.add(k)
+            else:
+                self.__setitem__(k, v)
 
     def convert_key(self, key):
         """Convert int keys to str keys, as only those are allowed in json."""
@@ -92,11 +100,20 @@ class StoredDict(dict):
         # early return to prevent unnecessary disk writes
         if not is_new and self[key] == v:
             return
+        v = self._convert(key, v)
+        self._unconverted.discard(key)
+        dict.__setitem__(self, key, v)
+        if self.db:
+            self.db.add_change(self.path + [key])
+
+    def _convert(self, key, v):
         # recursively set db and path
         if isinstance(v, StoredDict):
             v.db = self.db
             v.path = self.path + [key]
             for k, vv in v.items():
+                if isinstance(vv, StoredList):
+                    vv.db, vv.path = self.db, v.path + [k]
                 v[k] = vv
         # recursively convert dict to StoredDict.
         # _convert_dict is called breadth-first
@@ -105,6 +122,8 @@ class StoredDict(dict):
                 v = self.db._convert_dict(self.path, key, v)
             if not self.db or self.db._should_convert_to_stored_dict(key):
                 v = StoredDict(v, self.db, self.path + [key])
+        elif isinstance(v, list):
+            v = StoredList(v, self.db, self.path + [key])
         # convert_value is called depth-first
         if isinstance(v, dict) or isinstance(v, str):
             if self.db:
@@ -112,21 +131,29 @@ class StoredDict(dict):
         # set parent of StoredObject
         if isinstance(v, StoredObject):
             v.set_db(self.db)
-        # set item
-        dict.__setitem__(self, key, v)
-        if self.db:
-            self.db.set_modified(True)
+        return v
+
+    def _load(self, key):
+        if key in self._unconverted:
+            self._unconverted.remove(key)
+            dict.__setitem__(self, key, self._convert(key, dict.__getitem__(self, key)))
+
+    def _load_all(self):
+        for key in list(self._unconverted):
+            self._load(key)
 
     @locked
     def __delitem__(self, key):
         key = self.convert_key(key)
         dict.__delitem__(self, key)
+        self._unconverted.discard(key)
         if self.db:
-            self.db.set_modified(True)
+            self.db.add_change(self.path + [key])
 
     @locked
     def __getitem__(self, key):
         key = self.convert_key(key)
+        self._load(key)
         return dict.__getitem__(self, key)
 
     @locked
@@ -137,19 +164,114 @@ class StoredDict(dict):
     @locked
     def pop(self, key, v=_RaiseKeyError):
         key = self.convert_key(key)
+        self._load(key)
         if v is _RaiseKeyError:
             r = dict.pop(self, key)
+        elif key in self:
+            r = dict.pop(self, key)
         else:
-            r = dict.pop(self, key, v)
+            return v
         if self.db:
-            self.db.set_modified(True)
+            self.db.add_change(self.path + [key])
         return r
 
     @locked
     def get(self, key, default=None):
         key = self.convert_key(key)
+        self._load(key)
         return dict.get(self, key, default)
 
+    @locked
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+    @locked
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    @locked
+    def clear(self):
+        dict.clear(self)
+        self._unconverted.clear()
+        if self.db:
+            self.db.add_change(self.path)
+
+    @locked
+    def update(self, *args, **kwargs):
+        # dict.update would bypass __setitem__
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+
+class StoredList(list):
+    """A list in a StoredDict. Appending to it is recorded as such, other
+    in-place changes count as a change of the whole list.
+    """
+
+    def __init__(self, data, db, path):
+        list.__init__(self, data)
+        self.db = db
+        self.path = path
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(list(self), memo)
+
+    def _changed(self):
+        if self.db:
+            self.db.add_change(self.path)
+
+    def _appended(self, values):
+        if self.db:
+            self.db.add_append(self.path, values)
+
+    def __setitem__(self, i, v):
+        list.__setitem__(self, i, v)
+        self._changed()
+
+    def __delitem__(self, i):
+        list.__delitem__(self, i)
+        self._changed()
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def append(self, v):
+        list.append(self, v)
+        self._appended([v])
+
+    def extend(self, other):
+        other = list(other)
+        list.extend(self, other)
+        self._appended(other)
+
+    def insert(self, i, v):
+        list.insert(self, i, v)
+        self._changed()
+
+    def pop(self, i=-1):
+        r = list.pop(self, i)
+        self._changed()
+        return r
+
+    def remove(self, v):
+        list.remove(self, v)
+        self._changed()
+
+    def clear(self):
+        list.clear(self)
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        list.reverse(self)
+        self._changed()
+
 
 
 
@@ -160,10 +282,34 @@ class JsonDB(Logger):
         self.lock = threading.RLock()
         self.data = data
         self._modified = False
+        # paths (tuples of keys) into data that changed since the last write,
+        # for writing just those; see journal_records()
+        self._changes = set()  # type: Set[Tuple[str, ...]]
+        # values appended to the lists at paths since the last write
+        self._appends = {}  # type: Dict[Tuple[str, ...], list]
+        self._needs_full_write = False
 
     def set_modified(self, b):
+        """Setting this means the next write has to write everything, as
+        the change cannot be told. Clearing it, that everything was written.
+        """
         with self.lock:
             self._modified = b
+            self._needs_full_write = b
+            self._changes.clear()
+            self._appends.clear()
+
+    def add_change(self, path: Sequence[str]) -> None:
+        """Records that the value at path changed (or is gone)."""
+        with self.lock:
+            self._modified = True
+            self._changes.add(tuple(path))
+
+    def add_append(self, path: Sequence[str], values: list) -> None:
+        """Records that values were appended to the list at path."""
+        with self.lock:
+            self._modified = True
+            self._appends.setdefault(tuple(path), []).extend(values)
 
     def modified(self):
         return self._modified
@@ -204,5 +350,58 @@ class JsonDB(Logger):
             cls=JsonDBJsonEncoder,
         )
 
+    @locked
+    def journal_records(self) -> List[list]:
+        """Returns the changes since the last write, as records for
+        apply_journal_records(): [path, value] to set path, [path] to delete it,
+        ['extend', path, values] to append values to the list at path.
+        """
+        def covered(path):
+            # the value of a changed parent covers its children
+            return any(path[:i] in self._changes for i in range(len(path)))
+
+        records = []
+        for path in sorted(self._changes, key=len):
+            if covered(path):
+                continue
+            d = self.data
+            for key in path[:-1]:
+                d = d.get(key) if isinstance(d, dict) else None
+            if not path:
+                records.append([[], d])
+            elif isinstance(d, dict) and path[-1] in d:
+                records.append([list(path), d[path[-1]]])
+            else:
+                records.append([list(path)])
+        for path, values in self._appends.items():
+            if path in self._changes or covered(path):
+                continue
+            records.append(['extend', list(path), values])
+        return records
+
+    @classmethod
+    def apply_journal_records(cls, data: dict, records: Sequence[list]) -> dict:
+        """Applies records of journal_records() to plain json data."""
+        for record in records:
+            if record[0] == 'extend':
+                _, path, values = record
+                d = data
+                for key in path[:-1]:
+                    d = d.setdefault(key, {})
+                d.setdefault(path[-1], []).extend(values)
+                continue
+            path = record[0]
+            if not path:
+                data = record[1]
+                continue
+            d = data
+            for key in path[:-1]:
+                d = d.setdefault(key, {})
+            if len(record) > 1:
+                d[path[-1]] = record[1]
+            else:
+                d.pop(path[-1], None)
+        return data
+
     def _should_convert_to_stored_dict(self, key) -> bool:
         return True
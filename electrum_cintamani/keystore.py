@@ -27,6 +27,7 @@
 from unicodedata import normalize
 import hashlib
 import re
+import threading
 from typing import Tuple, TYPE_CHECKING, Union, Sequence, Optional, Dict, List, NamedTuple
 from functools import lru_cache
 from abc import ABC, abstractmethod
@@ -380,6 +381,18 @@ class MasterPublicKeyMixin(ABC):
         """
         pass
 
+    def derive_pubkeys(self, for_change: int, start: int, count: int) -> List[bytes]:
+        """Returns pubkeys at paths (for_change, start)..(for_change, start+count-1).
+        May raise CannotDerivePubkey.
+        """
+        return [self.derive_pubkey(for_change, n) for n in range(start, start + count)]
+
+    def fill_derived_pubkeys(self, for_change: int, count: int) -> None:
+        """Derives pubkeys at (for_change, 0..count-1) in bulk,
+        if the keystore keeps them in a cache.
+        """
+        pass
+
     def get_pubkey_derivation(
             self,
             pubkey: bytes,
@@ -444,6 +457,9 @@ class Xpub(MasterPublicKeyMixin):
         self.xpub_receive = None
         self.xpub_change = None
         self._xpub_bip32_node = None  # type: Optional[BIP32Node]
+        # pubkeys derived at (for_change, n), as hex by str(n) by str(for_change)
+        self._derived_pubkeys = {}  # type: Dict[str, Dict[str, str]]
+        self._derived_pubkeys_lock = threading.Lock()
 
         # "key origin" info (subclass should persist these):
         self._derivation_prefix = derivation_prefix  # type: Optional[str]
@@ -525,9 +541,7 @@ class Xpub(MasterPublicKeyMixin):
             self._derivation_prefix = derivation_prefix
         self.is_requesting_to_be_rewritten_to_wallet_file = True
 
-    @lru_cache(maxsize=None)
-    def derive_pubkey(self, for_change: int, n: int) -> bytes:
-        for_change = int(for_change)
+    def _get_xpub_for_change(self, for_change: int) -> str:
         xpub = self.xpub_change if for_change % 2 else self.xpub_receive
         if xpub is None:
             rootnode = self.get_bip32_node_for_xpub()
@@ -536,7 +550,51 @@ class Xpub(MasterPublicKeyMixin):
                 self.xpub_change = xpub
             else:
                 self.xpub_receive = xpub
-        return self.get_pubkey_from_xpub(xpub, (n,))
+        return xpub
+
+    def set_derived_pubkeys_cache(self, cache: Dict[str, Dict[str, str]]) -> None:
+        """Keep derived pubkeys in cache, e.g. the persisted dict
+        from WalletDB.get_derived_pubkeys.
+        """
+        with self._derived_pubkeys_lock:
+            self._derived_pubkeys = cache
+
+    def derive_pubkey(self, for_change: int, n: int) -> bytes:
+        return self.derive_pubkeys(for_change, n, 1)[0]
+
+    def _get_derived_pubkeys(self, for_change: int, start: int, end: int) -> List[str]:
+        """Returns the cached pubkeys at (for_change, start..end-1),
+        extending the cache up to end. The cache is kept contiguous from 0.
+        """
+        key = str(for_change)
+        if key not in self._derived_pubkeys:
+            self._derived_pubkeys[key] = {}
+        cached = self._derived_pubkeys[key]
+        num_cached = len(cached)
+        if num_cached < end:
+            xpub = self._get_xpub_for_change(for_change)
+            pubkeys = BIP32Node.from_xkey(xpub).derive_child_pubkeys(num_cached, end - num_cached)
+            for n, pk in enumerate(pubkeys, start=num_cached):
+                cached[str(n)] = pk.hex()
+        return [cached[str(n)] for n in range(start, end)]
+
+    def fill_derived_pubkeys(self, for_change: int, count: int) -> None:
+        with self._derived_pubkeys_lock:
+            self._get_derived_pubkeys(int(for_change), count, count)
+
+    def derive_pubkeys(self, for_change: int, start: int, count: int) -> List[bytes]:
+        for_change = int(for_change)
+        end = start + count
+        with self._derived_pubkeys_lock:
+            key = str(for_change)
+            num_cached = len(self._derived_pubkeys.get(key, []))
+            # only extend the cache contiguously, as addresses are created,
+            # not up to arbitrary indexes e.g. found in a PSBT
+            if 0 <= start <= num_cached:
+                cached = self._get_derived_pubkeys(for_change, start, end)
+                return [bytes.fromhex(pk) for pk in cached]
+        xpub = self._get_xpub_for_change(for_change)
+        return BIP32Node.from_xkey(xpub).derive_child_pubkeys(start, count)
 
     @classmethod
     def get_pubkey_from_xpub(self, xpub: str, sequence) -> bytes:
@@ -646,6 +704,14 @@ class PS_BIP32_KeyStore(BIP32_KeyStore):
         derivation = self.addr_deriv_offset*2 + int(for_change)
         return super().derive_pubkey(derivation, n)
 
+    def derive_pubkeys(self, for_change, start, count):
+        derivation = self.addr_deriv_offset*2 + int(for_change)
+        return super().derive_pubkeys(derivation, start, count)
+
+    def fill_derived_pubkeys(self, for_change, count):
+        derivation = self.addr_deriv_offset*2 + int(for_change)
+        return super().fill_derived_pubkeys(derivation, count)
+
     def get_private_key(self, sequence, password):
         derivation = self.addr_deriv_offset*2 + int(sequence[0] % 2)
         _sequence = [derivation, *sequence[1:]]
@@ -1391,7 +1391,9 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.interfaces = {}
         self._connecting_ifaces.clear()
         self._closing_ifaces.clear()
-        if not full_shutdown:
+        if full_shutdown:
+            blockchain.flush_headers()
+        else:
             util.trigger_callback('network_updated')
 
     async def _ensure_there_is_a_main_interface(self):
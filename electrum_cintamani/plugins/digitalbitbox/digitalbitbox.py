@@ -23,10 +23,11 @@ from electrum_cintamani import ecc
 from electrum_cintamani.ecc import msg_magic
 from electrum_cintamani.wallet import Standard_Wallet
 from electrum_cintamani import constants
-from electrum_cintamani.transaction import Transaction, PartialTransaction, PartialTxInput
+from electrum_cintamani.transaction import (Transaction, PartialTransaction, PartialTxInput,
+                                            SighashPreimages)
 from electrum_cintamani.i18n import _
 from electrum_cintamani.keystore import Hardware_KeyStore
-from electrum_cintamani.util import to_string, UserCancelled, UserFacingException, bfh
+from electrum_cintamani.util import to_string, UserCancelled, UserFacingException
 from electrum_cintamani.base_wizard import ScriptTypeNotSupported, HWD_SETUP_NEW_WALLET
 from electrum_cintamani.network import Network
 from electrum_cintamani.logging import get_logger
@@ -526,6 +527,7 @@ class DigitalBitbox_KeyStore(Hardware_KeyStore):
             pubkeyarray = []
 
             # Build hasharray from inputs
+            preimages = SighashPreimages(tx)
             for i, txin in enumerate(tx.inputs()):
                 if txin.is_coinbase_input():
                     self.give_error("Coinbase not supported") # should never happen
@@ -537,7 +539,7 @@ class DigitalBitbox_KeyStore(Hardware_KeyStore):
                 if not inputPath:
                     self.give_error("No matching pubkey for sign_transaction")  # should never happen
                 inputPath = convert_bip32_intpath_to_strpath(inputPath)
-                inputHash = sha256d(bfh(tx.serialize_preimage(i)))
+                inputHash = preimages.sighash(i)
                 hasharray_i = {'hash': to_hexstr(inputHash), 'keypath': inputPath}
                 hasharray.append(hasharray_i)
                 inputhasharray.append(inputHash)
@@ -31,6 +31,7 @@ import random
 import time
 import zlib
 from enum import IntEnum
+from typing import Tuple
 
 from . import ecc
 from .util import (profiler, InvalidPassword, WalletFileException, bfh, standardize_path,
@@ -55,6 +56,14 @@ class StorageEncryptionVersion(IntEnum):
 class StorageReadWriteError(Exception): pass
 
 
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+
+def is_sqlite_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
 # TODO: Rename to Storage
 class WalletStorage(Logger):
 
@@ -70,38 +79,35 @@ class WalletStorage(Logger):
             test_read_write_permissions(self.path)
         except IOError as e:
             raise StorageReadWriteError(e) from e
-        if self.file_exists():
+        self._is_sqlite = self.file_exists() and is_sqlite_file(self.path)
+        if self._is_sqlite:
+            # read by SqliteWalletDB itself
+            self.raw = ''
+            self._encryption_version = StorageEncryptionVersion.PLAINTEXT
+        elif self.file_exists():
             with open(self.path, "r", encoding='utf-8') as f:
                 self.raw = f.read()
             self._encryption_version = self._init_encryption_version()
         else:
             self.raw = ''
             self._encryption_version = StorageEncryptionVersion.PLAINTEXT
+        # size of the file as last written by write(); anything after
+        # that was added by append()
+        self._snapshot_size = len(self.raw)
+        self._num_writes = 0
 
     def read(self):
         return self.decrypted if self.is_encrypted() else self.raw
 
+    def is_sqlite(self) -> bool:
+        return self._is_sqlite
+
     def write(self, data: str) -> None:
-        s = self.encrypt_before_writing(data)
-        temp_path = "%s.tmp.%s" % (self.path, os.getpid())
         write_attempts = self.write_attempts
         while write_attempts > 0:
-            with open(temp_path, "w", encoding='utf-8') as f:
-                f.write(s)
-                f.flush()
-                os.fsync(f.fileno())
-
-            try:
-                mode = os.stat(self.path).st_mode
-            except FileNotFoundError:
-                mode = stat.S_IREAD | stat.S_IWRITE
-
-            # assert that wallet file does not exist,
-            # to prevent wallet corruption (see issue #5082)
-            if not self.file_exists():
-                assert not os.path.exists(self.path)
+            temp_path, size = self.write_temp_file(data)
             try:
-                os.replace(temp_path, self.path)
+                self.replace_with_temp_file(temp_path, size)
             except PermissionError:
                 # file can be temporarily blocked by windows antivirus software
                 time.sleep(0.9+0.2*random.random())
@@ -111,11 +117,81 @@ class WalletStorage(Logger):
                 self.logger.error(f"os.replace PermissionError {self.path}, "
                                   f"left {write_attempts} write attempts")
                 continue
-            os.chmod(self.path, mode)
-            self._file_exists = True
-            self.logger.info(f"saved {self.path}")
             break
 
+    def write_temp_file(self, data: str, *, suffix: str = 'tmp') -> Tuple[str, int]:
+        """Encrypts data and writes it next to our file, for
+        replace_with_temp_file(). Returns the path and size written.
+        """
+        assert not self._is_sqlite
+        s = self.encrypt_before_writing(data)
+        temp_path = "%s.%s.%s" % (self.path, suffix, os.getpid())
+        with open(temp_path, "w", encoding='utf-8') as f:
+            f.write(s)
+            f.flush()
+            os.fsync(f.fileno())
+        return temp_path, len(s)
+
+    def get_journal_mark(self) -> Tuple[int, int]:
+        """Identifies the current end of the file, for replace_with_temp_file()."""
+        return self._num_writes, os.path.getsize(self.path)
+
+    def get_snapshot_size(self) -> int:
+        return self._snapshot_size
+
+    def get_journal_size(self) -> int:
+        """Returns how much was appended since the last write."""
+        return os.path.getsize(self.path) - self._snapshot_size
+
+    def replace_with_temp_file(self, temp_path: str, size: int, *,
+                               journal_mark: Tuple[int, int] = None) -> bool:
+        """Replaces our file with the one at temp_path.
+        With journal_mark, what was appended to our file since then is kept,
+        unless the file was replaced since; then nothing is done.
+        Raises PermissionError if the file is blocked, see write().
+        """
+        if journal_mark is not None:
+            num_writes, journal_from = journal_mark
+            if num_writes != self._num_writes:
+                os.unlink(temp_path)
+                return False
+            with open(self.path, "r", encoding='utf-8') as f:
+                f.seek(journal_from)
+                journal = f.read()
+            with open(temp_path, "a", encoding='utf-8') as f:
+                f.write(journal)
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            mode = os.stat(self.path).st_mode
+        except FileNotFoundError:
+            mode = stat.S_IREAD | stat.S_IWRITE
+
+        # assert that wallet file does not exist,
+        # to prevent wallet corruption (see issue #5082)
+        if not self.file_exists():
+            assert not os.path.exists(self.path)
+        os.replace(temp_path, self.path)
+        os.chmod(self.path, mode)
+        self._file_exists = True
+        self._snapshot_size = size
+        self._num_writes += 1
+        self.logger.info(f"saved {self.path}")
+        return True
+
+    def append(self, data: str) -> None:
+        """Appends data to the file. With encryption, data is encrypted on
+        its own, on a line of its own.
+        """
+        assert self.file_exists() and not self._is_sqlite
+        s = data
+        if self.pubkey:
+            s = '\n' + self.encrypt_before_writing(data)
+        with open(self.path, "a", encoding='utf-8') as f:
+            f.write(s)
+            f.flush()
+            os.fsync(f.fileno())
+
     def file_exists(self) -> bool:
         return self._file_exists
 
@@ -151,7 +227,7 @@ class WalletStorage(Logger):
 
     def _init_encryption_version(self):
         try:
-            magic = base64.b64decode(self.raw)[0:4]
+            magic = base64.b64decode(self.raw.split('\n', 1)[0])[0:4]
             if magic == b'BIE1':
                 return StorageEncryptionVersion.USER_PASSWORD
             elif magic == b'BIE2':
@@ -182,8 +258,9 @@ class WalletStorage(Logger):
         ec_key = self.get_eckey_from_password(password)
         if self.raw:
             enc_magic = self._get_encryption_magic()
-            s = zlib.decompress(ec_key.decrypt_message(self.raw, enc_magic))
-            s = s.decode('utf8')
+            # the file, and each piece appended to it
+            s = ''.join(zlib.decompress(ec_key.decrypt_message(part, enc_magic)).decode('utf8')
+                        for part in self.raw.split('\n'))
         else:
             s = ''
         self.pubkey = ec_key.get_public_key_hex()
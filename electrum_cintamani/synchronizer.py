@@ -24,7 +24,7 @@
 # SOFTWARE.
 import asyncio
 import hashlib
-from typing import Dict, List, TYPE_CHECKING, Tuple, Set
+from typing import Dict, List, TYPE_CHECKING, Tuple, Set, Optional
 from collections import defaultdict
 import logging
 
@@ -158,6 +158,9 @@ class Synchronizer(SynchronizerBase):
     '''
     def __init__(self, wallet: 'AddressSynchronizer'):
         self.wallet = wallet
+        # addr -> (history as stored in the db, its status). The db replaces
+        # the stored history object whenever it changes.
+        self._status_cache = {}  # type: Dict[str, Tuple[List, Optional[str]]]
         SynchronizerBase.__init__(self, wallet.network)
 
     def _reset(self):
@@ -175,9 +178,15 @@ class Synchronizer(SynchronizerBase):
                 and not self.requested_tx
                 and not self._stale_histories)
 
-    async def _on_address_status(self, addr, status):
+    def _get_status(self, addr: str) -> Optional[str]:
         history = self.wallet.db.get_addr_history(addr)
-        if history_status(history) == status:
+        cached = self._status_cache.get(addr)
+        if cached is None or cached[0] is not history:
+            cached = self._status_cache[addr] = (history, history_status(history))
+        return cached[1]
+
+    async def _on_address_status(self, addr, status):
+        if self._get_status(addr) == status:
             return
         # No point in requesting history twice for the same announced status.
         # However if we got announced a new status, we should request history again:
@@ -209,10 +218,16 @@ class Synchronizer(SynchronizerBase):
             self._stale_histories[addr] = await self.taskgroup.spawn(disconnect_if_still_stale)
         else:
             self._stale_histories.pop(addr, asyncio.Future()).cancel()
+            # only entries that are new or at a new height need looking at
+            old_hist = set(map(tuple, self.wallet.db.get_addr_history(addr)))
+            new_hist = [item for item in hist if item not in old_hist]
+            new_tx_hashes = set(tx_hash for tx_hash, height in new_hist)
+            tx_fees = {tx_hash: fee for tx_hash, fee in tx_fees.items() if tx_hash in new_tx_hashes}
             # Store received history
             self.wallet.receive_history_callback(addr, hist, tx_fees)
+            self._status_cache[addr] = (self.wallet.db.get_addr_history(addr), status)
             # Request transactions we don't have
-            await self._request_missing_txs(hist)
+            await self._request_missing_txs(new_hist)
 
         # Remove request; this allows up_to_date to be True
         self.requested_histories.discard((addr, status))
@@ -7,7 +7,7 @@ from electrum_cintamani.bitcoin import (public_key_to_p2pkh, address_from_privat
                                    deserialize_privkey, serialize_privkey,
                                    is_b58_address, address_to_scripthash, is_minikey,
                                    is_compressed_privkey, EncodeBase58Check, DecodeBase58Check,
-                                   script_num_to_hex, push_script, add_number_to_script, int_to_hex,
+                                   script_num_to_hex, push_script, add_number_to_script, int_to_hex, int_to_le_bytes,
                                    opcodes, base_encode, base_decode, BitcoinException)
 from electrum_cintamani import bip32
 from electrum_cintamani.bip32 import (BIP32Node, convert_bip32_intpath_to_strpath,
@@ -343,6 +343,14 @@ class Test_bitcoin(ElectrumTestCase):
         with self.assertRaises(OverflowError): int_to_hex(65536, 2)
         with self.assertRaises(OverflowError): int_to_hex(-32769, 2)
 
+    def test_int_to_le_bytes(self):
+        for i, length in ((0, 1), (-1, 1), (127, 2), (-128, 1), (-32768, 2),
+                          (65535, 2), (2**32 - 1, 4), (-2**31, 4)):
+            self.assertEqual(int_to_hex(i, length), int_to_le_bytes(i, length).hex())
+        with self.assertRaises(OverflowError): int_to_le_bytes(256, 1)
+        with self.assertRaises(OverflowError): int_to_le_bytes(-129, 1)
+        with self.assertRaises(OverflowError): int_to_le_bytes(-257, 1)
+
     def test_var_int(self):
         for i in range(0xfd):
             self.assertEqual(var_int(i), "{:02x}".format(i))
@@ -488,6 +496,16 @@ class Test_xprv_xpub(ElectrumTestCase):
         self.assertEqual("xpub6BJA1jSqiukeaesWfxe6sNK9CCGaujFFSJLomWHprUL9DePQ4JDkM5d88n49sMGJxrhpjazuXYWdMf17C9T5XnxkopaeS7jGk1GyyVziaMt", xpub)
         self.assertEqual("xprv9xJocDuwtYCMNAo3Zw76WENQeAS6WGXQ55RCy7tDJ8oALr4FWkuVoHJeHVAcAqiZLE7Je3vZJHxspZdFHfnBEjHqU5hG1Jaj32dVoS6XLT1", xprv)
 
+    def test_derive_child_pubkeys(self):
+        node = BIP32Node.from_xkey(self.xprv_xpub[0]['xpub'])
+        pubkeys = node.derive_child_pubkeys(5, 10)
+        self.assertEqual(10, len(pubkeys))
+        for i, pubkey in enumerate(pubkeys):
+            child = node.subkey_at_public_derivation([5 + i])
+            self.assertEqual(child.eckey.get_public_key_bytes(compressed=True), pubkey)
+        with self.assertRaises(Exception):
+            node.derive_child_pubkeys(bip32.BIP32_PRIME - 1, 2)
+
     def test_xpub_from_xprv(self):
         """We can derive the xpub key from a xprv."""
         for xprv_details in self.xprv_xpub:
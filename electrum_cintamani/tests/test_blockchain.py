@@ -5,6 +5,7 @@ import os
 from electrum_cintamani import constants, blockchain
 from electrum_cintamani.simple_config import SimpleConfig
 from electrum_cintamani.blockchain import Blockchain, deserialize_header, hash_header
+from electrum_cintamani.bitcoin import hash_encode
 from electrum_cintamani.util import bh2u, bfh, make_dir
 
 from . import ElectrumTestCase
@@ -61,6 +62,7 @@ class TestBlockchain(ElectrumTestCase):
         make_dir(os.path.join(self.data_dir, 'forks'))
         self.config = SimpleConfig({'electrum_path': self.data_dir})
         blockchain.blockchains = {}
+        blockchain.reset_hash_index()
 
     def _append_header(self, chain: Blockchain, header: dict):
         self.assertTrue(chain.can_connect(header))
@@ -384,6 +386,127 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual([chain_u], self.get_chains_that_contain_header_helper(self.HEADERS['O']))
         self.assertEqual([chain_z, chain_l], self.get_chains_that_contain_header_helper(self.HEADERS['I']))
 
+    def test_unsynced_headers_recovered_after_crash(self):
+        self.config.set_key('headers_fsync_count', 3)
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        journal = blockchain.get_journal_path(self.config, chain_u.path())
+        for name in 'ABC':
+            self._append_header(chain_u, self.HEADERS[name])
+        self.assertFalse(os.path.exists(journal))  # batch of 3 got fsynced
+        for name in 'DE':
+            self._append_header(chain_u, self.HEADERS[name])
+        self.assertTrue(os.path.exists(journal))
+        self.assertEqual(4, chain_u.height())
+        # simulate a system crash that lost the contents of the last header
+        chain_u._headers_file.close()
+        chain_u._headers_file = None
+        with open(chain_u.path(), 'rb+') as f:
+            f.seek(4 * 80 + 4)
+            f.write(bytes(32))
+        chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        self.assertFalse(os.path.exists(journal))
+        self.assertEqual(3, chain_u.height())
+        self.assertEqual(self.HEADERS['D'], chain_u.read_header(3))
+
+    def test_index_follows_headers_through_swap(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEFOPQR':
+            self._append_header(chain_u, self.HEADERS[name])
+        chain_l = chain_u.fork(self.HEADERS['G'])
+        for name in 'HIJK':
+            self._append_header(chain_l, self.HEADERS[name])
+        self.assertIsNone(chain_l.parent)  # swapped
+        for b in (chain_u, chain_l):
+            for height in range(b.height() + 1):
+                header_hash, chainwork = b._read_index(height)
+                self.assertEqual(hash_header(b.read_header(height)), hash_encode(header_hash))
+                self.assertGreater(chainwork, 0)
+            self.assertEqual(b.size(), b._get_index().size())
+        # the index is reopened along with the headers
+        chain_u = Blockchain(
+            config=self.config, forkpoint=6, parent=chain_l,
+            forkpoint_hash=chain_u._forkpoint_hash, prev_hash=chain_u._prev_hash)
+        self.assertEqual(hash_header(self.HEADERS['R']), chain_u.get_hash(9))
+        self.assertIsNotNone(chain_u._read_index(9))
+        # an index that does not match the headers gets dropped
+        chain_l.close_headers_file()
+        with open(chain_l.path(), 'rb+') as f:
+            f.truncate(10 * 80)
+            f.seek(0, os.SEEK_END)
+            f.write(bfh(blockchain.serialize_header(self.HEADERS['Q'])))
+        chain_l = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        self.assertIsNone(chain_l._read_index(10))
+
+    def test_hash_index(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEFOPQR':
+            self._append_header(chain_u, self.HEADERS[name])
+        chain_l = chain_u.fork(self.HEADERS['G'])
+        for name in 'HIJK':
+            self._append_header(chain_l, self.HEADERS[name])
+        # chains were swapped; the index follows
+        self.assertEqual((chain_l, 6), blockchain._hash_index[hash_header(self.HEADERS['G'])])
+        self.assertEqual((chain_u, 6), blockchain._hash_index[hash_header(self.HEADERS['O'])])
+        self.assertIs(chain_l, blockchain.check_header(self.HEADERS['A']))
+        self.assertIs(chain_l, blockchain.check_header(self.HEADERS['K']))
+        self.assertIs(chain_u, blockchain.check_header(self.HEADERS['R']))
+        self.assertIsNone(blockchain.check_header(self.HEADERS['S']))
+        self.assertIs(chain_u, blockchain.can_connect(self.HEADERS['S']))
+        self.assertIs(chain_l, blockchain.can_connect(self.HEADERS['L']))
+        self.assertIsNone(blockchain.can_connect(self.HEADERS['T']))
+        # rebuilt on startup
+        for b in (chain_u, chain_l):
+            b.close_headers_file()
+        blockchain.blockchains = {}
+        blockchain.read_blockchains(self.config)
+        chain_l = blockchain.get_best_chain()
+        chain_u, = chain_l.get_direct_children()
+        self.assertEqual((chain_u, 9), blockchain._hash_index[hash_header(self.HEADERS['R'])])
+        self.assertIs(chain_l, blockchain.check_header(self.HEADERS['K']))
+        # not in any chain anymore
+        chain_u.write(b'', 2 * 80)
+        self.assertIsNone(blockchain.check_header(self.HEADERS['R']))
+        self.assertNotIn(hash_header(self.HEADERS['R']), blockchain._hash_index)
+        self.assertIs(chain_u, blockchain.check_header(self.HEADERS['P']))
+
+    def test_pow_hash_raw_headers(self):
+        names = 'ABCDEFOPQRSTU'
+        data = b''.join(bfh(blockchain.serialize_header(self.HEADERS[name])) for name in names)
+        self.assertEqual([hash_header(self.HEADERS[name]) for name in names],
+                         blockchain.pow_hash_raw_headers(data))
+
+    def test_read_header_follows_file_changes(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        self.assertIsNone(chain_u.read_header(0))
+        self._append_header(chain_u, self.HEADERS['A'])
+        self._append_header(chain_u, self.HEADERS['B'])
+        self.assertEqual(self.HEADERS['B'], chain_u.read_header(1))
+        # overwriting the tip truncates the file; the mapping must follow
+        chain_u.write(bfh(blockchain.serialize_header(self.HEADERS['A'])), 0)
+        self.assertEqual(0, chain_u.height())
+        self.assertIsNone(chain_u.read_header(1))
+        self.assertEqual(self.HEADERS['A'], chain_u.read_header(0))
+        chain_u.close_headers_file()
+        os.unlink(chain_u.path())
+        chain_u.update_size()
+        self.assertEqual(-1, chain_u.height())
+
 
 class TestVerifyHeader(ElectrumTestCase):
 
@@ -417,3 +540,41 @@ class TestVerifyHeader(ElectrumTestCase):
         with self.assertRaises(Exception):
             self.header["nonce"] = 42
             Blockchain.verify_header(self.header, self.prev_hash, self.target)
+
+
+class TestDGWWindow(ElectrumTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.checkpoints = constants.read_json_gz('checkpoints.json.gz', [])
+
+    def _headers_of_checkpoint(self, index):
+        # dgw3 headers are stored from the last height of the chunk downwards
+        return [deserialize_header(bfh(raw_header), height)
+                for height, raw_header in reversed(self.checkpoints[index][2])]
+
+    def test_targets_match_mainnet_checkpoints(self):
+        for index in (34, 100, 400, len(self.checkpoints) - 1):
+            headers = self._headers_of_checkpoint(index)
+            window = blockchain.DGWWindow()
+            for header in headers[:-1]:
+                window.push(header)
+            last_header = headers[-1]
+            target = window.get_target(last_header['block_height'])
+            self.assertEqual(self.checkpoints[index][1], target)
+            self.assertEqual(last_header['bits'], Blockchain.target_to_bits(target))
+
+    def test_window_slides(self):
+        headers = self._headers_of_checkpoint(400) + self._headers_of_checkpoint(401)
+        window = blockchain.DGWWindow()
+        for header in headers[:26]:
+            window.push(header)
+        # gap in heights: window has to be filled up again
+        self.assertEqual(1, len(window._items))
+        with self.assertRaises(blockchain.MissingHeader):
+            window.get_target(headers[25]['block_height'] + 1)
+        for header in headers[26:-1]:
+            window.push(header)
+        self.assertEqual(headers[-1]['bits'],
+                         Blockchain.target_to_bits(window.get_target(headers[-1]['block_height'])))
@@ -1,10 +1,11 @@
-from ipaddress import IPv6Address
+from ipaddress import IPv4Address, IPv6Address
 
 from electrum_cintamani.cintamani_msg import (DashVersionMsg, DashDsaMsg, DashDssuMsg,
                                     DashDsqMsg, DashDsiMsg, DashDsfMsg,
-                                    DashDssMsg, DashDscMsg)
+                                    DashDssMsg, DashDscMsg, DashSMLEntry,
+                                    DashQFCommitMsg)
 from electrum_cintamani.cintamani_tx import TxOutPoint, CTxIn, CTxOut
-from electrum_cintamani.transaction import Transaction
+from electrum_cintamani.transaction import Transaction, SerializationError
 from electrum_cintamani.util import bfh, bh2u
 
 from . import TestCaseForTestnet
@@ -90,6 +91,31 @@ class TestDashMsg(TestCaseForTestnet):
         assert msg.messageID == 21
         assert bh2u(msg.serialize()) == DSC_MSG
 
+    def test_sml_entry(self):
+        sml_entry = DashSMLEntry(b'\x01' * 32, b'\x02' * 32,
+                                 IPv4Address('127.0.0.1'), 19999,
+                                 b'\x03' * 48, b'\x04' * 20, 1)
+        raw = sml_entry.serialize(as_hex=True)
+        assert len(raw) == 151 * 2
+        msg = DashSMLEntry.from_hex(raw)
+        assert msg.ipAddress == IPv6Address('::ffff:127.0.0.1')
+        assert msg.port == 19999
+        assert type(msg.proRegTxHash) == bytes
+        assert msg.serialize(as_hex=True) == raw
+        assert msg.as_dict() == sml_entry.as_dict()
+        with self.assertRaises(SerializationError):
+            DashSMLEntry.from_hex(raw[:-2])
+
+    def test_qfcommit_msg(self):
+        qfcommit = DashQFCommitMsg(1, 100, b'\x01' * 32, 10, b'\xff\x03',
+                                   10, b'\xff\x03', b'\x02' * 48,
+                                   b'\x03' * 32, b'\x04' * 96, b'\x05' * 96)
+        raw = bh2u(qfcommit.serialize())
+        msg = DashQFCommitMsg.from_hex(raw)
+        for f in DashQFCommitMsg.fields:
+            assert getattr(msg, f) == getattr(qfcommit, f)
+        assert bh2u(msg.serialize()) == raw
+
 
 VERSION_MSG = ('47120100050000000000000053cd705d0000000000000000'
                '000000000000000000000000000000000000000000000500'
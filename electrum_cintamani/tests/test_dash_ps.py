@@ -611,6 +611,35 @@ class PSWalletTestCase(TestCaseForTestnet):
         assert wallet.get_balance(include_ps=False, min_rounds=0) == \
             (500005000, 0, 0)
 
+    def test_get_balance_cache(self):
+        wallet = self.wallet
+        psman = wallet.psman
+        coro = psman.find_untracked_ps_txs(log=False)
+        asyncio.get_event_loop().run_until_complete(coro)
+        assert wallet.get_balance(include_ps=False, min_rounds=2) == \
+            (384803848, 0, 0)
+        assert (False, 2) in wallet._get_balance_cache
+
+        # balance of denom address is cached split by rounds
+        outpoint, denom = sorted(wallet.db.get_ps_denoms(min_rounds=2).items())[0]
+        addr, value, rounds = denom
+        assert rounds == 2
+        balance_by_rounds = wallet._get_addr_balance_cache[addr]
+        assert balance_by_rounds[2][0] >= value
+
+        # changes of ps_denoms invalidate cache
+        psman.pop_ps_denom(outpoint)
+        assert addr not in wallet._get_addr_balance_cache
+        assert wallet._get_balance_cache == {}
+        assert wallet.get_balance(include_ps=False, min_rounds=2) == \
+            (384803848 - value, 0, 0)
+        psman.add_ps_denom(outpoint, (addr, value, 3))
+        assert wallet.get_balance(include_ps=False, min_rounds=3) == \
+            (value, 0, 0)
+        assert wallet.get_balance(include_ps=False, min_rounds=2) == \
+            (384803848, 0, 0)
+        assert wallet.get_balance() == (1484831773, 0, 0)
+
     def test_get_ps_addresses(self):
         C_RNDS = PSCoinRounds.COLLATERAL
         assert self.wallet.db.get_ps_addresses() == set()
@@ -2,7 +2,7 @@ import asyncio
 from pprint import pprint
 
 from electrum_cintamani import transaction
-from electrum_cintamani.cintamani_tx import DashTxError, TxOutPoint, ProTxBase
+from electrum_cintamani.cintamani_tx import DashTxError, TxOutPoint, ProTxBase, tx_header_to_tx_type
 from electrum_cintamani.cintamani_tx import (SPEC_PRO_REG_TX, SPEC_PRO_UP_SERV_TX,
                                    SPEC_PRO_UP_REG_TX, SPEC_PRO_UP_REV_TX,
                                    SPEC_CB_TX, SPEC_SUB_TX_REGISTER,
@@ -712,6 +712,16 @@ class TestDashSpecTxSerialization(SequentialTestCase):
         ser = tx.serialize()
         assert ser == WRONG_SPEC_TX
 
+    def test_cintamani_tx_header_without_deserialize(self):
+        for raw, version, tx_type in [(V2_TX, 2, 0), (CB_TX, 3, 5),
+                                      (WRONG_SPEC_TX, 12255234, 0),
+                                      (UNKNOWN_SPEC_TX, 3, 187)]:
+            tx = transaction.Transaction(raw)
+            assert tx.version == version
+            assert tx.tx_type == tx_type
+            assert tx._inputs is None  # not deserialized
+            assert tx_header_to_tx_type(bfh(raw[:8])) == tx_type
+
     def test_deserialize_transaction_v2(self):
         cmds = Commands(config=None)
         deser = cmds._run('deserialize', (V2_TX, ))
@@ -116,6 +116,38 @@ class TestNetwork(ElectrumTestCase):
         self.assertEqual(('catchup', 7), asyncio.get_event_loop().run_until_complete(ifa.sync_until(8, next_height=6)))
         self.assertEqual(self.interface.q.qsize(), 0)
 
+    def _mock_chunk_pipeline(self, bad_index=None):
+        ifa = self.interface
+        connected = []
+        async def fetch_chunk(index, size):
+            # later chunks arrive first
+            await asyncio.sleep(0.01 * (10 - index))
+            return '00' * 80 * size, ['%064x' % index] * size
+        def connect_chunk(idx, hexdata, header_hashes):
+            num_chunks = -(-len(hexdata) // (2 * 80 * 2016))
+            if bad_index is not None and idx <= bad_index < idx + num_chunks:
+                return False
+            connected.append((idx, num_chunks))
+            return True
+        ifa._fetch_chunk = fetch_chunk
+        ifa.blockchain.connect_chunk = connect_chunk
+        return connected
+
+    def test_chunk_pipeline_connects_in_order(self):
+        connected = self._mock_chunk_pipeline()
+        ifa = self.interface
+        res = asyncio.get_event_loop().run_until_complete(ifa.request_chunks_pipelined(100, 5 * 2016 + 10))
+        self.assertEqual((True, 5 * 2016 + 11), res)
+        # out of order responses got buffered and connected in batches
+        self.assertEqual([(0, 4), (4, 2)], connected)
+
+    def test_chunk_pipeline_stops_at_chunk_that_does_not_connect(self):
+        connected = self._mock_chunk_pipeline(bad_index=2)
+        ifa = self.interface
+        res = asyncio.get_event_loop().run_until_complete(ifa.request_chunks_pipelined(100, 5 * 2016 + 10))
+        self.assertEqual((False, 2 * 2016), res)
+        self.assertEqual([(0, 1), (1, 1)], connected)
+
 
 if __name__=="__main__":
     constants.set_regtest()
@@ -1,13 +1,17 @@
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 from typing import NamedTuple, Union
 
 from electrum_cintamani import transaction, bitcoin
 from electrum_cintamani.transaction import (convert_raw_tx_to_hex, tx_from_any, Transaction,
                                        PartialTransaction, TxOutpoint, PartialTxInput,
-                                       PartialTxOutput)
+                                       PartialTxOutput, SighashPreimages)
 from electrum_cintamani.util import bh2u, bfh
 from electrum_cintamani.bitcoin import (deserialize_privkey, opcodes,
                                    construct_script)
 from electrum_cintamani.ecc import ECPrivkey
+from electrum_cintamani.crypto import sha256d
 
 from . import ElectrumTestCase, TestCaseForTestnet
 
@@ -74,6 +78,18 @@ class TestBCDataStream(ElectrumTestCase):
         self.assertEqual(b'\x01\x00', s.read_bytes(2))
         self.assertFalse(s.can_read_more())
 
+    def test_read_struct(self):
+        s = transaction.BCDataStream()
+        s.write(memoryview(b'\x01\x02\x00abc'))
+        self.assertEqual((1, 2, b'ab'), s.read_struct(struct.Struct('<BH2s')))
+        with self.assertRaises(transaction.SerializationError):
+            s.read_uint16()
+        self.assertEqual(b'c', s.read_bytes(1))
+        self.assertEqual(bytes, type(s.read_bytes(0)))
+        s.write_uint32(7)
+        self.assertEqual(7, s.read_uint32())
+        self.assertFalse(s.can_read_more())
+
 
 class TestTransaction(ElectrumTestCase):
 
@@ -124,6 +140,28 @@ class TestTransaction(ElectrumTestCase):
         self.assertEqual(tx.estimated_weight(), 772)
         self.assertEqual(tx.estimated_size(), 193)
 
+    def test_estimated_size_matches_serialization(self):
+        txins = []
+        for i, (script_type, pubkey_size, num_pubkeys, num_sig) in enumerate([
+                ('p2pkh', 33, 1, 1), ('p2pkh', 65, 1, 1), ('p2pk', 33, 1, 1),
+                ('p2sh', 33, 3, 2), ('p2sh', 65, 15, 15), ('address', 33, 1, 1)]):
+            txin = PartialTxInput(prevout=TxOutpoint(txid=bytes([i + 1]) * 32, out_idx=i))
+            txin.script_type = script_type
+            txin.pubkeys = [b'\x02' * pubkey_size] * num_pubkeys
+            txin.num_sig = num_sig
+            txin._trusted_address = 'XeNTG4aihv1ru8xmaoiQnToSi8hLiTTNbh'
+            txins.append(txin)
+        txout = PartialTxOutput.from_address_and_value('XeNTG4aihv1ru8xmaoiQnToSi8hLiTTNbh', 1000)
+        for txin in txins:
+            tx = PartialTransaction.from_io([txin], [txout])
+            self.assertEqual(len(tx.serialize_to_network_bytes(estimate_size=True)),
+                             tx.estimated_total_size())
+            self.assertEqual(len(tx.serialize_input(txin, tx.input_script(txin, estimate_size=True))) // 2,
+                             tx.estimated_input_size(txin))
+        tx = PartialTransaction.from_io(txins * 50, [txout] * 300)
+        self.assertEqual(len(tx.serialize_to_network_bytes(estimate_size=True)),
+                         tx.estimated_total_size())
+
     def test_estimated_output_size(self):
         estimated_output_size = transaction.Transaction.estimated_output_size_for_address
         self.assertEqual(estimated_output_size('XeNTG4aihv1ru8xmaoiQnToSi8hLiTTNbh'), 34)
@@ -188,6 +226,19 @@ class TestTransaction(ElectrumTestCase):
         self.assertEqual(raw_hex,
                          tx.serialize_as_bytes().hex())
 
+    def test_txid_from_raw_bytes(self):
+        txid = '8334c637900f1d2cd1d8abbd94a676e0ac92c2a20d19b3ca210a0f538ab157c8'
+        tx = Transaction(bfh(signed_blob))
+        self.assertEqual(txid, tx.txid())
+        self.assertIsNone(tx._inputs)  # not deserialized
+        self.assertEqual(txid, Transaction(memoryview(bfh(signed_blob))).txid())
+        tx = Transaction(signed_blob)
+        tx.deserialize()
+        self.assertEqual(txid, tx.txid())
+        tx.invalidate_ser_cache()
+        self.assertEqual(txid, tx.txid())
+        self.assertEqual(bfh(signed_blob), tx.serialize_as_bytes())
+
     def test_tx_serialize_methods_for_psbt_that_is_ready_to_be_finalized(self):
         raw_hex_psbt = "70736274ff01007702000000016c82cccf7d23fd92c9c0d99cf3dac96652f99a334a94ab24b057e05c822f8f5f0000000000fdffffff02a0860100000000001976a9140c6a60ae7877c1f989bb417a317639c4951fe11d88ac8cb60d00000000001976a914f47625a81dc935bc7a2acc06f4c073379726b1a888acfa6d1c00000100bf0200000001888c2d3f656acb82924b43fb6c04575b1a2b2831927fc00ec00d70308ecef6b4000000006a473044022079a08c0ea19d2134b95555d936a81029bef2582c04167fe678cf5124677e4be5022053689997655e0e94316fee4578d4b61ba3d12e4b172e7b6ee5532c1ee48ccc86012102313d82fabd55dd4022b7ef0c70cd4b319171a1f5c2f45b0f7628df31abf4e7b3feffffff01873d0f00000000001976a91477a46eed57f922c9e32f3136b55ee480f0136f7788ac8ab2180001076a473044022010d8084bc680d0feb627febf0a47dfd0c223dcdff4057eebb6183f90e84208ba02205b349f86ba5f49d81473e1d6cf8f34493545416dd611499fd99d65a0ff9b1c33012102313d82fabd55dd4022b7ef0c70cd4b319171a1f5c2f45b0f7628df31abf4e7b30108010000220202ca132bb834551008e39d9f29a822c47a4825b4619bbe12deab51c9dc98e382400c9c5d0c00000000000100000000220202f5d5325601be8f0164a8aadbd5c1e8aa86aaeb587531201dd61ddcceefc70bfd0c9c5d0c00010000000000000000"
         raw_hex_network_tx = "02000000016c82cccf7d23fd92c9c0d99cf3dac96652f99a334a94ab24b057e05c822f8f5f000000006a473044022010d8084bc680d0feb627febf0a47dfd0c223dcdff4057eebb6183f90e84208ba02205b349f86ba5f49d81473e1d6cf8f34493545416dd611499fd99d65a0ff9b1c33012102313d82fabd55dd4022b7ef0c70cd4b319171a1f5c2f45b0f7628df31abf4e7b3fdffffff02a0860100000000001976a9140c6a60ae7877c1f989bb417a317639c4951fe11d88ac8cb60d00000000001976a914f47625a81dc935bc7a2acc06f4c073379726b1a888acfa6d1c00"
@@ -247,6 +298,7 @@ class TestTransaction(ElectrumTestCase):
         tx = transaction.Transaction(raw_tx)
         self.assertEqual(txid, tx.txid())
         self.assertEqual(raw_tx, tx.serialize())
+        self.assertEqual(raw_tx, tx.serialize_to_network())
         self.assertTrue(tx.estimated_size() >= 0)
 
     def test_txid_coinbase_to_p2pk(self):
@@ -667,3 +719,66 @@ class TestTransactionTestnet(TestCaseForTestnet):
         # so txid there is: a8110bbdd40d65351f615897d98c33cbe33e4ebedb4ba2fc9e8c644423dadc93
         self.assertEqual('5df1c6f7711f2a98d50fd141833f83379d26be06bfea96c1175e36d4330fabe5',
                          tx.txid())
+
+    def test_sighash_preimages(self):
+        privkeys = [bytes([i]) * 32 for i in range(1, 4)]
+        txins = []
+        for i, privkey in enumerate(privkeys):
+            prevout = TxOutpoint(txid=bytes([i + 1]) * 32, out_idx=i)
+            txin = PartialTxInput(prevout=prevout)
+            txin.script_type = 'p2pkh'
+            txin.pubkeys = [ECPrivkey(privkey).get_public_key_bytes()]
+            txin.num_sig = 1
+            txins.append(txin)
+        txout = PartialTxOutput.from_address_and_value(
+            'yUyx5hJsEwAukTdRy7UihU57rC37Y4y2ZX', 10000)
+        tx = PartialTransaction.from_io(txins, [txout], locktime=1000, version=1)
+
+        txouts = bfh('01') + txout.serialize_to_network()
+        preimages = SighashPreimages(tx)
+        for i in [2, 0, 1, 1]:
+            expected = bfh('01000000' '03')
+            for k, txin in enumerate(tx.inputs()):
+                script = bfh(tx.get_preimage_script(txin)) if k == i else b''
+                expected += tx.serialize_input_bytes(txin, script)
+            expected += txouts + bfh('e8030000' '01000000')
+            self.assertEqual(expected.hex(), tx.serialize_preimage(i))
+            self.assertEqual(expected, preimages.serialize(i))
+            self.assertEqual(sha256d(expected), preimages.sighash(i))
+
+        keypairs = {ECPrivkey(k).get_public_key_hex(): (k, True) for k in privkeys}
+        self.assertEqual(3, tx.sign(keypairs))
+        self.assertTrue(tx.is_complete())
+
+    def test_sign_parallel(self):
+        privkeys = [bytes([i]) * 32 for i in range(1, 4)]
+        pubkeys = [ECPrivkey(k).get_public_key_bytes() for k in privkeys]
+
+        def make_tx():
+            txins = []
+            for i in range(2 * transaction.SIGN_PARALLEL_MIN_JOBS):
+                prevout = TxOutpoint(txid=bytes([i + 1]) * 32, out_idx=i)
+                txin = PartialTxInput(prevout=prevout)
+                if i % 2:
+                    txin.script_type = 'p2pkh'
+                    txin.pubkeys = [pubkeys[i % 3]]
+                    txin.num_sig = 1
+                else:
+                    txin.script_type = 'p2sh'
+                    txin.pubkeys = pubkeys
+                    txin.num_sig = 2
+                txins.append(txin)
+            txout = PartialTxOutput.from_address_and_value(
+                'yUyx5hJsEwAukTdRy7UihU57rC37Y4y2ZX', 10000)
+            return PartialTransaction.from_io(txins, [txout], locktime=1000, version=1)
+
+        keypairs = {pk.hex(): (k, True) for pk, k in zip(pubkeys, privkeys)}
+        tx1 = make_tx()
+        self.assertEqual(48, tx1.sign(keypairs, parallel=False))
+        tx2 = make_tx()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            with mock.patch.object(transaction, '_get_sign_executor',
+                                   return_value=executor):
+                self.assertEqual(48, tx2.sign(keypairs))
+        self.assertTrue(tx2.is_complete())
+        self.assertEqual(tx1.serialize(), tx2.serialize())
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import logging
+from unittest import mock
 
+from electrum_cintamani import constants
 from electrum_cintamani.bitcoin import hash_encode
 from electrum_cintamani.transaction import Transaction
 from electrum_cintamani.util import bfh
-from electrum_cintamani.verifier import SPV, InnerNodeOfSpvProofIsValidTx
+from electrum_cintamani.verifier import SPV, InnerNodeOfSpvProofIsValidTx, MerkleBlock
 
 from . import TestCaseForTestnet
 
@@ -48,3 +52,91 @@ class VerifierTestCase(TestCaseForTestnet):
         f_tx_hash = hash_encode(bfh(VALID_64_BYTE_TX[:64]))
         with self.assertRaises(InnerNodeOfSpvProofIsValidTx):
             SPV.hash_merkle_root(fake_mbranch, f_tx_hash, 6)
+
+    def test_merkle_block_shares_nodes_between_branches(self):
+        block = MerkleBlock({'version': 1, 'prev_block_hash': '00' * 32, 'merkle_root': MERKLE_ROOT,
+                             'timestamp': 0, 'bits': 0x1d00ffff, 'nonce': 0, 'block_height': 1})
+        t_tx_hash = Transaction(VALID_64_BYTE_TX).txid()
+        # a branch that does not lead to the root teaches nothing
+        self.assertNotEqual(MERKLE_ROOT, SPV.hash_merkle_root(MERKLE_BRANCH, t_tx_hash, 2, block=block))
+        self.assertEqual({}, block.nodes)
+        self.assertEqual(MERKLE_ROOT, SPV.hash_merkle_root(MERKLE_BRANCH, t_tx_hash, 3, block=block))
+        self.assertEqual(4, len(block.nodes))
+        # the sibling of t_tx is known already, its branch is not hashed again
+        sibling_branch = [t_tx_hash, MERKLE_BRANCH[1]]
+        self.assertEqual(MERKLE_ROOT, SPV.hash_merkle_root(sibling_branch, MERKLE_BRANCH[0], 2, block=block))
+        self.assertEqual(MERKLE_ROOT, SPV.hash_merkle_root(['00' * 32], MERKLE_BRANCH[0], 2, block=block))
+        # but only at its own position
+        self.assertNotEqual(MERKLE_ROOT, SPV.hash_merkle_root(sibling_branch, MERKLE_BRANCH[0], 0, block=block))
+
+
+class MockTaskGroup:
+
+    def __init__(self):
+        self.coros = []
+
+    async def spawn(self, coro, *args):
+        self.coros.append(coro(*args) if args else coro)
+
+
+class MockBlockchain:
+
+    def __init__(self):
+        self.headers = {}
+
+    def height(self):
+        return 3000
+
+    def read_header(self, height):
+        return self.headers.get(height)
+
+
+class SPVQueueTestCase(TestCaseForTestnet):
+
+    def setUp(self):
+        super().setUp()
+        self.spv = spv = SPV.__new__(SPV)
+        spv.logger = logging.getLogger(__name__)
+        spv.blockchain = MockBlockchain()
+        spv.wallet = mock.Mock()
+        spv.wallet.unverified_tx = {'aa' * 32: 100, 'bb' * 32: 100}
+        spv.network = mock.Mock()
+        spv.network.request_chunk = mock.AsyncMock(side_effect=Exception('no chunk'))
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self._reset())
+        spv.taskgroup = MockTaskGroup()
+
+    async def _reset(self):
+        self.spv._reset()
+
+    def tearDown(self):
+        for coro in self.spv.taskgroup.coros:
+            coro.close()
+        super().tearDown()
+
+    def _request_proofs(self):
+        asyncio.get_event_loop().run_until_complete(self.spv._request_proofs())
+
+    def test_txs_without_header_wait_for_blockchain_updated(self):
+        spv = self.spv
+        for tx_hash, tx_height in spv.wallet.unverified_tx.items():
+            spv._add_to_queue(tx_hash, tx_height)
+        with mock.patch.object(constants.net, 'max_checkpoint', return_value=2016):
+            self._request_proofs()
+            self._request_proofs()
+        # one chunk request, the txs wait for their header
+        self.assertEqual(1, len(spv.taskgroup.coros))
+        self.assertEqual({100: {'aa' * 32, 'bb' * 32}}, spv._pending_header)
+        self.assertEqual([], spv._queue)
+        # a failing chunk request does not lose them
+        with self.assertRaises(Exception):
+            asyncio.get_event_loop().run_until_complete(spv.taskgroup.coros.pop())
+        self.assertEqual({100: {'aa' * 32, 'bb' * 32}}, spv._pending_header)
+        self.assertEqual(set(), spv._requested_chunks)
+        # they are requested once headers get connected
+        spv.blockchain.headers[100] = {'merkle_root': '00' * 32}
+        spv._on_blockchain_updated('blockchain_updated')
+        self.assertEqual({}, spv._pending_header)
+        self._request_proofs()
+        self.assertEqual({'aa' * 32, 'bb' * 32}, spv.requested_merkle)
+        self.assertEqual(2, len(spv.taskgroup.coros))
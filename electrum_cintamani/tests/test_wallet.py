@@ -7,6 +7,7 @@ from decimal import Decimal
 import time
 from io import StringIO
 import asyncio
+from unittest import mock
 
 from electrum_cintamani.storage import WalletStorage
 from electrum_cintamani.wallet_db import FINAL_SEED_VERSION
@@ -85,6 +86,75 @@ class TestWalletStorage(WalletTestCase):
         for key, value in some_dict.items():
             self.assertEqual(d[key], value)
 
+    def _check_journal_write_and_reload(self, password=None):
+        storage = WalletStorage(self.wallet_path)
+        if password:
+            storage.set_password(password)
+        db = WalletDB('', manual_upgrades=True)
+        db.put('a', {'b': 1, 'c': 2})
+        db.write(storage)
+        size = os.path.getsize(self.wallet_path)
+        db.set_journal_enabled(True)
+        db.get('a')['b'] = 3
+        db.get('a').pop('c')
+        db.put('d', ['e'])
+        db.get('d').append('f')
+        db.write(storage)
+        self.assertLess(size, os.path.getsize(self.wallet_path))
+
+        storage = WalletStorage(self.wallet_path)
+        if password:
+            storage.decrypt(password)
+        db2 = WalletDB(storage.read(), manual_upgrades=True)
+        self.assertEqual({'b': 3}, db2.get('a'))
+        self.assertEqual(['e', 'f'], db2.get('d'))
+        # compacting keeps what is appended meanwhile
+        db.put('g', 1)
+        db.write(storage)
+        write_temp_file = storage.write_temp_file
+        def write_temp_file_while_appending(*args, **kwargs):
+            db.put('h', 2)
+            db.write(storage)
+            return write_temp_file(*args, **kwargs)
+        with mock.patch.object(storage, 'write_temp_file', write_temp_file_while_appending):
+            db._compact(storage)
+        # only the record of 'h' is left over as journal
+        self.assertLess(0, storage.get_journal_size())
+        self.assertLess(storage.get_journal_size(), storage.get_snapshot_size())
+        storage = WalletStorage(self.wallet_path)
+        if password:
+            storage.decrypt(password)
+        db3 = WalletDB(storage.read(), manual_upgrades=True)
+        self.assertEqual((1, 2), (db3.get('g'), db3.get('h')))
+
+    def test_journal_write_and_reload(self):
+        self._check_journal_write_and_reload()
+
+    def test_journal_write_and_reload_encrypted(self):
+        self._check_journal_write_and_reload(password='secret')
+
+    def test_journal_records_list_appends(self):
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB('', manual_upgrades=True)
+        db.put('addrs', ['addr%d' % i for i in range(1000)])
+        db.write(storage)
+        db.set_journal_enabled(True)
+        db.get('addrs').append('addr1000')
+        db.get('addrs').extend(['addr1001'])
+        self.assertEqual([['extend', ['addrs'], ['addr1000', 'addr1001']]],
+                         db.journal_records())
+        db.write(storage)
+        self.assertLess(storage.get_journal_size(), 100)
+        # other in-place changes still rewrite the whole list
+        db.get('addrs').remove('addr0')
+        db.get('addrs').append('addr1002')
+        self.assertEqual([[['addrs'], db.get('addrs')]], db.journal_records())
+        db.write(storage)
+
+        storage = WalletStorage(self.wallet_path)
+        db2 = WalletDB(storage.read(), manual_upgrades=True)
+        self.assertEqual(['addr%d' % i for i in range(1, 1003)], db2.get('addrs'))
+
 class FakeExchange(ExchangeBase):
     def __init__(self, rate):
         super().__init__(lambda self: None, lambda self: None)
@@ -1,5 +1,7 @@
 import json
 
+from electrum_cintamani.json_db import StoredDict
+from electrum_cintamani.transaction import Transaction
 from electrum_cintamani.wallet_db import WalletDB, FINAL_SEED_VERSION
 
 from . import SequentialTestCase
@@ -40,3 +42,26 @@ class WalletDBTestCase(SequentialTestCase):
         del d['x1/']
         db = WalletDB(json.dumps(d), manual_upgrades=False)
         assert not db.check_unfinished_multisig()  # x2/, x3/ fails
+
+    def test_lazy_loading(self):
+        raw_tx = ('01000000012a5c9a94fcde98f5581cd00162c60a13936ceb75389ea65bf38633b424eb4031000000006c4930460221'
+                  '00a82bbc57a0136751e5433f41cf000b3f1a99c6744775e76ec764fb78c54ee100022100f9e80b7de89de861dc6fb0'
+                  'c1429d5da72c2b6b2ee2406bc9bfb1beedd729d985012102e61d176da16edd1d258a200ad9759ef63adf8e14cd97f5'
+                  '3227bae35cdb84d2f6ffffffff0140420f00000000001976a914230ac37834073a42146f11ef8414ae929feaafc388'
+                  'ac00000000')
+        txid = Transaction(raw_tx).txid()
+        d = {'wallet_type': 'standard', "seed_version": FINAL_SEED_VERSION,
+             'transactions': {txid: raw_tx},
+             'txo': {txid: {'addr': {'0': [1000000, False]}}}}
+        db = WalletDB(json.dumps(d), manual_upgrades=False)
+        # nested dicts are converted on first access
+        self.assertIn(txid, db.txo._unconverted)
+        self.assertIsInstance(db.txo.get(txid), StoredDict)
+        self.assertEqual(set(), db.txo._unconverted)
+        self.assertEqual({0: (1000000, False)}, db.get_txo_addr(txid, 'addr'))
+        # complete txs are kept serialized
+        self.assertEqual(bytes.fromhex(raw_tx), db.transactions[txid])
+        tx = db.get_transaction(txid)
+        self.assertEqual(raw_tx, tx.serialize())
+        self.assertIs(tx, db.get_transaction(txid))
+        self.assertEqual(d['transactions'], json.loads(db.dump())['transactions'])
@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+import tempfile
+
+from electrum_cintamani.storage import WalletStorage
+from electrum_cintamani.transaction import Transaction, TxOutpoint
+from electrum_cintamani.util import TxMinedInfo, WalletFileException
+from electrum_cintamani.wallet_db import WalletDB
+from electrum_cintamani.wallet_sqlite_db import SqliteWalletDB, convert_to_sqlite
+
+from . import SequentialTestCase
+
+
+RAW_TX = '01000000012a5c9a94fcde98f5581cd00162c60a13936ceb75389ea65bf38633b424eb4031000000006c493046022100a82bbc57a0136751e5433f41cf000b3f1a99c6744775e76ec764fb78c54ee100022100f9e80b7de89de861dc6fb0c1429d5da72c2b6b2ee2406bc9bfb1beedd729d985012102e61d176da16edd1d258a200ad9759ef63adf8e14cd97f53227bae35cdb84d2f6ffffffff0140420f00000000001976a914230ac37834073a42146f11ef8414ae929feaafc388ac00000000'
+
+
+class TestSqliteWalletDB(SequentialTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.user_dir, 'wallet.sqlite')
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.user_dir)
+
+    def _fill_db(self, db):
+        tx = Transaction(RAW_TX)
+        txid = tx.txid()
+        db.add_transaction(txid, tx)
+        db.add_txi_addr(txid, 'addr1', 'aa' * 32 + ':0', 1000)
+        db.add_txo_addr(txid, 'addr2', 0, 1000000, False)
+        db.set_spent_outpoint('aa' * 32, 0, txid)
+        db.add_prevout_by_scripthash('sh', prevout=TxOutpoint.from_str(txid + ':0'), value=1000000)
+        db.add_verified_tx(txid, TxMinedInfo(height=10, timestamp=1, txpos=2, header_hash='bb' * 32))
+        db.add_tx_fee_we_calculated(txid, 226)
+        db._add_ps_denom('cc' * 32 + ':1', ['addr2', 100001, 0])
+        db.put('labels', {txid: 'label'})
+        return txid
+
+    def _check_db(self, db, txid):
+        self.assertEqual(RAW_TX, db.get_transaction(txid).serialize())
+        self.assertEqual([txid], db.list_transactions())
+        self.assertEqual(['addr1'], db.get_txi_addresses(txid))
+        self.assertEqual([('aa' * 32 + ':0', 1000)], list(db.get_txi_addr(txid, 'addr1')))
+        self.assertEqual({0: (1000000, False)}, db.get_txo_addr(txid, 'addr2'))
+        self.assertEqual(txid, db.get_spent_outpoint('aa' * 32, '0'))
+        self.assertEqual(['0'], db.get_spent_outpoints('aa' * 32))
+        self.assertEqual({(TxOutpoint.from_str(txid + ':0'), 1000000)},
+                         db.get_prevouts_by_scripthash('sh'))
+        self.assertEqual(10, db.get_verified_tx(txid).height)
+        self.assertEqual(226, db.get_tx_fee(txid))
+        self.assertEqual(1, db.get_num_ismine_inputs_of_tx(txid))
+        self.assertEqual({'cc' * 32 + ':1': ['addr2', 100001, 0]}, dict(db.get_ps_denoms(min_rounds=0)))
+        self.assertEqual({txid: 'label'}, db.get('labels'))
+
+    def test_convert_and_reopen(self):
+        db = WalletDB('', manual_upgrades=False)
+        txid = self._fill_db(db)
+        convert_to_sqlite(db, self.path)
+        self.assertTrue(WalletStorage(self.path).is_sqlite())
+        sql_db = SqliteWalletDB(self.path)
+        self._check_db(sql_db, txid)
+        # dump gives back what the json db has
+        self.assertEqual(json.loads(db.dump()), json.loads(sql_db.dump()))
+        with self.assertRaises(WalletFileException):
+            convert_to_sqlite(db, self.path)
+
+    def test_write_and_reopen(self):
+        db = SqliteWalletDB(self.path)
+        txid = self._fill_db(db)
+        self._check_db(db, txid)
+        db.write(None)
+        db.remove_txi(txid)
+        db.close()
+        # uncommitted changes are lost
+        db = SqliteWalletDB(self.path)
+        self._check_db(db, txid)
+        db.remove_spent_outpoint('aa' * 32, 0)
+        db.clear_history()
+        db.write(None)
+        db.close()
+        db = SqliteWalletDB(self.path)
+        self.assertEqual([], db.list_transactions())
+        self.assertIsNone(db.get_spent_outpoint('aa' * 32, 0))
+        self.assertEqual({txid: 'label'}, db.get('labels'))
@@ -11,7 +11,7 @@ from electrum_cintamani import Transaction
 from electrum_cintamani import SimpleConfig
 from electrum_cintamani.address_synchronizer import TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_UNCONF_PARENT
 from electrum_cintamani.wallet import sweep, Multisig_Wallet, Standard_Wallet, Imported_Wallet, restore_wallet_from_text, Abstract_Wallet
-from electrum_cintamani.util import bfh, bh2u, create_and_start_event_loop, NotEnoughFunds
+from electrum_cintamani.util import bfh, bh2u, create_and_start_event_loop, NotEnoughFunds, TxMinedInfo
 from electrum_cintamani.transaction import TxOutput, Transaction, PartialTransaction, PartialTxOutput, PartialTxInput, tx_from_any
 from electrum_cintamani.mnemonic import seed_type
 
@@ -1157,6 +1157,12 @@ class TestWalletCaches(TestCaseForTestnet):
     def setUp(self):
         super().setUp()
         self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+
+    def tearDown(self):
+        super().tearDown()
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
 
     @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
     def test_addrs_with_coins_cache(self, mock_save_db):
@@ -1213,3 +1219,175 @@ class TestWalletCaches(TestCaseForTestnet):
 
         w.remove_transaction(txidA)
         assert w._tx_deltas_cache == {}
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_utxo_index(self, mock_save_db):
+        w = restore_wallet_from_text("hint shock chair puzzle shock traffic drastic note dinosaur mention suggest sweet",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        addr = 'ygPu1vV5ZxAgGevfWTKnRPPexsJ9JkfNJ4'
+        txidA, rawA = self.transactions[0]
+        txidB, rawB = self.transactions[1]
+        prevout_str = txidA + ':0'
+
+        def check_index_rebuilds_the_same():
+            utxos, spent_txos = w._utxos, w._spent_txos
+            w._utxos, w._spent_txos = {}, {}
+            w.populate_utxo_index()
+            self.assertEqual({k: v for k, v in utxos.items() if v}, w._utxos)
+            self.assertEqual({k: v for k, v in spent_txos.items() if v}, w._spent_txos)
+
+        # spending tx B is added before funding tx A
+        w.add_transaction(Transaction(rawB), allow_unrelated=True)
+        self.assertEqual([], w.get_utxos())
+        w.add_transaction(Transaction(rawA))
+        self.assertEqual({prevout_str: (83501163, False, txidB)}, w._spent_txos[addr])
+        self.assertEqual({}, w._utxos[addr])
+        self.assertEqual([], w.get_utxos())
+        self.assertEqual(0, sum(w.get_balance()))
+        check_index_rebuilds_the_same()
+
+        w.remove_transaction(txidB)
+        self.assertEqual({prevout_str: (83501163, False)}, w._utxos[addr])
+        self.assertEqual({}, w._spent_txos[addr])
+        self.assertEqual([prevout_str], [c.prevout.to_str() for c in w.get_utxos()])
+        self.assertEqual(83501163, sum(w.get_balance()))
+        check_index_rebuilds_the_same()
+
+        w.add_transaction(Transaction(rawB))
+        self.assertEqual([], w.get_utxos())
+        w.remove_transaction(txidA)
+        self.assertEqual({}, w._utxos[addr])
+        self.assertEqual({}, w._spent_txos[addr])
+        self.assertEqual(0, sum(w.get_balance()))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_synchronize_sequence_gap_limit(self, mock_save_db):
+        w = restore_wallet_from_text("hint shock chair puzzle shock traffic drastic note dinosaur mention suggest sweet",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        old_addrs = set()
+        w.address_is_old = lambda addr: addr in old_addrs
+
+        def check_addrs(num_recv, num_change):
+            recv = w.get_receiving_addresses()
+            change = w.get_change_addresses()
+            self.assertEqual([w.derive_address(0, i) for i in range(num_recv)], recv)
+            self.assertEqual([w.derive_address(1, i) for i in range(num_change)], change)
+            self.assertEqual(w.derive_addresses(0, 0, num_recv), recv)
+            return recv, change
+
+        recv, change = check_addrs(5, 10)
+        old_addrs.add(recv[2])
+        w.synchronize()
+        recv, change = check_addrs(8, 10)
+        old_addrs.update([recv[7], change[0]])
+        w.synchronize()
+        recv, change = check_addrs(13, 11)
+        self.assertEqual(change, w._not_old_change_addresses)
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_derived_pubkeys_cache(self, mock_save_db):
+        w = restore_wallet_from_text("hint shock chair puzzle shock traffic drastic note dinosaur mention suggest sweet",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        ks = w.keystore
+        fingerprint = ks.get_bip32_node_for_xpub().calc_fingerprint_of_this_node().hex()
+        cache = w.db.get('derived_pubkeys')[fingerprint]
+        self.assertEqual(ks.xpub, cache['xpub'])
+        self.assertEqual({str(i): ks.get_pubkey_from_xpub(ks.xpub, (0, i)).hex() for i in range(5)}, cache['0'])
+        self.assertEqual(10, len(cache['1']))
+        # pubkeys out of sequence are not cached
+        self.assertEqual(ks.get_pubkey_from_xpub(ks.xpub, (0, 100)), ks.derive_pubkey(0, 100))
+        self.assertEqual(5, len(cache['0']))
+        # a new address journals only its own pubkey
+        w.db.set_modified(False)
+        w.create_new_address(False)
+        self.assertIn([['derived_pubkeys', fingerprint, '0', '5'],
+                       ks.get_pubkey_from_xpub(ks.xpub, (0, 5)).hex()],
+                      w.db.journal_records())
+        self.assertEqual(1, len([r for r in w.db.journal_records() if 'derived_pubkeys' in r[0]]))
+
+        # reopening derives nothing
+        db = wallet.WalletDB(w.db.dump(), manual_upgrades=False)
+        with mock.patch.object(bip32.BIP32Node, 'derive_child_pubkeys') as derive:
+            w2 = Standard_Wallet(db, None, config=self.config)
+            self.assertEqual(w.get_receiving_addresses(), w2.get_receiving_addresses())
+            self.assertEqual(w.get_public_keys(w.get_receiving_addresses()[3]),
+                             w2.get_public_keys(w.get_receiving_addresses()[3]))
+            derive.assert_not_called()
+
+        # a cache of another xpub is dropped, and filled on open
+        db = wallet.WalletDB(w.db.dump(), manual_upgrades=False)
+        db.get('derived_pubkeys')[fingerprint]['xpub'] = 'xpub'
+        w2 = Standard_Wallet(db, None, config=self.config)
+        self.assertEqual(cache, db.get('derived_pubkeys')[fingerprint])
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_history_index(self, mock_save_db):
+        w = restore_wallet_from_text("hint shock chair puzzle shock traffic drastic note dinosaur mention suggest sweet",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txidA, rawA = self.transactions[0]
+        txidB, rawB = self.transactions[1]
+
+        def get_hist(**kwargs):
+            return [(h.txid, h.delta, h.balance) for h in w.get_history(**kwargs)]
+
+        w.add_transaction(Transaction(rawA))
+        self.assertEqual([(txidA, 83501163, 83501163)], get_hist())
+        w.add_transaction(Transaction(rawB))  # local tx
+        hist = [(txidA, 83501163, 83501163), (txidB, -83501163, 0)]
+        self.assertEqual(hist, get_hist())
+        # pages are counted from the newest tx
+        self.assertEqual(hist[1:], get_hist(limit=1))
+        self.assertEqual(hist[:1], get_hist(offset=1, limit=1))
+        self.assertEqual(hist[:1], get_hist(offset=1))
+        self.assertEqual([], get_hist(offset=2))
+
+        # verification moves tx B before tx A
+        w.add_verified_tx(txidB, TxMinedInfo(height=100, timestamp=1, txpos=0, header_hash='00'*32))
+        w.add_unverified_tx(txidA, 200)
+        self.assertEqual([txidB, txidA], [h.txid for h in w.get_history()])
+        self.assertEqual(100, w.get_history()[0].tx_mined_status.height)
+
+        w.remove_transaction(txidB)
+        self.assertEqual([(txidA, 83501163, 83501163)], get_hist())
+        self.assertEqual({txidA}, set(w._history_keys))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_receive_history_callback_only_processes_changes(self, mock_save_db):
+        w = restore_wallet_from_text("hint shock chair puzzle shock traffic drastic note dinosaur mention suggest sweet",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        addr = 'ygPu1vV5ZxAgGevfWTKnRPPexsJ9JkfNJ4'
+        txidA, rawA = self.transactions[0]
+        txidB, rawB = self.transactions[1]
+        w.db.add_transaction(txidA, Transaction(rawA))  # tx known, but not added yet
+
+        with mock.patch.object(w, 'add_transaction', wraps=w.add_transaction) as add_tx, \
+                mock.patch.object(w, 'add_unverified_tx', wraps=w.add_unverified_tx) as add_unverified:
+            w.receive_history_callback(addr, [(txidA, 100)], {})
+            self.assertEqual(1, add_tx.call_count)
+            self.assertEqual(1, add_unverified.call_count)
+            self.assertEqual(100, w.get_tx_height(txidA).height)
+
+            # same history again, nothing to do
+            w.receive_history_callback(addr, [(txidA, 100)], {})
+            self.assertEqual(1, add_tx.call_count)
+            self.assertEqual(1, add_unverified.call_count)
+
+            # height of tx A changes, it is already related to addr
+            w.add_transaction(Transaction(rawB))  # local tx
+            add_tx.reset_mock()
+            w.receive_history_callback(addr, [(txidA, 101), (txidB, 0)], {})
+            self.assertEqual(0, add_tx.call_count)
+            self.assertEqual(3, add_unverified.call_count)
+            self.assertEqual(101, w.get_tx_height(txidA).height)
+            self.assertEqual(0, w.get_tx_height(txidB).height)
+            self.assertEqual(0, sum(w.get_balance()))
@@ -32,6 +32,10 @@ import traceback
 import sys
 import io
 import base64
+import hashlib
+import os
+import threading
+import concurrent.futures
 from typing import (Sequence, Union, NamedTuple, Tuple, Optional, Iterable,
                     Callable, List, Dict, Set, TYPE_CHECKING)
 from collections import defaultdict
@@ -46,12 +50,12 @@ from .util import profiler, to_bytes, bh2u, bfh, chunks, is_hex_str
 from .bitcoin import (TYPE_ADDRESS, TYPE_SCRIPT, hash_160,
                       hash160_to_p2sh, hash160_to_p2pkh,
                       var_int, TOTAL_COIN_SUPPLY_LIMIT_IN_BTC, COIN,
-                      int_to_hex, push_script, b58_address_to_hash160,
+                      int_to_le_bytes, push_script, b58_address_to_hash160,
                       opcodes, add_number_to_script, base_decode, base_encode,
                       construct_script)
 from .crypto import sha256d
 from .cintamani_tx import (ProTxBase, read_extra_payload, serialize_extra_payload,
-                      to_varbytes, DashTxError)
+                      to_varbytes, to_compact_size, DashTxError, split_tx_header)
 from .logging import get_logger
 
 if TYPE_CHECKING:
@@ -62,6 +66,28 @@ _logger = get_logger(__name__)
 DEBUG_PSBT_PARSING = False
 
 
+# libsecp256k1 is called through ctypes, which releases the GIL, so
+# signatures of large txs are made in worker threads.
+SIGN_PARALLEL_MIN_JOBS = 16  # signatures to make before using the workers
+
+_sign_executor = None  # type: Optional[concurrent.futures.ThreadPoolExecutor]
+_sign_executor_disabled = False
+_sign_executor_lock = threading.Lock()
+
+
+def _get_sign_executor() -> Optional[concurrent.futures.ThreadPoolExecutor]:
+    global _sign_executor, _sign_executor_disabled
+    with _sign_executor_lock:
+        if _sign_executor is None and not _sign_executor_disabled:
+            num_workers = os.cpu_count() or 1
+            if num_workers < 2:
+                _sign_executor_disabled = True
+                return None
+            _sign_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=num_workers, thread_name_prefix='tx_sign')
+        return _sign_executor
+
+
 class SerializationError(Exception):
     """ Thrown when there's a problem deserializing or serializing """
 
@@ -109,10 +135,14 @@ class TxOutput:
     def serialize_to_network(self) -> bytes:
         buf = int.to_bytes(self.value, 8, byteorder="little", signed=False)
         script = self.scriptpubkey
-        buf += bfh(var_int(len(script.hex()) // 2))
+        buf += to_compact_size(len(script))
         buf += script
         return buf
 
+    def serialized_size(self) -> int:
+        script_len = len(self.scriptpubkey)
+        return 8 + len(to_compact_size(script_len)) + script_len
+
     @classmethod
     def from_network_bytes(cls, raw: bytes) -> 'TxOutput':
         vds = BCDataStream()
@@ -183,7 +213,7 @@ class TxOutpoint(NamedTuple):
         return [self.txid.hex(), self.out_idx]
 
     def serialize_to_network(self) -> bytes:
-        return self.txid[::-1] + bfh(int_to_hex(self.out_idx, 4))
+        return self.txid[::-1] + int_to_le_bytes(self.out_idx, 4)
 
     def is_coinbase(self) -> bool:
         return self.txid == bytes(32)
@@ -230,11 +260,26 @@ class TxInput:
         return d
 
 
+# precompiled readers and writers of fixed-width fields
+_INT8 = struct.Struct('<b')
+_UINT8 = struct.Struct('<B')
+_INT16 = struct.Struct('<h')
+_UINT16 = struct.Struct('<H')
+_INT32 = struct.Struct('<i')
+_UINT32 = struct.Struct('<I')
+_INT64 = struct.Struct('<q')
+_UINT64 = struct.Struct('<Q')
+
+
 class BCDataStream(object):
-    """Workalike python implementation of Bitcoin's CDataStream class."""
+    """Workalike python implementation of Bitcoin's CDataStream class.
+
+    The buffer given to write() first is read from without copying it,
+    only the bytes of each field read are copied.
+    """
 
     def __init__(self):
-        self.input = None  # type: Optional[bytearray]
+        self.input = None  # type: Optional[Union[bytes, bytearray, memoryview]]
         self.read_cursor = 0
 
     def clear(self):
@@ -246,12 +291,16 @@ class BCDataStream(object):
         if self.input is None:
             self.input = _bytes
 
-    def write(self, _bytes: Union[bytes, bytearray]):  # Initialize with string of _bytes
-        assert isinstance(_bytes, (bytes, bytearray))
+    def write(self, _bytes: Union[bytes, bytearray, memoryview]):  # Initialize with string of _bytes
+        assert isinstance(_bytes, (bytes, bytearray, memoryview))
         if self.input is None:
-            self.input = bytearray(_bytes)
+            # immutable buffers are kept as they are, for reading
+            self.input = bytearray(_bytes) if isinstance(_bytes, bytearray) else _bytes
         else:
-            self.input += bytearray(_bytes)
+            if not isinstance(self.input, bytearray):
+                self.input = bytearray(self.input)
+            # appends in place, the bytearray grows by more than needed
+            self.input += _bytes
 
     def read_string(self, encoding='ascii'):
         # Strings are encoded depending on length:
@@ -282,9 +331,11 @@ class BCDataStream(object):
         read_begin = self.read_cursor
         read_end = read_begin + length
         if 0 <= read_begin <= read_end <= input_len:
-            result = self.input[read_begin:read_end]  # type: bytearray
-            self.read_cursor += length
-            return bytes(result)
+            self.read_cursor = read_end
+            if isinstance(self.input, bytes):
+                return self.input[read_begin:read_end]
+            with memoryview(self.input) as view:
+                return view[read_begin:read_end].tobytes()
         else:
             raise SerializationError('attempt to read past end of buffer')
 
@@ -301,38 +352,39 @@ class BCDataStream(object):
         return len(self.input) - self.read_cursor
 
     def read_boolean(self) -> bool: return self.read_bytes(1) != b'\x00'
-    def read_char(self): return self._read_num('<b')
-    def read_uchar(self): return self._read_num('<B')
-    def read_int16(self): return self._read_num('<h')
-    def read_uint16(self): return self._read_num('<H')
-    def read_int32(self): return self._read_num('<i')
-    def read_uint32(self): return self._read_num('<I')
-    def read_int64(self): return self._read_num('<q')
-    def read_uint64(self): return self._read_num('<Q')
+    def read_char(self): return self._read_num(_INT8)
+    def read_uchar(self): return self._read_num(_UINT8)
+    def read_int16(self): return self._read_num(_INT16)
+    def read_uint16(self): return self._read_num(_UINT16)
+    def read_int32(self): return self._read_num(_INT32)
+    def read_uint32(self): return self._read_num(_UINT32)
+    def read_int64(self): return self._read_num(_INT64)
+    def read_uint64(self): return self._read_num(_UINT64)
 
     def write_boolean(self, val): return self.write(b'\x01' if val else b'\x00')
-    def write_char(self, val): return self._write_num('<b', val)
-    def write_uchar(self, val): return self._write_num('<B', val)
-    def write_int16(self, val): return self._write_num('<h', val)
-    def write_uint16(self, val): return self._write_num('<H', val)
-    def write_int32(self, val): return self._write_num('<i', val)
-    def write_uint32(self, val): return self._write_num('<I', val)
-    def write_int64(self, val): return self._write_num('<q', val)
-    def write_uint64(self, val): return self._write_num('<Q', val)
+    def write_char(self, val): return self._write_num(_INT8, val)
+    def write_uchar(self, val): return self._write_num(_UINT8, val)
+    def write_int16(self, val): return self._write_num(_INT16, val)
+    def write_uint16(self, val): return self._write_num(_UINT16, val)
+    def write_int32(self, val): return self._write_num(_INT32, val)
+    def write_uint32(self, val): return self._write_num(_UINT32, val)
+    def write_int64(self, val): return self._write_num(_INT64, val)
+    def write_uint64(self, val): return self._write_num(_UINT64, val)
 
     def read_compact_size(self):
         try:
             size = self.input[self.read_cursor]
-            self.read_cursor += 1
-            if size == 253:
-                size = self._read_num('<H')
-            elif size == 254:
-                size = self._read_num('<I')
-            elif size == 255:
-                size = self._read_num('<Q')
-            return size
         except IndexError as e:
             raise SerializationError("attempt to read past end of buffer") from e
+        self.read_cursor += 1
+        if size < 253:
+            return size
+        elif size == 253:
+            return self._read_num(_UINT16)
+        elif size == 254:
+            return self._read_num(_UINT32)
+        else:
+            return self._read_num(_UINT64)
 
     def write_compact_size(self, size):
         if size < 0:
@@ -341,27 +393,30 @@ class BCDataStream(object):
             self.write(bytes([size]))
         elif size < 2**16:
             self.write(b'\xfd')
-            self._write_num('<H', size)
+            self._write_num(_UINT16, size)
         elif size < 2**32:
             self.write(b'\xfe')
-            self._write_num('<I', size)
+            self._write_num(_UINT32, size)
         elif size < 2**64:
             self.write(b'\xff')
-            self._write_num('<Q', size)
+            self._write_num(_UINT64, size)
         else:
             raise Exception(f"size {size} too large for compact_size")
 
-    def _read_num(self, format):
+    def read_struct(self, s: struct.Struct) -> tuple:
+        """Reads the fixed-width fields of s at once."""
         try:
-            (i,) = struct.unpack_from(format, self.input, self.read_cursor)
-            self.read_cursor += struct.calcsize(format)
+            res = s.unpack_from(self.input, self.read_cursor)
         except Exception as e:
             raise SerializationError(e) from e
-        return i
+        self.read_cursor += s.size
+        return res
+
+    def _read_num(self, s: struct.Struct):
+        return self.read_struct(s)[0]
 
-    def _write_num(self, format, num):
-        s = struct.pack(format, num)
-        self.write(s)
+    def _write_num(self, s: struct.Struct, num):
+        self.write(s.pack(num))
 
 
 def script_GetOp(_bytes : bytes):
@@ -495,22 +550,37 @@ def multisig_script(public_keys: Sequence[str], m: int) -> str:
     return construct_script([m, *public_keys, n, opcodes.OP_CHECKMULTISIG])
 
 
+def _push_size(data_len: int) -> int:
+    """Returns the size of a push of data_len bytes (longer than 1 byte)
+    to the script, see bitcoin.push_script.
+    """
+    if data_len < opcodes.OP_PUSHDATA1:
+        return 1 + data_len
+    elif data_len <= 0xff:
+        return 2 + data_len
+    elif data_len <= 0xffff:
+        return 3 + data_len
+    else:
+        return 5 + data_len
+
+
 
 
 class Transaction:
-    _cached_network_ser: Optional[str]
+    _cached_network_ser_bytes: Optional[bytes]
 
     def __str__(self):
         return self.serialize()
 
     def __init__(self, raw):
         if raw is None:
-            self._cached_network_ser = None
+            self._cached_network_ser_bytes = None
         elif isinstance(raw, str):
-            self._cached_network_ser = raw.strip() if raw else None
-            assert is_hex_str(self._cached_network_ser)
-        elif isinstance(raw, (bytes, bytearray)):
-            self._cached_network_ser = bh2u(raw)
+            raw = raw.strip()
+            assert not raw or is_hex_str(raw)
+            self._cached_network_ser_bytes = bytes.fromhex(raw) if raw else None
+        elif isinstance(raw, (bytes, bytearray, memoryview)):
+            self._cached_network_ser_bytes = bytes(raw) if raw else None
         else:
             raise Exception(f"cannot initialize transaction from {raw}")
         self._inputs = None  # type: List[TxInput]
@@ -533,8 +603,22 @@ class Transaction:
         self._locktime = value
         self.invalidate_ser_cache()
 
+    def _read_header(self) -> Optional[Tuple[int, int]]:
+        """Returns (version, tx_type) from the raw tx header,
+        if the tx is not deserialized yet.
+        """
+        if self._inputs is not None or not self._cached_network_ser_bytes:
+            return None
+        header_bytes = self._cached_network_ser_bytes[:4]
+        if len(header_bytes) < 4:
+            return None
+        return split_tx_header(int.from_bytes(header_bytes, byteorder='little'))
+
     @property
     def version(self):
+        header = self._read_header()
+        if header is not None:
+            return header[0]
         self.deserialize()
         return self._version
 
@@ -545,6 +629,9 @@ class Transaction:
 
     @property
     def tx_type(self):
+        header = self._read_header()
+        if header is not None:
+            return header[1]
         self.deserialize()
         return self._tx_type
 
@@ -587,14 +674,13 @@ class Transaction:
         return self._outputs
 
     def deserialize(self) -> None:
-        if self._cached_network_ser is None:
+        if self._cached_network_ser_bytes is None:
             return
         if self._inputs is not None:
             return
 
-        raw_bytes = bfh(self._cached_network_ser)
         vds = BCDataStream()
-        vds.write(raw_bytes)
+        vds.write(self._cached_network_ser_bytes)
         Transaction.read_vds(vds, alone_data=True, tx=self)
 
     @classmethod
@@ -603,14 +689,7 @@ class Transaction:
             tx = Transaction(None)
 
         header = vds.read_uint32()
-        tx._tx_type = header >> 16  # DIP2 tx type
-        if tx._tx_type:
-            tx._version = header & 0x0000ffff
-            if tx._version < 3:
-                tx._tx_type = 0
-                tx._version = header
-        else:
-            tx._version = header
+        tx._version, tx._tx_type = split_tx_header(header)  # DIP2 tx type
 
         n_vin = vds.read_compact_size()
         if n_vin < 1:
@@ -722,52 +801,63 @@ class Transaction:
 
     @classmethod
     def serialize_input(self, txin: TxInput, script: str) -> str:
+        return self.serialize_input_bytes(txin, bfh(script)).hex()
+
+    @classmethod
+    def serialize_input_bytes(self, txin: TxInput, script: bytes) -> bytes:
         # Prev hash and index
-        s = txin.prevout.serialize_to_network().hex()
+        s = txin.prevout.serialize_to_network()
         # Script length, script, sequence
-        s += var_int(len(script)//2)
+        s += to_compact_size(len(script))
         s += script
-        s += int_to_hex(txin.nsequence, 4)
+        s += int_to_le_bytes(txin.nsequence, 4)
         return s
 
     def invalidate_ser_cache(self):
-        self._cached_network_ser = None
+        self._cached_network_ser_bytes = None
         self._cached_txid = None
 
     def serialize(self) -> str:
-        if not self._cached_network_ser:
-            self._cached_network_ser = self.serialize_to_network(estimate_size=False, include_sigs=True)
-        return self._cached_network_ser
+        return self.serialize_as_bytes().hex()
 
     def serialize_as_bytes(self) -> bytes:
-        return bfh(self.serialize())
+        if not self._cached_network_ser_bytes:
+            self._cached_network_ser_bytes = self.serialize_to_network_bytes(estimate_size=False, include_sigs=True)
+        return self._cached_network_ser_bytes
 
     def serialize_to_network(self, *, estimate_size=False, include_sigs=True) -> str:
         """Serialize the transaction as used on the Bitcoin network, into hex.
         `include_sigs` signals whether to include scriptSigs.
         """
+        return self.serialize_to_network_bytes(estimate_size=estimate_size,
+                                               include_sigs=include_sigs).hex()
+
+    def serialize_to_network_bytes(self, *, estimate_size=False, include_sigs=True) -> bytes:
+        """Same as serialize_to_network, as bytes."""
         self.deserialize()
-        nVersion = int_to_hex(self.version, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
         inputs = self.inputs()
         outputs = self.outputs()
 
-        def create_script_sig(txin: TxInput) -> str:
-            if include_sigs:
-                return self.input_script(txin, estimate_size=estimate_size)
-            return ''
-        txins = var_int(len(inputs)) + ''.join(self.serialize_input(txin, create_script_sig(txin))
-                                               for txin in inputs)
-        txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
+        def create_script_sig(txin: TxInput) -> bytes:
+            if not include_sigs:
+                return b''
+            if txin.script_sig is not None:
+                return txin.script_sig
+            return bfh(self.input_script(txin, estimate_size=estimate_size))
 
         if self.tx_type:
-            uVersion = int_to_hex(self.version, 2)
-            uTxType = int_to_hex(self.tx_type, 2)
-            vExtra = bh2u(to_varbytes(serialize_extra_payload(self)))
-            return uVersion + uTxType + txins + txouts + nLocktime + vExtra
+            buf = int_to_le_bytes(self.version, 2) + int_to_le_bytes(self.tx_type, 2)
         else:
-            nVersion = int_to_hex(self.version, 4)
-            return nVersion + txins + txouts + nLocktime
+            buf = int_to_le_bytes(self.version, 4)
+        buf += to_compact_size(len(inputs))
+        buf += b''.join(self.serialize_input_bytes(txin, create_script_sig(txin))
+                        for txin in inputs)
+        buf += to_compact_size(len(outputs))
+        buf += b''.join(o.serialize_to_network() for o in outputs)
+        buf += int_to_le_bytes(self.locktime, 4)
+        if self.tx_type:
+            buf += to_varbytes(serialize_extra_payload(self))
+        return buf
 
     def to_qr_data(self) -> str:
         """Returns tx as data to be put into a QR code. No side-effects."""
@@ -777,15 +867,19 @@ class Transaction:
 
     def txid(self) -> Optional[str]:
         if self._cached_txid is None:
+            if self._cached_network_ser_bytes and self.is_complete():
+                # hash the network serialization as we have it, e.g. as received
+                self._cached_txid = sha256d(self._cached_network_ser_bytes)[::-1].hex()
+                return self._cached_txid
             self.deserialize()
             if not self.is_complete():
                 return None
             try:
-                ser = self.serialize_to_network()
+                ser = self.serialize_to_network_bytes()
             except UnknownTxinType:
                 # we might not know how to construct scriptSig for some scripts
                 return None
-            self._cached_txid = bh2u(sha256d(bfh(ser))[::-1])
+            self._cached_txid = sha256d(ser)[::-1].hex()
         return self._cached_txid
 
     def add_info_from_wallet(self, wallet: 'Abstract_Wallet', **kwargs) -> None:
@@ -804,9 +898,48 @@ class Transaction:
     @classmethod
     def estimated_input_weight(cls, txin):
         '''Return an estimate of serialized input weight in weight units.'''
-        script = cls.input_script(txin, estimate_size=True)
-        input_size = len(cls.serialize_input(txin, script)) // 2
-        return 4 * input_size
+        return 4 * cls.estimated_input_size(txin)
+
+    @classmethod
+    def estimated_input_size(cls, txin: TxInput) -> int:
+        """Return an estimate of serialized input size in bytes."""
+        script_len = cls.estimated_input_script_size(txin)
+        # prevout + varint script len + script + nsequence
+        return 36 + len(to_compact_size(script_len)) + script_len + 4
+
+    @classmethod
+    def estimated_input_script_size(cls, txin: TxInput) -> int:
+        """Return the size of input_script(txin, estimate_size=True)
+        in bytes, computed from the script type without building it.
+        """
+        if txin.script_sig is not None:
+            return len(txin.script_sig)
+        if txin.is_coinbase_input():
+            return 0
+        assert isinstance(txin, PartialTxInput)
+
+        _type = txin.script_type
+        pubkey_size = len(txin.pubkeys[0]) if txin.pubkeys else 33
+        num_pubkeys = max(1, len(txin.pubkeys))
+        # see get_siglist for the size of dummy signatures
+        sig_push_size = _push_size(72)
+        if _type in ('address', 'unknown'):
+            _type = cls.guess_txintype_from_address(txin.address)
+            if _type == 'p2sh':
+                # push of redeem script: OP_0 <20 bytes pubkeyhash>
+                return _push_size(1 + _push_size(20))
+        if pubkey_size < 2:  # not pushed with a plain push opcode
+            return len(cls.input_script(txin, estimate_size=True)) // 2
+        if _type == 'p2pk':
+            return sig_push_size
+        elif _type == 'p2pkh':
+            return sig_push_size + _push_size(pubkey_size)
+        elif _type == 'p2sh' and 1 <= txin.num_sig <= num_pubkeys <= 15:
+            # OP_m <pubkeys> OP_n OP_CHECKMULTISIG
+            redeem_script_size = 3 + num_pubkeys * _push_size(pubkey_size)
+            # OP_0 <sigs> <redeem script>
+            return 1 + txin.num_sig * sig_push_size + _push_size(redeem_script_size)
+        return len(cls.input_script(txin, estimate_size=True)) // 2
 
     @classmethod
     def estimated_output_size_for_address(cls, address: str) -> int:
@@ -833,10 +966,21 @@ class Transaction:
 
     def estimated_total_size(self):
         """Return an estimated total transaction size in bytes."""
-        if not self.is_complete() or self._cached_network_ser is None:
-            return len(self.serialize_to_network(estimate_size=True)) // 2
+        if not self.is_complete() or self._cached_network_ser_bytes is None:
+            self.deserialize()
+            inputs = self.inputs()
+            outputs = self.outputs()
+            # version (and tx_type) + locktime
+            size = 8
+            size += len(to_compact_size(len(inputs)))
+            size += sum(self.estimated_input_size(txin) for txin in inputs)
+            size += len(to_compact_size(len(outputs)))
+            size += sum(o.serialized_size() for o in outputs)
+            if self.tx_type:
+                size += len(to_varbytes(serialize_extra_payload(self)))
+            return size
         else:
-            return len(self._cached_network_ser) // 2  # ASCII hex string
+            return len(self._cached_network_ser_bytes)
 
     def estimated_base_size(self):
         """Return an estimated base transaction size in bytes."""
@@ -893,44 +1037,50 @@ class Transaction:
         return idx
 
 
-def convert_raw_tx_to_hex(raw: Union[str, bytes]) -> str:
+def convert_raw_tx_to_bytes(raw: Union[str, bytes]) -> bytes:
     """Sanitizes tx-describing input (hex/base43/base64) into
-    raw tx hex string."""
+    raw tx bytes."""
     if not raw:
         raise ValueError("empty string")
     raw_unstripped = raw
     raw = raw.strip()
     # try hex
     try:
-        return binascii.unhexlify(raw).hex()
+        return binascii.unhexlify(raw)
     except:
         pass
     # try base43
     try:
-        return base_decode(raw, base=43).hex()
+        return base_decode(raw, base=43)
     except:
         pass
     # try base64
     if raw[0:6] in ('cHNidP', b'cHNidP'):  # base64 psbt
         try:
-            return base64.b64decode(raw).hex()
+            return base64.b64decode(raw)
         except:
             pass
     # raw bytes (do not strip whitespaces in this case)
     if isinstance(raw_unstripped, bytes):
-        return raw_unstripped.hex()
+        return raw_unstripped
     raise ValueError(f"failed to recognize transaction encoding for txt: {raw[:30]}...")
 
 
+def convert_raw_tx_to_hex(raw: Union[str, bytes]) -> str:
+    """Sanitizes tx-describing input (hex/base43/base64) into
+    raw tx hex string."""
+    return convert_raw_tx_to_bytes(raw).hex()
+
+
 def tx_from_any(raw: Union[str, bytes], *,
                 deserialize: bool = True) -> Union['PartialTransaction', 'Transaction']:
     if isinstance(raw, bytearray):
         raw = bytes(raw)
-    raw = convert_raw_tx_to_hex(raw)
+    raw = convert_raw_tx_to_bytes(raw)
     try:
         return PartialTransaction.from_raw_psbt(raw)
     except BadHeaderMagic:
-        if raw[:10] == b'EPTF\xff'.hex():
+        if raw[:5] == b'EPTF\xff':
             raise SerializationError("Partial transactions generated with old Dash Electrum versions "
                                      "(< 4.0) are no longer supported. Please upgrade Dash Electrum on "
                                      "the other machine where this transaction was created.")
@@ -943,7 +1093,7 @@ def tx_from_any(raw: Union[str, bytes], *,
         raise
     except Exception as e:
         raise SerializationError(f"Failed to recognise tx encoding, or to parse transaction. "
-                                 f"raw: {raw[:30]}...") from e
+                                 f"raw: {raw[:30].hex()}...") from e
 
 
 class PSBTGlobalType(IntEnum):
@@ -1181,7 +1331,7 @@ class PartialTxInput(TxInput, PSBTSection):
 
     def serialize_psbt_section_kvs(self, wr):
         if self.utxo:
-            wr(PSBTInputType.NON_WITNESS_UTXO, bfh(self.utxo.serialize_to_network(include_sigs=True)))
+            wr(PSBTInputType.NON_WITNESS_UTXO, self.utxo.serialize_to_network_bytes(include_sigs=True))
         for pk, val in sorted(self.part_sigs.items()):
             wr(PSBTInputType.PARTIAL_SIG, val, pk)
         if self.sighash is not None:
@@ -1249,11 +1399,20 @@ class PartialTxInput(TxInput, PSBTSection):
         #       that are related to the wallet.
         #       The 'fix' would be adding extra logic that matches on templates,
         #       and figures out the script_type from available fields.
+        num_sigs_required = self.num_sigs_required()
+        if num_sigs_required is None:
+            return False
+        return s >= num_sigs_required
+
+    def num_sigs_required(self) -> Optional[int]:
+        """Returns the number of signatures completing the input,
+        or None if it is not known for the script_type.
+        """
         if self.script_type in ('p2pk', 'p2pkh'):
-            return s >= 1
+            return 1
         if self.script_type in ('p2sh', ):
-            return s >= self.num_sig
-        return False
+            return self.num_sig
+        return None
 
     def finalize(self) -> None:
         def clear_fields_when_finalized():
@@ -1367,6 +1526,66 @@ class PartialTxOutput(TxOutput, PSBTSection):
         self._unknown.update(other_txout._unknown)
 
 
+class SighashPreimages:
+    """SIGHASH_ALL preimages of the inputs of a tx, for one signing session.
+
+    The header, the inputs with empty scripts, the outputs and the extra
+    payload are serialized once, only the scriptCode slot of the signed
+    input differs between preimages. Hashing inputs in order continues
+    from the sha256 midstate of the preimage prefix of the previous one.
+    The tx must not be modified while this object is in use.
+    """
+
+    def __init__(self, tx: 'PartialTransaction'):
+        self.tx = tx
+        inputs = tx.inputs()
+        outputs = tx.outputs()
+        if tx.tx_type:
+            header = int_to_le_bytes(tx.version, 2) + int_to_le_bytes(tx.tx_type, 2)
+            extra = to_varbytes(serialize_extra_payload(tx))
+        else:
+            header = int_to_le_bytes(tx.version, 4)
+            extra = b''
+        self._header = header + to_compact_size(len(inputs))
+        self._txins = [tx.serialize_input_bytes(txin, b'') for txin in inputs]
+        self._footer = (to_compact_size(len(outputs))
+                        + b''.join(o.serialize_to_network() for o in outputs)
+                        + int_to_le_bytes(tx.locktime, 4)
+                        + extra)
+        self._prefix_hash = hashlib.sha256(self._header)
+        self._prefix_len = 0  # number of txins hashed into _prefix_hash
+
+    def _get_parts(self, txin_index: int) -> Tuple[bytes, bytes]:
+        txin = self.tx.inputs()[txin_index]
+        sighash = txin.sighash if txin.sighash is not None else SIGHASH_ALL
+        if sighash != SIGHASH_ALL:
+            raise Exception("only SIGHASH_ALL signing is supported!")
+        preimage_script = bfh(self.tx.get_preimage_script(txin))
+        signed_txin = self.tx.serialize_input_bytes(txin, preimage_script)
+        suffix = (b''.join(self._txins[txin_index+1:]) + self._footer
+                  + int_to_le_bytes(sighash, 4))
+        return signed_txin, suffix
+
+    def serialize(self, txin_index: int) -> bytes:
+        signed_txin, suffix = self._get_parts(txin_index)
+        return (self._header + b''.join(self._txins[:txin_index])
+                + signed_txin + suffix)
+
+    def sighash(self, txin_index: int) -> bytes:
+        """Returns sha256d of the preimage of txin_index."""
+        signed_txin, suffix = self._get_parts(txin_index)
+        if txin_index < self._prefix_len:
+            self._prefix_hash = hashlib.sha256(self._header)
+            self._prefix_len = 0
+        for txin_ser in self._txins[self._prefix_len:txin_index]:
+            self._prefix_hash.update(txin_ser)
+        self._prefix_len = txin_index
+        h = self._prefix_hash.copy()
+        h.update(signed_txin)
+        h.update(suffix)
+        return hashlib.sha256(h.digest()).digest()
+
+
 class PartialTransaction(Transaction):
 
     def __init__(self):
@@ -1425,7 +1644,7 @@ class PartialTransaction(Transaction):
                     if tx is not None:
                         raise SerializationError(f"duplicate key: {repr(kt)}")
                     if key: raise SerializationError(f"key for {repr(kt)} must be empty")
-                    unsigned_tx = Transaction(val.hex())
+                    unsigned_tx = Transaction(val)
                     for txin in unsigned_tx.inputs():
                         if txin.script_sig:
                             raise SerializationError(f"PSBT {repr(kt)} must have empty scriptSigs")
@@ -1514,7 +1733,7 @@ class PartialTransaction(Transaction):
         wr = PSBTSection.create_psbt_writer(fd)
         fd.write(b'psbt\xff')
         # global section
-        wr(PSBTGlobalType.UNSIGNED_TX, bfh(self.serialize_to_network(include_sigs=False)))
+        wr(PSBTGlobalType.UNSIGNED_TX, self.serialize_to_network_bytes(include_sigs=False))
         for bip32node, (xfp, path) in sorted(self.xpubs.items()):
             val = pack_bip32_root_fingerprint_and_int_path(xfp, path)
             wr(PSBTGlobalType.XPUB, val, key=bip32node.to_bytes())
@@ -1537,7 +1756,8 @@ class PartialTransaction(Transaction):
         """Pulls in all data from other_tx we don't yet have (e.g. signatures).
         other_tx must be concerning the same unsigned tx.
         """
-        if self.serialize_to_network(include_sigs=False) != other_tx.serialize_to_network(include_sigs=False):
+        if (self.serialize_to_network_bytes(include_sigs=False)
+                != other_tx.serialize_to_network_bytes(include_sigs=False)):
             raise Exception('A Combiner must not combine two different PSBTs.')
         # BIP-174: "The resulting PSBT must contain all of the key-value pairs from each of the PSBTs.
         #           The Combiner must remove any duplicate key-value pairs, in accordance with the specification."
@@ -1614,53 +1834,65 @@ class PartialTransaction(Transaction):
             return None
 
     def serialize_preimage(self, txin_index: int) -> str:
-        nVersion = int_to_hex(self.version, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
-        inputs = self.inputs()
-        outputs = self.outputs()
-        txin = inputs[txin_index]
-        sighash = txin.sighash if txin.sighash is not None else SIGHASH_ALL
-        if sighash != SIGHASH_ALL:
-            raise Exception("only SIGHASH_ALL signing is supported!")
-        nHashType = int_to_hex(sighash, 4)
-        preimage_script = self.get_preimage_script(txin)
-        txins = var_int(len(inputs)) + ''.join(self.serialize_input(txin, preimage_script if txin_index==k else '')
-                                               for k, txin in enumerate(inputs))
-        txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
-        if self.tx_type:
-            uVersion = int_to_hex(self.version, 2)
-            uTxType = int_to_hex(self.tx_type, 2)
-            vExtra = bh2u(to_varbytes(serialize_extra_payload(self)))
-            preimage = uVersion + uTxType + txins + txouts + nLocktime + vExtra + nHashType
-        else:
-            nVersion = int_to_hex(self.version, 4)
-            preimage = nVersion + txins + txouts + nLocktime + nHashType
-        return preimage
+        return SighashPreimages(self).serialize(txin_index).hex()
 
-    def sign(self, keypairs) -> int:
+    def sign(self, keypairs, *, parallel: bool = True) -> int:
+        """Signs the inputs with the keys in keypairs. If parallel is set,
+        many signatures are made concurrently, the result is the same as
+        signing is deterministic (RFC6979).
+        """
         # keypairs:  pubkey_hex -> (secret_bytes, is_compressed)
-        signed_txins_cnt = 0
+        preimages = SighashPreimages(self)
+        jobs = []  # (txin_index, pubkey_hex, pre_hash)
         for i, txin in enumerate(self.inputs()):
-            pubkeys = [pk.hex() for pk in txin.pubkeys]
-            for pubkey in pubkeys:
-                if txin.is_complete():
+            if txin.is_complete():
+                continue
+            num_sigs_required = txin.num_sigs_required()
+            signed_pubkeys = set(txin.part_sigs)
+            pre_hash = None
+            for pubkey in txin.pubkeys:
+                if (num_sigs_required is not None
+                        and len(signed_pubkeys) >= num_sigs_required):
                     break
-                if pubkey not in keypairs:
+                if pubkey.hex() not in keypairs:
                     continue
-                _logger.info(f"adding signature for {pubkey}")
-                sec, compressed = keypairs[pubkey]
-                sig = self.sign_txin(i, sec)
-                self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
-                signed_txins_cnt += 1
+                if pre_hash is None:
+                    txin.validate_data(for_signing=True)
+                    pre_hash = preimages.sighash(i)
+                jobs.append((i, pubkey.hex(), pre_hash))
+                signed_pubkeys.add(pubkey)
+
+        def sign_job(job):
+            txin_index, pubkey, pre_hash = job
+            sec, compressed = keypairs[pubkey]
+            return self._sign_hash(pre_hash, sec)
+
+        executor = None
+        if parallel and len(jobs) >= SIGN_PARALLEL_MIN_JOBS:
+            executor = _get_sign_executor()
+        if executor:
+            sigs = executor.map(sign_job, jobs)
+        else:
+            sigs = map(sign_job, jobs)
+        for (i, pubkey, pre_hash), sig in zip(jobs, sigs):
+            _logger.info(f"adding signature for {pubkey}")
+            self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
 
         _logger.debug(f"is_complete {self.is_complete()}")
         self.invalidate_ser_cache()
-        return signed_txins_cnt
+        return len(jobs)
 
-    def sign_txin(self, txin_index, privkey_bytes) -> str:
+    def sign_txin(self, txin_index, privkey_bytes, *,
+                  preimages: SighashPreimages = None) -> str:
         txin = self.inputs()[txin_index]
         txin.validate_data(for_signing=True)
-        pre_hash = sha256d(bfh(self.serialize_preimage(txin_index)))
+        if preimages is None:
+            preimages = SighashPreimages(self)
+        pre_hash = preimages.sighash(txin_index)
+        return self._sign_hash(pre_hash, privkey_bytes)
+
+    @classmethod
+    def _sign_hash(cls, pre_hash: bytes, privkey_bytes: bytes) -> str:
         privkey = ecc.ECPrivkey(privkey_bytes)
         sig = privkey.sign_transaction(pre_hash)
         sig = bh2u(sig) + '01'  # SIGHASH_ALL
@@ -1712,12 +1944,13 @@ class PartialTransaction(Transaction):
             return
         if len(self.inputs()) != len(signatures):
             raise Exception('expected {} signatures; got {}'.format(len(self.inputs()), len(signatures)))
+        preimages = SighashPreimages(self)
         for i, txin in enumerate(self.inputs()):
             pubkeys = [pk.hex() for pk in txin.pubkeys]
             sig = signatures[i]
             if bfh(sig) in list(txin.part_sigs.values()):
                 continue
-            pre_hash = sha256d(bfh(self.serialize_preimage(i)))
+            pre_hash = preimages.sighash(i)
             sig_string = ecc.sig_string_from_der_sig(bfh(sig[:-2]))
             for recid in range(4):
                 try:
@@ -22,10 +22,13 @@
 # SOFTWARE.
 
 import asyncio
-from typing import Sequence, Optional, TYPE_CHECKING
+import heapq
+from collections import OrderedDict, defaultdict
+from typing import Sequence, Optional, TYPE_CHECKING, List, Tuple, Set, DefaultDict
 
 import aiorpcx
 
+from . import util
 from .util import bh2u, TxMinedInfo, NetworkJobOnDefaultServer
 from .crypto import sha256d
 from .bitcoin import hash_decode, hash_encode
@@ -46,17 +49,46 @@ class MerkleRootMismatch(MerkleVerificationFailure): pass
 class InnerNodeOfSpvProofIsValidTx(MerkleVerificationFailure): pass
 
 
+class MerkleBlock:
+    """A block header of our chain and the nodes of its merkle tree that are
+    known to lead up to its merkle root, shared by the proofs of its txs.
+    """
+
+    def __init__(self, header: dict):
+        self.header = header
+        self.header_hash = hash_header(header)
+        self.merkle_root = header.get('merkle_root')
+        self.nodes = {}  # (level, index) -> node
+
+
 class SPV(NetworkJobOnDefaultServer):
     """ Simple Payment Verification """
 
+    MAX_MERKLE_BLOCKS = 100  # blocks kept in _merkle_blocks
+
     def __init__(self, network: 'Network', wallet: 'AddressSynchronizer'):
         self.wallet = wallet
         NetworkJobOnDefaultServer.__init__(self, network)
+        util.register_callback(self._on_blockchain_updated, ['blockchain_updated'])
 
     def _reset(self):
         super()._reset()
         self.merkle_roots = {}  # txid -> merkle root (once it has been verified)
         self.requested_merkle = set()  # txid set of pending requests
+        # (tx_height, txid) of txs that might need a proof, lowest height first.
+        # Entries are not removed when a tx changes; they are checked when popped.
+        self._queue = []  # type: List[Tuple[int, str]]
+        # txs whose block header we do not have yet, by tx_height.
+        # They go back to the queue when headers get connected.
+        self._pending_header = defaultdict(set)  # type: DefaultDict[int, Set[str]]
+        self._requested_chunks = set()  # type: Set[int]  # chunk indexes
+        self._wakeup = asyncio.Event()
+        self._merkle_blocks = OrderedDict()  # type: OrderedDict[int, MerkleBlock]  # LRU, by height
+
+    async def stop(self, *, full_shutdown: bool = True):
+        if full_shutdown:
+            util.unregister_callback(self._on_blockchain_updated)
+        await super().stop(full_shutdown=full_shutdown)
 
     async def _run_tasks(self, *, taskgroup):
         await super()._run_tasks(taskgroup=taskgroup)
@@ -68,32 +100,78 @@ class SPV(NetworkJobOnDefaultServer):
 
     async def main(self):
         self.blockchain = self.network.blockchain()
+        for tx_hash, tx_height in self.wallet.get_unverified_txs().items():
+            self._add_to_queue(tx_hash, tx_height)
         while True:
+            self._wakeup.clear()
             await self._maybe_undo_verifications()
             await self._request_proofs()
-            await asyncio.sleep(0.1)
+            await self._wakeup.wait()
 
-    async def _request_proofs(self):
-        local_height = self.blockchain.height()
-        unverified = self.wallet.get_unverified_txs()
+    def add_unverified_tx(self, tx_hash: str, tx_height: int) -> None:
+        """Called by the wallet when tx_hash (re)appears at tx_height.
+        Can be called from any thread.
+        """
+        self.network.asyncio_loop.call_soon_threadsafe(self._add_to_queue, tx_hash, tx_height)
+
+    def _add_to_queue(self, tx_hash: str, tx_height: int) -> None:
+        if tx_height <= 0:
+            return
+        heapq.heappush(self._queue, (tx_height, tx_hash))
+        self._wakeup.set()
 
-        for tx_hash, tx_height in unverified.items():
-            # do not request merkle branch if we already requested it
-            if tx_hash in self.requested_merkle or tx_hash in self.merkle_roots:
+    def _on_blockchain_updated(self, event, *args):
+        self._requeue_pending_header()
+        self._wakeup.set()
+
+    def _requeue_pending_header(self, *, only_with_header: bool = False) -> None:
+        for tx_height in list(self._pending_header):
+            if only_with_header and self.blockchain.read_header(tx_height) is None:
                 continue
-            # or before headers are available
-            if tx_height <= 0 or tx_height > local_height:
+            for tx_hash in self._pending_header.pop(tx_height):
+                self._add_to_queue(tx_hash, tx_height)
+
+    async def _request_proofs(self):
+        local_height = self.blockchain.height()
+        # txs above local_height stay queued until we have their headers
+        while self._queue and self._queue[0][0] <= local_height:
+            tx_height = self._queue[0][0]
+            tx_hashes = set()
+            while self._queue and self._queue[0][0] == tx_height:
+                tx_hash = heapq.heappop(self._queue)[1]
+                # do not request merkle branch if we already requested it
+                if tx_hash in self.requested_merkle or tx_hash in self.merkle_roots:
+                    continue
+                # or if the tx is no longer unverified at this height
+                if self.wallet.unverified_tx.get(tx_hash) != tx_height:
+                    continue
+                tx_hashes.add(tx_hash)
+            if not tx_hashes:
                 continue
             # if it's in the checkpoint region, we still might not have the header
             header = self.blockchain.read_header(tx_height)
             if header is None:
-                if tx_height < constants.net.max_checkpoint():
-                    await self.taskgroup.spawn(self.network.request_chunk(tx_height, None, can_return_early=True))
+                self._pending_header[tx_height] |= tx_hashes
+                chunk_index = tx_height // 2016
+                if (tx_height < constants.net.max_checkpoint()
+                        and chunk_index not in self._requested_chunks):
+                    self._requested_chunks.add(chunk_index)
+                    await self.taskgroup.spawn(self._request_chunk, tx_height)
                 continue
             # request now
-            self.logger.info(f'requested merkle {tx_hash}')
-            self.requested_merkle.add(tx_hash)
-            await self.taskgroup.spawn(self._request_and_verify_single_proof, tx_hash, tx_height)
+            for tx_hash in tx_hashes:
+                self.logger.info(f'requested merkle {tx_hash}')
+                self.requested_merkle.add(tx_hash)
+                await self.taskgroup.spawn(self._request_and_verify_single_proof, tx_hash, tx_height)
+
+    async def _request_chunk(self, tx_height):
+        try:
+            await self.network.request_chunk(tx_height, None, can_return_early=True)
+        finally:
+            self._requested_chunks.discard(tx_height // 2016)
+            # the chunk may still be in flight if we returned early,
+            # the rest is requeued on blockchain_updated
+            self._requeue_pending_header(only_with_header=True)
 
     async def _request_and_verify_single_proof(self, tx_hash, tx_height):
         try:
@@ -117,8 +195,9 @@ class SPV(NetworkJobOnDefaultServer):
         # we need to wait if header sync/reorg is still ongoing, hence lock:
         async with self.network.bhi_lock:
             header = self.network.blockchain().read_header(tx_height)
+        block = self._get_merkle_block(tx_height, header) if header else None
         try:
-            verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height)
+            verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height, block=block)
         except MerkleVerificationFailure as e:
             if self.network.config.get("skipmerklecheck"):
                 self.logger.info(f"skipping merkle proof check {tx_hash}")
@@ -129,16 +208,30 @@ class SPV(NetworkJobOnDefaultServer):
         self.merkle_roots[tx_hash] = header.get('merkle_root')
         self.requested_merkle.discard(tx_hash)
         self.logger.info(f"verified {tx_hash}")
-        header_hash = hash_header(header)
+        header_hash = block.header_hash if block else hash_header(header)
         tx_info = TxMinedInfo(height=tx_height,
                               timestamp=header.get('timestamp'),
                               txpos=pos,
                               header_hash=header_hash)
         self.wallet.add_verified_tx(tx_hash, tx_info)
 
+    def _get_merkle_block(self, height: int, header: dict) -> MerkleBlock:
+        block = self._merkle_blocks.pop(height, None)
+        if block is None or block.header != header:
+            block = MerkleBlock(header)
+        self._merkle_blocks[height] = block
+        if len(self._merkle_blocks) > self.MAX_MERKLE_BLOCKS:
+            self._merkle_blocks.popitem(last=False)
+        return block
+
     @classmethod
-    def hash_merkle_root(cls, merkle_branch: Sequence[str], tx_hash: str, leaf_pos_in_tree: int):
-        """Return calculated merkle root."""
+    def hash_merkle_root(cls, merkle_branch: Sequence[str], tx_hash: str, leaf_pos_in_tree: int,
+                         *, block: MerkleBlock=None):
+        """Return calculated merkle root.
+        With block, stop at the first node already known to lead up to
+        block.merkle_root. If the root matches, the nodes of this branch are
+        added to the known ones.
+        """
         try:
             h = hash_decode(tx_hash)
             merkle_branch_bytes = [hash_decode(item) for item in merkle_branch]
@@ -148,16 +241,25 @@ class SPV(NetworkJobOnDefaultServer):
         if leaf_pos_in_tree < 0:
             raise MerkleVerificationFailure('leaf_pos_in_tree must be non-negative')
         index = leaf_pos_in_tree
-        for item in merkle_branch_bytes:
+        branch_nodes = {}
+        for level, item in enumerate(merkle_branch_bytes):
+            if block is not None and block.nodes.get((level, index)) == h:
+                block.nodes.update(branch_nodes)
+                return block.merkle_root
             if len(item) != 32:
                 raise MerkleVerificationFailure('all merkle branch items have to 32 bytes long')
+            branch_nodes[(level, index)] = h
+            branch_nodes[(level, index ^ 1)] = item
             inner_node = (item + h) if (index & 1) else (h + item)
             cls._raise_if_valid_tx(bh2u(inner_node))
             h = sha256d(inner_node)
             index >>= 1
         if index != 0:
             raise MerkleVerificationFailure(f'leaf_pos_in_tree too large for branch')
-        return hash_encode(h)
+        merkle_root = hash_encode(h)
+        if block is not None and merkle_root == block.merkle_root:
+            block.nodes.update(branch_nodes)
+        return merkle_root
 
     @classmethod
     def _raise_if_valid_tx(cls, raw_tx: str):
@@ -180,10 +282,13 @@ class SPV(NetworkJobOnDefaultServer):
             self.blockchain = cur_chain
             above_height = cur_chain.get_height_of_last_common_block_with_chain(old_chain)
             self.logger.info(f"undoing verifications above height {above_height}")
+            for height in [height for height in self._merkle_blocks if height > above_height]:
+                del self._merkle_blocks[height]
             tx_hashes = self.wallet.undo_verifications(self.blockchain, above_height)
             for tx_hash in tx_hashes:
                 self.logger.info(f"redoing {tx_hash}")
                 self.remove_spv_proof_for_tx(tx_hash)
+                self._add_to_queue(tx_hash, self.wallet.unverified_tx.get(tx_hash, 0))
 
     def remove_spv_proof_for_tx(self, tx_hash):
         self.merkle_roots.pop(tx_hash, None)
@@ -195,14 +300,16 @@ class SPV(NetworkJobOnDefaultServer):
 
 def verify_tx_is_in_block(tx_hash: str, merkle_branch: Sequence[str],
                           leaf_pos_in_tree: int, block_header: Optional[dict],
-                          block_height: int) -> None:
-    """Raise MerkleVerificationFailure if verification fails."""
+                          block_height: int, *, block: MerkleBlock=None) -> None:
+    """Raise MerkleVerificationFailure if verification fails.
+    block, if given, must be for block_header; see SPV.hash_merkle_root.
+    """
     if not block_header:
         raise MissingBlockHeader("merkle verification failed for {} (missing header {})"
                                  .format(tx_hash, block_height))
     if len(merkle_branch) > 30:
         raise MerkleVerificationFailure(f"merkle branch too long: {len(merkle_branch)}")
-    calc_merkle_root = SPV.hash_merkle_root(merkle_branch, tx_hash, leaf_pos_in_tree)
+    calc_merkle_root = SPV.hash_merkle_root(merkle_branch, tx_hash, leaf_pos_in_tree, block=block)
     if block_header.get('merkle_root') != calc_merkle_root:
         raise MerkleRootMismatch("merkle verification failed for {} ({} != {})".format(
             tx_hash, block_header.get('merkle_root'), calc_merkle_root))
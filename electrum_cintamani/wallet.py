@@ -257,6 +257,7 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         assert self.config is not None, "config must not be None"
         self.db = db
         self.storage = storage
+        db.set_journal_enabled(config.get('wallet_journal', False))
         # load addresses needs to be called before constructor for sanity checks
         db.load_addresses(self.wallet_type)
         self.keystore = None  # type: Optional[KeyStore]  # will be set by load_keystore
@@ -677,10 +678,12 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         # return last balance
         return balance
 
-    def get_onchain_history(self, *, domain=None, group_ps=False):
+    def get_onchain_history(self, *, domain=None, group_ps=False,
+                            offset=0, limit=None):
         monotonic_timestamp = 0
         for hist_item in self.get_history(domain=domain, config=self.config,
-                                          group_ps=group_ps):
+                                          group_ps=group_ps,
+                                          offset=offset, limit=limit):
             mined_ts = hist_item.tx_mined_status.timestamp
             islock = hist_item.islock
             if not mined_ts and islock:
@@ -2025,7 +2028,8 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
             raise InvalidPassword()
         self.check_password(old_pw)
         if self.storage:
-            if encrypt_storage:
+            # sqlite wallet files are not encrypted, only their keystore
+            if encrypt_storage and not self.storage.is_sqlite():
                 enc_version = self.get_available_storage_encryption_version()
             else:
                 enc_version = StorageEncryptionVersion.PLAINTEXT
@@ -2368,6 +2372,7 @@ class Imported_Wallet(Simple_Wallet):
         self.set_frozen_state_of_addresses([address], False)
         pubkey = self.get_public_key(address)
         self.db.remove_imported_address(address)
+        self.invalidate_balance_cache(address)
         if pubkey:
             # delete key iff no other address uses it (e.g. p2pkh for same key)
             for txin_type in bitcoin.WIF_SCRIPT_TYPES.keys():
@@ -2504,6 +2509,7 @@ class Deterministic_Wallet(Abstract_Wallet):
         self._ephemeral_addr_to_addr_index = {}  # type: Dict[str, Sequence[int]]
         Abstract_Wallet.__init__(self, db, storage, config=config)
         self.gap_limit = db.get('gap_limit', 20)
+        self.load_derived_pubkeys()
         # generate addresses now. note that without libsecp this might block
         # for a few seconds!
         self.synchronize()
@@ -2585,6 +2591,15 @@ class Deterministic_Wallet(Abstract_Wallet):
         pubkeys = self.derive_pubkeys(for_change, n)
         return self.pubkeys_to_address(pubkeys)
 
+    def derive_addresses(self, for_change: int, start: int, count: int) -> List[str]:
+        """Derives addresses (for_change, start)..(for_change, start+count-1)
+        with one batch pubkey derivation per keystore."""
+        for_change = int(for_change)
+        ks_pubkeys = [k.derive_pubkeys(for_change, start, count)
+                      for k in self.get_keystores()]
+        return [self.pubkeys_to_address([pks[i].hex() for pks in ks_pubkeys])
+                for i in range(count)]
+
     def export_private_key_for_path(self, path: Union[Sequence[int], str], password: Optional[str]) -> str:
         if isinstance(path, str):
             path = convert_bip32_path_to_list_of_uint32(path)
@@ -2618,32 +2633,55 @@ class Deterministic_Wallet(Abstract_Wallet):
                                                                                    only_der_suffix=only_der_suffix)
             txinout.bip32_paths[pubkey] = (fp_bytes, der_full)
 
+    def load_derived_pubkeys(self):
+        """Keeps pubkeys derived by the keystores in the db, deriving in
+        bulk those of addresses from before they were kept there."""
+        num_receiving = self.db.num_receiving_addresses()
+        num_change = self.db.num_change_addresses()
+        for k in self.get_keystores():
+            if isinstance(k, keystore.Xpub) and k.xpub:
+                k.set_derived_pubkeys_cache(self.db.get_derived_pubkeys(k.xpub))
+            k.fill_derived_pubkeys(0, num_receiving)
+            k.fill_derived_pubkeys(1, num_change)
+
     def create_new_address(self, for_change: bool = False):
+        return self.create_new_addresses(for_change, 1)[0]
+
+    def create_new_addresses(self, for_change: bool, count: int) -> List[str]:
         assert type(for_change) is bool
         with self.lock:
             n = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
-            address = self.derive_address(int(for_change), n)
-            self.db.add_change_address(address) if for_change else self.db.add_receiving_address(address)
-            self.add_address(address)
+            addresses = self.derive_addresses(int(for_change), n, count)
+            for address in addresses:
+                if for_change:
+                    self.db.add_change_address(address)
+                else:
+                    self.db.add_receiving_address(address)
+                self.add_address(address)
             if for_change:
                 # note: if it's actually "old", it will get filtered later
-                self._not_old_change_addresses.append(address)
-            return address
+                self._not_old_change_addresses.extend(addresses)
+            return addresses
 
     def synchronize_sequence(self, for_change):
         limit = self.gap_limit_for_change if for_change else self.gap_limit
         while True:
             if for_change:
-                addrs = self.get_change_addresses()
+                num_addrs = self.db.num_change_addresses()
             else:
-                addrs = self.get_receiving_addresses()
-            num_addrs = len(addrs)
+                num_addrs = self.db.num_receiving_addresses()
             if num_addrs < limit:
-                self.create_new_address(for_change)
+                self.create_new_addresses(for_change, limit - num_addrs)
                 continue
-            last_few_addresses = addrs[-limit:]
-            if any(map(self.address_is_old, last_few_addresses)):
-                self.create_new_address(for_change)
+            if for_change:
+                last_few_addresses = self.get_change_addresses(slice_start=num_addrs-limit)
+            else:
+                last_few_addresses = self.get_receiving_addresses(slice_start=num_addrs-limit)
+            # distance of the last old address from the end of the sequence
+            for i, addr in enumerate(reversed(last_few_addresses)):
+                if self.address_is_old(addr):
+                    self.create_new_addresses(for_change, limit - i)
+                    break
             else:
                 break
 
@@ -28,17 +28,19 @@ import json
 import copy
 import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from typing import Dict, Optional, List, Tuple, Set, Iterable, NamedTuple, Sequence, TYPE_CHECKING, Union
 import binascii
 
 from . import util, bitcoin
-from .util import profiler, WalletFileException, multisig_type, TxMinedInfo, bfh
+from .util import profiler, WalletFileException, multisig_type, TxMinedInfo, bfh, is_hex_str
 from .invoices import PR_TYPE_ONCHAIN, Invoice, InvoiceExt
 from .keystore import bip44_derivation
+from .bip32 import BIP32Node
 from .transaction import Transaction, TxOutpoint, tx_from_any, PartialTransaction, PartialTxOutput
+from .cintamani_tx import tx_header_to_tx_type
 from .logging import Logger
-from .json_db import StoredDict, JsonDB, locked, modifier
+from .json_db import StoredDict, JsonDB, JsonDBJsonEncoder, locked, modifier
 from .plugin import run_hook, plugin_loaders
 from .paymentrequest import PaymentRequest
 
@@ -54,6 +56,22 @@ FINAL_SEED_VERSION = 41     # electrum >= 2.7 will set this to prevent
                             # old versions from overwriting new format
 
 
+# writes append to the wallet file until the journal grows beyond this
+# or the size of the rest of the file
+JOURNAL_MIN_COMPACT_SIZE = 1_000_000
+
+
+# number of deserialized transactions kept by WalletDB.get_transaction
+TX_CACHE_SIZE = 1000
+
+
+def load_stored_tx(raw: str) -> Union[bytes, Transaction]:
+    """Complete txs of the wallet file are kept as bytes, see get_transaction."""
+    if is_hex_str(raw) and raw[:10].lower() != '70736274ff':  # not a psbt
+        return bytes.fromhex(raw)
+    return tx_from_any(raw, deserialize=False)
+
+
 class TxFeesValue(NamedTuple):
     fee: Optional[int] = None
     is_calculated_by_us: bool = False
@@ -66,6 +84,10 @@ class WalletDB(JsonDB):
         JsonDB.__init__(self, {})
         self._manual_upgrades = manual_upgrades
         self._called_after_upgrade_tasks = False
+        self._journal_enabled = False
+        # complete txs are stored serialized; recently used ones as Transaction
+        self._tx_cache = OrderedDict()  # type: OrderedDict[str, Transaction]
+        self._compaction_thread = None  # type: Optional[threading.Thread]
         self.upgrade_done = False
         if raw:  # loading existing db
             self.load_data(raw)
@@ -78,7 +100,10 @@ class WalletDB(JsonDB):
 
     def load_data(self, s):
         try:
-            self.data = json.loads(s)
+            # the data may be followed by lists of records appended by _write()
+            self.data, *journal = json.loads('[' + s + ']')
+            for records in journal:
+                self.data = self.apply_journal_records(self.data, records)
         except:
             try:
                 d = ast.literal_eval(s)
@@ -950,6 +975,7 @@ class WalletDB(JsonDB):
         if scripthash not in self._prevouts_by_scripthash:
             self._prevouts_by_scripthash[scripthash] = set()
         self._prevouts_by_scripthash[scripthash].add((prevout.to_str(), value))
+        self.add_change(['prevouts_by_scripthash', scripthash])
 
     @modifier
     def remove_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
@@ -957,6 +983,7 @@ class WalletDB(JsonDB):
         assert isinstance(prevout, TxOutpoint)
         assert isinstance(value, int)
         self._prevouts_by_scripthash[scripthash].discard((prevout.to_str(), value))
+        self.add_change(['prevouts_by_scripthash', scripthash])
         if not self._prevouts_by_scripthash[scripthash]:
             self._prevouts_by_scripthash.pop(scripthash)
 
@@ -980,19 +1007,48 @@ class WalletDB(JsonDB):
         # don't allow overwriting complete tx with partial tx
         tx_we_already_have = self.transactions.get(tx_hash, None)
         if tx_we_already_have is None or isinstance(tx_we_already_have, PartialTransaction):
-            self.transactions[tx_hash] = tx
+            if isinstance(tx, PartialTransaction):
+                self.transactions[tx_hash] = tx
+            else:
+                self.transactions[tx_hash] = tx.serialize_as_bytes()
+                self._tx_cache[tx_hash] = tx
+                self._trim_tx_cache()
 
     @modifier
     def remove_transaction(self, tx_hash: str) -> Optional[Transaction]:
         assert isinstance(tx_hash, str)
-        return self.transactions.pop(tx_hash, None)
+        self._tx_cache.pop(tx_hash, None)
+        tx = self.transactions.pop(tx_hash, None)
+        return Transaction(tx) if isinstance(tx, bytes) else tx
 
     @locked
     def get_transaction(self, tx_hash: Optional[str]) -> Optional[Transaction]:
         if tx_hash is None:
             return None
         assert isinstance(tx_hash, str)
-        return self.transactions.get(tx_hash)
+        tx = self._tx_cache.get(tx_hash)
+        if tx is not None:
+            self._tx_cache.move_to_end(tx_hash)
+            return tx
+        tx = self.transactions.get(tx_hash)
+        if isinstance(tx, bytes):
+            tx = self._tx_cache[tx_hash] = Transaction(tx)
+            self._trim_tx_cache()
+        return tx
+
+    @locked
+    def get_tx_type(self, tx_hash: str) -> int:
+        '''Return DIP2 tx_type of stored tx, read from the raw tx header'''
+        tx = self.transactions.get(tx_hash)
+        if tx is None:
+            return 0
+        if isinstance(tx, bytes):
+            return tx_header_to_tx_type(tx[:4])
+        return tx.tx_type
+
+    def _trim_tx_cache(self):
+        while len(self._tx_cache) > TX_CACHE_SIZE:
+            self._tx_cache.popitem(last=False)
 
     @locked
     def list_transactions(self) -> Sequence[str]:
@@ -1550,6 +1606,21 @@ class WalletDB(JsonDB):
         else:
             return self._addr_to_addr_index.get(address)
 
+    @locked
+    def get_derived_pubkeys(self, xpub: str) -> Dict[str, Dict[str, str]]:
+        """Returns the dict keeping pubkeys derived from xpub, as hex
+        by str(n) by str(for_change), see Xpub.set_derived_pubkeys_cache.
+        Entries are keyed by the fingerprint of xpub, and dropped if
+        the xpub stored in them does not match.
+        """
+        fingerprint = BIP32Node.from_xkey(xpub).calc_fingerprint_of_this_node().hex()
+        derived_pubkeys = self.get_dict('derived_pubkeys')
+        d = derived_pubkeys.get(fingerprint)
+        if d is None or d.get('xpub') != xpub:
+            derived_pubkeys[fingerprint] = {'xpub': xpub}
+            d = derived_pubkeys[fingerprint]
+        return d
+
     @modifier
     def add_imported_address(self, addr: str, d: dict) -> None:
         assert isinstance(addr, str)
@@ -1606,7 +1677,11 @@ class WalletDB(JsonDB):
 
     @profiler
     def _load_transactions(self):
+        modified = self.modified()
         self.data = StoredDict(self.data, self, [])
+        # converting is not a change; what happened before could not be
+        # tracked, so needs a full write
+        self.set_modified(modified)
         # references in self.data
         # TODO make all these private
         # txid -> address -> prev_outpoint -> value
@@ -1635,9 +1710,13 @@ class WalletDB(JsonDB):
         self.tx_fees = self.get_dict('tx_fees')                  # type: Dict[str, TxFeesValue]
         # scripthash -> set of (outpoint, value)
         self._prevouts_by_scripthash = self.get_dict('prevouts_by_scripthash')  # type: Dict[str, Set[Tuple[str, int]]]
+        self._remove_unreferenced_txs()
+
+    def _remove_unreferenced_txs(self):
         # remove unreferenced tx
         for tx_hash in list(self.transactions.keys()):
-            if not self.get_txi_addresses(tx_hash) and not self.get_txo_addresses(tx_hash):
+            # (entries of txi/txo are never left empty)
+            if tx_hash not in self.txi and tx_hash not in self.txo:
                 self.logger.info(f"removing unreferenced tx: {tx_hash}")
                 self.transactions.pop(tx_hash)
         # remove unreferenced outpoints
@@ -1654,6 +1733,7 @@ class WalletDB(JsonDB):
         self.txo.clear()
         self.spent_outpoints.clear()
         self.transactions.clear()
+        self._tx_cache.clear()
         self.history.clear()
         self.ps_ks_hist.clear()
         self.verified_tx.clear()
@@ -1682,8 +1762,8 @@ class WalletDB(JsonDB):
 
     def _convert_dict(self, path, key, v):
         if key == 'transactions':
-            # note: for performance, "deserialize=False" so that we will deserialize these on-demand
-            v = dict((k, tx_from_any(x, deserialize=False)) for k, x in v.items())
+            # note: for performance, Transaction objects are made on-demand
+            v = dict((k, load_stored_tx(x)) for k, x in v.items())
         if key == 'invoices':
             v = dict((k, Invoice.from_json(x)) for k, x in v.items())
         if key == 'invoices_ext':
@@ -1718,10 +1798,53 @@ class WalletDB(JsonDB):
             return
         if not self.modified():
             return
+        if self._can_append_to(storage):
+            records = self.journal_records()
+            storage.append(',\n' + json.dumps(records, cls=JsonDBJsonEncoder))
+            self.set_modified(False)
+            journal_size = storage.get_journal_size()
+            if (journal_size > max(storage.get_snapshot_size(), JOURNAL_MIN_COMPACT_SIZE)
+                    and not self._compaction_thread):
+                self._compaction_thread = threading.Thread(
+                    target=self._compact, args=(storage,), name='wallet_db_compaction')
+                self._compaction_thread.start()
+            return
         json_str = self.dump(human_readable=not storage.is_encrypted())
         storage.write(json_str)
         self.set_modified(False)
 
+    def set_journal_enabled(self, enabled: bool) -> None:
+        """With the journal, writes only append the changes to the file;
+        it gets rewritten in full in the background once that grows large.
+        """
+        self._journal_enabled = enabled
+
+    def _can_append_to(self, storage: 'WalletStorage') -> bool:
+        return (self._journal_enabled
+                and not self._needs_full_write
+                and isinstance(self.data, StoredDict)
+                and storage.file_exists()
+                and storage.is_past_initial_decryption())
+
+    def _compact(self, storage: 'WalletStorage'):
+        # rewrite the file, without holding the lock while encrypting and writing
+        try:
+            with self.lock:
+                json_str = self.dump(human_readable=not storage.is_encrypted())
+                journal_mark = storage.get_journal_mark()
+            temp_path, size = storage.write_temp_file(json_str, suffix='compact')
+            with self.lock:
+                storage.replace_with_temp_file(temp_path, size, journal_mark=journal_mark)
+        except Exception as e:
+            self.logger.exception(f'wallet file compaction failed: {repr(e)}')
+        finally:
+            self._compaction_thread = None
+
+    def join_compaction(self):
+        t = self._compaction_thread
+        if t:
+            t.join()
+
     def is_ready_to_be_used_by_wallet(self):
         return not self.requires_upgrade() and self._called_after_upgrade_tasks
 
@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+#
+# Electrum - lightweight Bitcoin client
+# Copyright (C) 2015 Thomas Voegtlin
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import itertools
+import json
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Optional, List, Tuple, Set, Iterable, Sequence, Union, Callable, Any
+
+from .util import profiler, WalletFileException
+from .transaction import TxOutpoint
+from .json_db import JsonDBJsonEncoder, locked, modifier
+from .wallet_db import WalletDB, TxFeesValue, FINAL_SEED_VERSION, load_stored_tx
+
+
+# dicts of WalletDB kept as tables of (key, json value), with how to
+# decode the values
+KV_TABLES = {
+    'transactions': load_stored_tx,
+    'addr_history': None,
+    'ps_ks_addr_hist': None,
+    'verified_tx3': None,
+    'tx_fees': lambda x: TxFeesValue(*x),
+    'islocks': None,
+    'ps_txs': None,
+    'ps_txs_removed': None,
+    'ps_reserved': None,
+    'ps_collaterals': None,
+    'ps_spending_collaterals': None,
+    'ps_denoms': None,
+    'ps_spending_denoms': None,
+    'ps_spent_denoms': None,
+    'ps_others': None,
+    'ps_spent_others': None,
+    'ps_spent_collaterals': None,
+    'ps_origin_addrs': None,
+}
+
+# nested dicts of WalletDB kept as tables of their own; SqliteWalletDB
+# overrides their accessors
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS txi ('
+    'tx_hash TEXT, address TEXT, prevout TEXT, value INTEGER, '
+    'PRIMARY KEY (tx_hash, address, prevout))',
+    'CREATE INDEX IF NOT EXISTS txi_address ON txi (address)',
+    'CREATE TABLE IF NOT EXISTS txo ('
+    'tx_hash TEXT, address TEXT, n INTEGER, value INTEGER, is_coinbase INTEGER, '
+    'PRIMARY KEY (tx_hash, address, n))',
+    'CREATE INDEX IF NOT EXISTS txo_address ON txo (address)',
+    'CREATE TABLE IF NOT EXISTS spent_outpoints ('
+    'prevout_hash TEXT, prevout_n TEXT, tx_hash TEXT, '
+    'PRIMARY KEY (prevout_hash, prevout_n))',
+    'CREATE INDEX IF NOT EXISTS spent_outpoints_tx_hash ON spent_outpoints (tx_hash)',
+    'CREATE TABLE IF NOT EXISTS prevouts_by_scripthash ('
+    'scripthash TEXT, prevout TEXT, value INTEGER, '
+    'PRIMARY KEY (scripthash, prevout, value))',
+] + [
+    f'CREATE TABLE IF NOT EXISTS "{name}" (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+    for name in KV_TABLES
+]
+
+NESTED_TABLES = ['txi', 'txo', 'spent_outpoints', 'prevouts_by_scripthash']
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # used from several threads, always under the lock of the db
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for sql in SCHEMA:
+        conn.execute(sql)
+    return conn
+
+
+class SqlDict(MutableMapping):
+    """A dict of WalletDB kept in a table of (key, json value).
+    Values are read from the table on access, so changing them
+    in place has no effect; set them again instead.
+    """
+
+    def __init__(self, db: 'SqliteWalletDB', name: str,
+                 decode: Optional[Callable[[Any], Any]] = None):
+        self.db = db
+        self.lock = db.lock
+        self.name = name
+        self._decode = decode
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self.db.conn.execute(sql.format(table=f'"{self.name}"'), params)
+
+    def _decode_value(self, value: str):
+        v = json.loads(value)
+        return self._decode(v) if self._decode else v
+
+    def convert_key(self, key):
+        return str(int(key)) if isinstance(key, int) else key
+
+    @locked
+    def __getitem__(self, key):
+        row = self._execute('SELECT value FROM {table} WHERE key=?',
+                            (self.convert_key(key),)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._decode_value(row[0])
+
+    @locked
+    def __setitem__(self, key, v):
+        self._execute('INSERT OR REPLACE INTO {table} (key, value) VALUES (?, ?)',
+                      (self.convert_key(key), json.dumps(v, cls=JsonDBJsonEncoder)))
+        self.db.add_change([self.name])
+
+    @locked
+    def __delitem__(self, key):
+        cursor = self._execute('DELETE FROM {table} WHERE key=?', (self.convert_key(key),))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+        self.db.add_change([self.name])
+
+    @locked
+    def __contains__(self, key):
+        return self._execute('SELECT 1 FROM {table} WHERE key=?',
+                             (self.convert_key(key),)).fetchone() is not None
+
+    @locked
+    def __len__(self):
+        return self._execute('SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    @locked
+    def __iter__(self):
+        return iter(self.keys())
+
+    @locked
+    def keys(self) -> List[str]:
+        return [row[0] for row in self._execute('SELECT key FROM {table}')]
+
+    @locked
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(k, self._decode_value(v))
+                for k, v in self._execute('SELECT key, value FROM {table}')]
+
+    @locked
+    def values(self) -> List[Any]:
+        return [self._decode_value(v) for (v,) in self._execute('SELECT value FROM {table}')]
+
+    @locked
+    def clear(self):
+        self._execute('DELETE FROM {table}')
+        self.db.add_change([self.name])
+
+
+class SqlTable:
+    """Stands in for the nested dicts of WalletDB kept in tables."""
+
+    def __init__(self, db: 'SqliteWalletDB', name: str):
+        self.db = db
+        self.name = name
+
+    def clear(self):
+        with self.db.lock:
+            self.db.conn.execute(f'DELETE FROM {self.name}')
+            self.db.add_change([self.name])
+
+
+class SqliteWalletDB(WalletDB):
+    """WalletDB keeping transactions, history and the PrivateSend data in
+    tables of a SQLite file, so they are not loaded into memory at once.
+    The rest is kept in memory as with WalletDB, and stored as json per
+    top-level key. Changes are committed by write().
+
+    Files are only created from wallets at the final seed version, see
+    convert_to_sqlite(); upgrading them is not supported.
+    """
+
+    def __init__(self, path: str, *, manual_upgrades: bool = False):
+        self.path = path
+        self.conn = _connect(path)
+        data = {key: json.loads(value)
+                for key, value in self.conn.execute('SELECT key, value FROM meta')}
+        if data and data.get('seed_version') != FINAL_SEED_VERSION:
+            raise WalletFileException(f'Cannot open sqlite wallet file '
+                                      f'with seed version {data.get("seed_version")}')
+        WalletDB.__init__(self, json.dumps(data) if data else '',
+                          manual_upgrades=manual_upgrades)
+
+    def get_dict(self, name) -> dict:
+        if name in KV_TABLES:
+            return SqlDict(self, name, KV_TABLES[name])
+        if name in NESTED_TABLES:
+            return SqlTable(self, name)
+        return WalletDB.get_dict(self, name)
+
+    def _remove_unreferenced_txs(self):
+        with self.lock:
+            cursor = self.conn.execute(
+                'DELETE FROM transactions WHERE '
+                'key NOT IN (SELECT tx_hash FROM txi) AND key NOT IN (SELECT tx_hash FROM txo)')
+            if cursor.rowcount:
+                self.logger.info(f"removed {cursor.rowcount} unreferenced txs")
+            cursor = self.conn.execute(
+                'DELETE FROM spent_outpoints WHERE tx_hash NOT IN (SELECT key FROM transactions)')
+            if cursor.rowcount:
+                self.logger.info(f"removed {cursor.rowcount} unreferenced spent outpoints")
+
+    @locked
+    def get_txi_addresses(self, tx_hash: str) -> List[str]:
+        assert isinstance(tx_hash, str)
+        return [row[0] for row in self.conn.execute(
+            'SELECT DISTINCT address FROM txi WHERE tx_hash=?', (tx_hash,))]
+
+    @locked
+    def get_txo_addresses(self, tx_hash: str) -> List[str]:
+        assert isinstance(tx_hash, str)
+        return [row[0] for row in self.conn.execute(
+            'SELECT DISTINCT address FROM txo WHERE tx_hash=?', (tx_hash,))]
+
+    @locked
+    def get_txi_addr(self, tx_hash: str, address: str) -> Iterable[Tuple[str, int]]:
+        assert isinstance(tx_hash, str)
+        assert isinstance(address, str)
+        return self.conn.execute('SELECT prevout, value FROM txi WHERE tx_hash=? AND address=?',
+                                 (tx_hash, address)).fetchall()
+
+    @locked
+    def get_txo_addr(self, tx_hash: str, address: str) -> Dict[int, Tuple[int, bool]]:
+        assert isinstance(tx_hash, str)
+        assert isinstance(address, str)
+        rows = self.conn.execute('SELECT n, value, is_coinbase FROM txo WHERE tx_hash=? AND address=?',
+                                 (tx_hash, address))
+        return {n: (v, bool(cb)) for n, v, cb in rows}
+
+    @modifier
+    def add_txi_addr(self, tx_hash: str, addr: str, ser: str, v: int) -> None:
+        assert isinstance(tx_hash, str)
+        assert isinstance(addr, str)
+        assert isinstance(ser, str)
+        assert isinstance(v, int)
+        self.conn.execute('INSERT OR REPLACE INTO txi VALUES (?, ?, ?, ?)', (tx_hash, addr, ser, v))
+
+    @modifier
+    def add_txo_addr(self, tx_hash: str, addr: str, n: Union[int, str], v: int, is_coinbase: bool) -> None:
+        n = int(n)
+        assert isinstance(tx_hash, str)
+        assert isinstance(addr, str)
+        assert isinstance(v, int)
+        assert isinstance(is_coinbase, bool)
+        self.conn.execute('INSERT OR REPLACE INTO txo VALUES (?, ?, ?, ?, ?)',
+                          (tx_hash, addr, n, v, is_coinbase))
+
+    @locked
+    def list_txi(self) -> Sequence[str]:
+        return [row[0] for row in self.conn.execute('SELECT DISTINCT tx_hash FROM txi')]
+
+    @locked
+    def list_txo(self) -> Sequence[str]:
+        return [row[0] for row in self.conn.execute('SELECT DISTINCT tx_hash FROM txo')]
+
+    @modifier
+    def remove_txi(self, tx_hash: str) -> None:
+        assert isinstance(tx_hash, str)
+        self.conn.execute('DELETE FROM txi WHERE tx_hash=?', (tx_hash,))
+
+    @modifier
+    def remove_txo(self, tx_hash: str) -> None:
+        assert isinstance(tx_hash, str)
+        self.conn.execute('DELETE FROM txo WHERE tx_hash=?', (tx_hash,))
+
+    @locked
+    def list_spent_outpoints(self) -> Sequence[Tuple[str, str]]:
+        return self.conn.execute('SELECT prevout_hash, prevout_n FROM spent_outpoints').fetchall()
+
+    @locked
+    def get_spent_outpoints(self, prevout_hash: str) -> Sequence[str]:
+        assert isinstance(prevout_hash, str)
+        return [row[0] for row in self.conn.execute(
+            'SELECT prevout_n FROM spent_outpoints WHERE prevout_hash=?', (prevout_hash,))]
+
+    @locked
+    def get_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> Optional[str]:
+        assert isinstance(prevout_hash, str)
+        row = self.conn.execute(
+            'SELECT tx_hash FROM spent_outpoints WHERE prevout_hash=? AND prevout_n=?',
+            (prevout_hash, str(prevout_n))).fetchone()
+        return row[0] if row else None
+
+    @modifier
+    def remove_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> None:
+        assert isinstance(prevout_hash, str)
+        self.conn.execute('DELETE FROM spent_outpoints WHERE prevout_hash=? AND prevout_n=?',
+                          (prevout_hash, str(prevout_n)))
+
+    @modifier
+    def set_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str], tx_hash: str) -> None:
+        assert isinstance(prevout_hash, str)
+        assert isinstance(tx_hash, str)
+        self.conn.execute('INSERT OR REPLACE INTO spent_outpoints VALUES (?, ?, ?)',
+                          (prevout_hash, str(prevout_n), tx_hash))
+
+    @modifier
+    def add_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
+        assert isinstance(scripthash, str)
+        assert isinstance(prevout, TxOutpoint)
+        assert isinstance(value, int)
+        self.conn.execute('INSERT OR IGNORE INTO prevouts_by_scripthash VALUES (?, ?, ?)',
+                          (scripthash, prevout.to_str(), value))
+
+    @modifier
+    def remove_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
+        assert isinstance(scripthash, str)
+        assert isinstance(prevout, TxOutpoint)
+        assert isinstance(value, int)
+        self.conn.execute('DELETE FROM prevouts_by_scripthash WHERE scripthash=? AND prevout=? AND value=?',
+                          (scripthash, prevout.to_str(), value))
+
+    @locked
+    def get_prevouts_by_scripthash(self, scripthash: str) -> Set[Tuple[TxOutpoint, int]]:
+        assert isinstance(scripthash, str)
+        rows = self.conn.execute('SELECT prevout, value FROM prevouts_by_scripthash WHERE scripthash=?',
+                                 (scripthash,))
+        return {(TxOutpoint.from_str(prevout), value) for prevout, value in rows}
+
+    @locked
+    def get_num_ismine_inputs_of_tx(self, txid: str) -> int:
+        assert isinstance(txid, str)
+        return self.conn.execute('SELECT COUNT(*) FROM txi WHERE tx_hash=?', (txid,)).fetchone()[0]
+
+    @locked
+    def dump(self, *, human_readable: bool = True) -> str:
+        """Serializes the DB, tables included, as WalletDB would."""
+        data = dict(self.data)
+        data.update(self._dump_tables())
+        return json.dumps(
+            data,
+            indent=4 if human_readable else None,
+            sort_keys=bool(human_readable),
+            cls=JsonDBJsonEncoder,
+        )
+
+    def _dump_tables(self) -> dict:
+        tables = {}
+        for name in KV_TABLES:
+            tables[name] = {key: json.loads(value)
+                            for key, value in self.conn.execute(f'SELECT key, value FROM "{name}"')}
+        txi = tables['txi'] = {}
+        for tx_hash, addr, prevout, value in self.conn.execute('SELECT * FROM txi'):
+            txi.setdefault(tx_hash, {}).setdefault(addr, {})[prevout] = value
+        txo = tables['txo'] = {}
+        for tx_hash, addr, n, value, is_coinbase in self.conn.execute('SELECT * FROM txo'):
+            txo.setdefault(tx_hash, {}).setdefault(addr, {})[str(n)] = (value, bool(is_coinbase))
+        spent_outpoints = tables['spent_outpoints'] = {}
+        for prevout_hash, prevout_n, tx_hash in self.conn.execute('SELECT * FROM spent_outpoints'):
+            spent_outpoints.setdefault(prevout_hash, {})[prevout_n] = tx_hash
+        prevouts = tables['prevouts_by_scripthash'] = {}
+        for scripthash, prevout, value in self.conn.execute('SELECT * FROM prevouts_by_scripthash'):
+            prevouts.setdefault(scripthash, []).append((prevout, value))
+        return tables
+
+    @profiler
+    def _write(self, storage=None):
+        # the changes to the tables were made already; write the changed
+        # top-level keys of self.data and commit
+        if threading.current_thread().daemon:
+            self.logger.warning('daemon thread cannot write db')
+            return
+        if not self.modified():
+            return
+        if self._needs_full_write or () in self._changes:
+            self.conn.execute('DELETE FROM meta')
+            keys = set(self.data.keys())
+        else:
+            keys = {path[0] for path in itertools.chain(self._changes, self._appends)}
+        for key in keys:
+            if key in KV_TABLES or key in NESTED_TABLES:
+                continue
+            if key in self.data:
+                self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                  (key, json.dumps(self.data[key], cls=JsonDBJsonEncoder)))
+            else:
+                self.conn.execute('DELETE FROM meta WHERE key=?', (key,))
+        self.conn.commit()
+        self.set_modified(False)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def convert_to_sqlite(db: WalletDB, path: str) -> None:
+    """Writes the data of db to a new sqlite wallet file at path."""
+    if os.path.exists(path):
+        raise WalletFileException(f'File already exists: {path}')
+    if not db.is_ready_to_be_used_by_wallet():
+        raise WalletFileException('Wallet needs to be upgraded first')
+    data = json.loads(db.dump(human_readable=False))
+    conn = _connect(path)
+    try:
+        for name in KV_TABLES:
+            conn.executemany(f'INSERT INTO "{name}" VALUES (?, ?)',
+                             ((k, json.dumps(v)) for k, v in data.pop(name, {}).items()))
+        conn.executemany('INSERT INTO txi VALUES (?, ?, ?, ?)',
+                         ((tx_hash, addr, prevout, value)
+                          for tx_hash, d in data.pop('txi', {}).items()
+                          for addr, d2 in d.items()
+                          for prevout, value in d2.items()))
+        conn.executemany('INSERT INTO txo VALUES (?, ?, ?, ?, ?)',
+                         ((tx_hash, addr, int(n), value, is_coinbase)
+                          for tx_hash, d in data.pop('txo', {}).items()
+                          for addr, d2 in d.items()
+                          for n, (value, is_coinbase) in d2.items()))
+        conn.executemany('INSERT INTO spent_outpoints VALUES (?, ?, ?)',
+                         ((prevout_hash, prevout_n, tx_hash)
+                          for prevout_hash, d in data.pop('spent_outpoints', {}).items()
+                          for prevout_n, tx_hash in d.items()))
+        conn.executemany('INSERT OR IGNORE INTO prevouts_by_scripthash VALUES (?, ?, ?)',
+                         ((scripthash, prevout, value)
+                          for scripthash, prevouts in data.pop('prevouts_by_scripthash', {}).items()
+                          for prevout, value in prevouts))
+        conn.executemany('INSERT INTO meta VALUES (?, ?)',
+                         ((k, json.dumps(v)) for k, v in data.items()))
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.unlink(path)
+        raise
+    conn.close()